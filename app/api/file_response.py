@@ -0,0 +1,85 @@
+import os
+import re
+from typing import Optional, Tuple
+from urllib.parse import quote
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_range(header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Разбор заголовка Range для одного диапазона
+
+    Возвращает (start, end) включительно, None если заголовок
+    не поддерживается (тогда отдается весь файл). Для недопустимого
+    диапазона бросает ValueError.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+
+    if not start:
+        # bytes=-N: последние N байт
+        length = int(end)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(file_size - length, 0), file_size - 1
+
+    start = int(start)
+    end = int(end) if end else file_size - 1
+    if start >= file_size or start > end:
+        raise ValueError("range not satisfiable")
+
+    return start, min(end, file_size - 1)
+
+
+def range_file_response(
+        request: Request,
+        path: str,
+        media_type: Optional[str] = None,
+        filename: Optional[str] = None
+) -> Response:
+    """Отдача файла с поддержкой HTTP Range (докачка, перемотка PDF)"""
+    file_size = os.path.getsize(path)
+    headers = {"Accept-Ranges": "bytes"}
+
+    range_header = request.headers.get("range")
+    if not range_header:
+        return FileResponse(path=path, filename=filename, media_type=media_type, headers=headers)
+
+    try:
+        byte_range = parse_range(range_header, file_size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{file_size}"})
+
+    if byte_range is None:
+        return FileResponse(path=path, filename=filename, media_type=media_type, headers=headers)
+
+    start, end = byte_range
+
+    def iter_file():
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    headers.update({
+        "Content-Range": f"bytes {start}-{end}/{file_size}",
+        "Content-Length": str(end - start + 1)
+    })
+    if filename:
+        headers["Content-Disposition"] = f"attachment; filename*=utf-8''{quote(filename)}"
+
+    return StreamingResponse(iter_file(), status_code=206, media_type=media_type, headers=headers)
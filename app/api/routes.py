@@ -1,20 +1,41 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request, Query, Header
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
 from app.database import get_db
-from app.models.models import MailDocument, ProcessingLog
-from app.schemas.schemas import MailDocument as MailDocumentSchema, ProcessingLogResponse
-from app.tasks.celery_tasks import check_fns_mails, celery_app
+from app.models.models import MailDocument, MailAttachment, ProcessingLog, QuarantinedDocument, SBISAccount
+from app.schemas.schemas import (
+    MailDocument as MailDocumentSchema, MailAttachment as MailAttachmentSchema,
+    ProcessingLogResponse, DocumentSearchResult, QuarantinedDocument as QuarantinedDocumentSchema,
+    SBISAccount as SBISAccountSchema, SBISAccountCreate, SBISAccountUpdate, SBISEventBatch
+)
+from app.tasks.celery_tasks import check_fns_mails, fetch_event_documents_task
 from app.services.mock_service import MockSBISService
 from app.services.fns_filter import FNSFilterService, fns_service
 from app.utils.logger import logger
+from app.utils.crypto import SecretKeyMissing, encrypt_secret
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
 import asyncio
 from app.config import settings
 from app.services.json_report_service import json_report_service
-from fastapi.responses import FileResponse
+from app.services.document_search import apply_document_filters, document_search_service
+from fastapi.responses import FileResponse, StreamingResponse
+from app.api.file_response import range_file_response
+from app.services.attachment_store import attachment_store
+from app.services.sync_lock import enqueue_single_flight
+from app.services.poll_scheduler import poll_scheduler
+from app.services.accounts import account_service
+from app.services.event_ingest import event_ingest_service
+from app.services.event_bus import event_broadcaster
+from app.services.health import health_service
+from app.services.run_history import run_history_service
+from app.utils.profiling import list_profiles, profile_path
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+import hmac
+import json
+import mimetypes
 import os
 
 templates = Jinja2Templates(directory="templates")
@@ -62,6 +83,7 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "documents": "/api/v1/documents/",
+            "search": "/api/v1/documents/search?q=",
             "check_now": "/api/v1/check-now",
             "status": "/api/v1/status",
             "dashboard": "/api/v1/dashboard",
@@ -77,6 +99,10 @@ def get_documents(
         limit: int = 100,
         fns_only: bool = False,
         days_back: Optional[int] = None,
+        knd_code: Optional[str] = None,
+        tax_office_code: Optional[str] = None,
+        deadline_before: Optional[date] = None,
+        account_id: Optional[int] = None,
         db: Session = Depends(get_db)
 ):
     """
@@ -84,20 +110,17 @@ def get_documents(
 
     - **fns_only**: только документы от ФНС
     - **days_back**: документы за последние N дней
+    - **knd_code**: код формы по КНД (из XML вложения)
+    - **tax_office_code**: код налогового органа
+    - **deadline_before**: срок ответа не позднее даты
+    - **account_id**: учетная запись СБИС (организация)
     - **skip/limit**: пагинация
     """
-    query = db.query(MailDocument)
-
-    # Фильтр по ФНС
-    if fns_only is True:
-        query = query.filter(MailDocument.is_from_fns == True)
-    elif fns_only is False:
-        query = query.filter(MailDocument.is_from_fns == False)
-
-    # Фильтр по дате
-    if days_back:
-        start_date = datetime.now() - timedelta(days=days_back)
-        query = query.filter(MailDocument.date >= start_date)
+    query = apply_document_filters(
+        db.query(MailDocument), fns_only, days_back,
+        knd_code=knd_code, tax_office_code=tax_office_code, deadline_before=deadline_before,
+        account_id=account_id
+    )
 
     documents = query.order_by(MailDocument.date.desc()).offset(skip).limit(limit).all()
     logger.info(f"Запрос документов: fns_only={fns_only}, найдено={len(documents)}")
@@ -107,19 +130,76 @@ def get_documents(
     return documents
 
 
+@router.get("/documents/search", response_model=List[DocumentSearchResult])
+def search_documents(
+        q: str = Query(..., min_length=2, description="Поисковый запрос"),
+        fns_only: Optional[bool] = None,
+        days_back: Optional[int] = None,
+        knd_code: Optional[str] = None,
+        account_id: Optional[int] = None,
+        fuzzy: bool = False,
+        skip: int = 0,
+        limit: int = Query(50, le=500),
+        db: Session = Depends(get_db)
+):
+    """
+    Полнотекстовый поиск по теме и отправителю
+
+    - **q**: запрос (поддерживает синтаксис websearch: "фраза", -исключение, or)
+    - **fns_only**: true - только ФНС, false - только обычные, не указан - все
+    - **days_back**: документы за последние N дней
+    - **knd_code**: код формы по КНД
+    - **account_id**: учетная запись СБИС (организация)
+    - **fuzzy**: нечеткое совпадение по названию отправителя (pg_trgm)
+    - **skip/limit**: пагинация
+    """
+    return document_search_service.search(
+        db, q, fns_only=fns_only, days_back=days_back, knd_code=knd_code,
+        account_id=account_id, fuzzy=fuzzy, skip=skip, limit=limit
+    )
+
+
+@router.get("/documents/{document_id}/attachments", response_model=List[MailAttachmentSchema])
+def get_document_attachments(document_id: int, db: Session = Depends(get_db)):
+    """Список вложений документа (из локальной БД, без запроса в СБИС)"""
+    if not db.query(MailDocument.id).filter(MailDocument.id == document_id).first():
+        raise HTTPException(status_code=404, detail="Документ не найден")
+
+    return db.query(MailAttachment).filter(
+        MailAttachment.document_id == document_id
+    ).order_by(MailAttachment.id).all()
+
+
 @router.post("/check-now")
 async def check_now(db: Session = Depends(get_db)):
     """Немедленная проверка новых документов через СБИС"""
     try:
         logger.info("API запрос немедленной проверки документов через СБИС")
 
-        # Сначала пробуем через Celery
+        # Сначала пробуем через Celery; если проверка уже идет - ждем ее результат
         try:
-            task = check_fns_mails.delay()
-            result = task.get(timeout=60)
+            # Запрос пользователя - в interactive, а не за плановыми опросами
+            task, started = enqueue_single_flight(
+                check_fns_mails, "check_fns_mails", settings.DOCUMENTS_PERIOD_DAYS,
+                queue="interactive", priority=0
+            )
         except Exception as celery_error:
+            # Брокер недоступен - задача не поставлена, проверяем напрямую
             logger.warning(f"Celery недоступен: {celery_error}, используем прямой вызов")
             result = await run_real_check(db)
+        else:
+            if not started:
+                logger.info(f"Проверка уже выполняется ({task.id}), ожидаем ее результат")
+            try:
+                result = task.get(timeout=60)
+            except CeleryTimeoutError:
+                # Задача еще идет под блокировкой - второй раз напрямую не запускаем
+                logger.info(f"Проверка {task.id} продолжается в фоне")
+                return {
+                    "status": "scheduled",
+                    "task_id": task.id,
+                    "timestamp": datetime.now().isoformat()
+                }
 
         return {
             "status": "success",
@@ -142,15 +222,265 @@ async def check_now(db: Session = Depends(get_db)):
 def get_processing_logs(
         skip: int = 0,
         limit: int = 50,
+        account_id: Optional[int] = None,
         db: Session = Depends(get_db)
 ):
-    """Получить логи обработки"""
-    logs = db.query(ProcessingLog).order_by(
+    """Получить логи обработки (account_id - только по учетной записи СБИС)"""
+    query = db.query(ProcessingLog)
+    if account_id:
+        query = query.filter(ProcessingLog.account_id == account_id)
+
+    logs = query.order_by(
         ProcessingLog.processed_at.desc()
     ).offset(skip).limit(limit).all()
     return logs
 
 
+@router.get("/logs/performance")
+def get_performance_history(
+        days: int = Query(30, ge=1, le=365),
+        recent_days: int = Query(1, ge=1),
+        bucket: str = Query("day", pattern="^(hour|day|week)$"),
+        task_name: Optional[str] = None,
+        account_id: Optional[int] = None,
+        db: Session = Depends(get_db)
+):
+    """
+    Производительность запусков загрузки
+
+    Перцентили (p50/p90/p99) длительности, этапов, объема ответов СБИС,
+    записанных строк и памяти за days дней, медианы по интервалам bucket
+    и метрики, у которых медиана за последние recent_days дней выросла
+    в 1.5 раза и более.
+
+    - **task_name**: check_fns_mails, check_all_documents, ingestd
+    - **account_id**: запуски по учетной записи СБИС (общие задачи по всем учетным записям не учитываются)
+    """
+    if recent_days >= days:
+        raise HTTPException(status_code=400, detail="recent_days должен быть меньше days")
+
+    return run_history_service.performance(db, days, recent_days, bucket, task_name, account_id)
+
+
+@router.get("/quarantine/", response_model=List[QuarantinedDocumentSchema])
+def get_quarantined_documents(
+        status: Optional[str] = "quarantined",
+        skip: int = 0,
+        limit: int = 50,
+        account_id: Optional[int] = None,
+        db: Session = Depends(get_db)
+):
+    """
+    Документы в карантине (не записались из-за ошибок в данных)
+
+    - **status**: quarantined / replayed (пусто - все)
+    - **account_id**: учетная запись СБИС (организация)
+    """
+    query = db.query(QuarantinedDocument)
+    if status:
+        query = query.filter(QuarantinedDocument.status == status)
+    if account_id:
+        query = query.filter(QuarantinedDocument.account_id == account_id)
+
+    return query.order_by(QuarantinedDocument.created_at.desc()).offset(skip).limit(limit).all()
+
+
+@router.post("/quarantine/{item_id}/replay", response_model=QuarantinedDocumentSchema)
+def replay_quarantined_document(item_id: int, db: Session = Depends(get_db)):
+    """Повторить запись документа из карантина (например после исправления схемы)"""
+    item = db.query(QuarantinedDocument).filter(QuarantinedDocument.id == item_id).first()
+    if not item:
+        raise HTTPException(status_code=404, detail="Запись карантина не найдена")
+
+    item = FNSFilterService.replay_quarantined(db, item)
+    logger.info(f"Повтор записи из карантина {item_id}: {item.status}")
+    return item
+
+
+# ===============================
+# СОБЫТИЯ СБИС
+# ===============================
+
+def require_ingest_token(x_ingest_token: Optional[str] = Header(None)) -> None:
+    """
+    Заголовок X-Ingest-Token с INGEST_EVENTS_TOKEN
+
+    Без токена в настройках прием событий закрыт.
+    """
+    if not settings.INGEST_EVENTS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_ingest_token or not hmac.compare_digest(x_ingest_token, settings.INGEST_EVENTS_TOKEN):
+        raise HTTPException(status_code=401, detail="Неверный токен")
+
+
+@router.post("/ingest/events", status_code=202, dependencies=[Depends(require_ingest_token)])
+def ingest_events(batch: SBISEventBatch):
+    """
+    Прием уведомлений СБИС о новых документах
+
+    Повторные события (по id) отбрасываются, для остальных в очередь
+    realtime ставится загрузка только указанных документов. СБИС здесь
+    не вызывается, ответ возвращается сразу.
+    """
+    new_events, duplicates = event_ingest_service.dedupe(batch.events)
+
+    task_ids = []
+    try:
+        for account_id, document_ids in event_ingest_service.group_by_account(new_events).items():
+            task = fetch_event_documents_task.delay(account_id, document_ids)
+            task_ids.append(task.id)
+    except Exception as e:
+        # Без отметки события можно будет прислать повторно
+        event_ingest_service.forget(new_events)
+        logger.error(f"Не удалось поставить загрузку по событиям в очередь: {e}")
+        raise HTTPException(status_code=503, detail="Очередь задач недоступна")
+
+    return {
+        "accepted": len(new_events),
+        "duplicates": duplicates,
+        "task_ids": task_ids
+    }
+
+
+# ===============================
+# ПОТОК СОБЫТИЙ ДАШБОРДА
+# ===============================
+
+SSE_PING_SECONDS = 15
+
+
+@router.get("/events/stream")
+async def events_stream(request: Request):
+    """
+    Server-Sent Events: новые документы и прогресс загрузки
+
+    Задачи публикуют события в Redis, процесс API держит одну подписку
+    и раздает события всем подключенным клиентам. Раз в SSE_PING_SECONDS
+    отправляется комментарий, чтобы прокси не закрывали соединение.
+    """
+    queue = event_broadcaster.subscribe()
+
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=SSE_PING_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                event_type = json.loads(message).get("type", "message")
+                yield f"event: {event_type}\ndata: {message}\n\n"
+        finally:
+            event_broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# ===============================
+# ПРОФИЛИРОВАНИЕ
+# ===============================
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """
+    Заголовок X-Admin-Token с PROFILING_ADMIN_TOKEN (профили, изменение учетных записей)
+
+    Без токена в настройках эндпоинты закрыты.
+    """
+    if not settings.PROFILING_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.PROFILING_ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Неверный токен")
+
+
+@router.get("/profiles", dependencies=[Depends(require_admin)])
+async def get_profiles():
+    """
+    Сохраненные профили запросов и задач
+
+    Профиль запроса: PROFILING_ENABLED и заголовок X-Profile
+    с PROFILING_ADMIN_TOKEN, профиль задачи: profile=True в kwargs задачи.
+    """
+    profiles = list_profiles()
+    return {
+        "profiles_count": len(profiles),
+        "profiles": [
+            {**profile, "created_at": datetime.fromtimestamp(profile["created_at"]).isoformat()}
+            for profile in profiles
+        ]
+    }
+
+
+@router.get("/profiles/{filename}", dependencies=[Depends(require_admin)])
+async def download_profile(filename: str):
+    """Скачать профиль (pstats)"""
+    try:
+        filepath = profile_path(filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not os.path.exists(filepath):
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+
+    return FileResponse(path=filepath, filename=filename, media_type="application/octet-stream")
+
+
+# ===============================
+# УЧЕТНЫЕ ЗАПИСИ СБИС
+# ===============================
+
+@router.get("/accounts/", response_model=List[SBISAccountSchema])
+def get_accounts(db: Session = Depends(get_db)):
+    """Учетные записи СБИС и состояние их последней синхронизации"""
+    account_service.ensure_default_account(db)
+    return db.query(SBISAccount).order_by(SBISAccount.id).all()
+
+
+@router.post("/accounts/", response_model=SBISAccountSchema, status_code=201, dependencies=[Depends(require_admin)])
+def create_account(account: SBISAccountCreate, db: Session = Depends(get_db)):
+    """Добавить организацию: ее почта будет загружаться вместе с остальными (X-Admin-Token)"""
+    if db.query(SBISAccount.id).filter(SBISAccount.login == account.login).first():
+        raise HTTPException(status_code=409, detail="Учетная запись с таким логином уже есть")
+
+    data = account.model_dump()
+    data["password"] = encrypt_account_password(data["password"])
+    db_account = SBISAccount(**data)
+    db.add(db_account)
+    db.commit()
+    logger.info(f"Добавлена учетная запись СБИС: {db_account.login}")
+    return db_account
+
+
+@router.patch("/accounts/{account_id}", response_model=SBISAccountSchema, dependencies=[Depends(require_admin)])
+def update_account(account_id: int, changes: SBISAccountUpdate, db: Session = Depends(get_db)):
+    """Изменить учетную запись (is_active=false - отключить загрузку, X-Admin-Token)"""
+    db_account = db.get(SBISAccount, account_id)
+    if not db_account:
+        raise HTTPException(status_code=404, detail="Учетная запись не найдена")
+
+    data = changes.model_dump(exclude_unset=True)
+    if "password" in data:
+        if db_account.is_default:
+            raise HTTPException(status_code=400, detail="Пароль учетной записи по умолчанию задается SBIS_PASSWORD")
+        data["password"] = encrypt_account_password(data["password"])
+
+    for field, value in data.items():
+        setattr(db_account, field, value)
+    db.commit()
+    return db_account
+
+
+def encrypt_account_password(password: str) -> str:
+    try:
+        return encrypt_secret(password)
+    except SecretKeyMissing:
+        raise HTTPException(status_code=503, detail="ACCOUNT_SECRET_KEY не задан, пароли учетных записей не сохраняются")
+
+
 # ===============================
 # СИСТЕМНЫЕ ЭНДПОИНТЫ
 # ===============================
@@ -175,9 +505,23 @@ async def check_all_documents(db: Session = Depends(get_db)):
         # Сначала пробуем через Celery (если доступен)
         try:
             from app.tasks.celery_tasks import check_all_documents_task
-            task = check_all_documents_task.delay(days_back)
+            task, started = enqueue_single_flight(
+                check_all_documents_task, "check_all_documents", days_back, args=(days_back,)
+            )
+            if not started:
+                logger.info(f"Полная проверка уже выполняется ({task.id}), ожидаем ее результат")
             result = task.get(timeout=300)  # 5 минут таймаут
             logger.info("Задача выполнена через Celery")
+        except CeleryTimeoutError:
+            # Загрузка идет частями в очереди bulk - не запускаем ее второй раз напрямую
+            logger.info(f"Полная проверка {task.id} продолжается в фоне")
+            return {
+                "status": "scheduled",
+                "message": "Полная проверка выполняется в фоне",
+                "task_id": task.id,
+                "progress": task.info if isinstance(task.info, dict) else None,
+                "timestamp": datetime.now().isoformat()
+            }
         except Exception as celery_error:
             logger.warning(f"Celery недоступен: {celery_error}, выполняем напрямую")
             result = await run_full_check(db, days_back)
@@ -278,21 +622,28 @@ async def get_database_statistics(db: Session) -> Dict[str, Any]:
         return {"error": str(e)}
 
 @router.get("/status")
-async def get_system_status(db: Session = Depends(get_db)):
-    """Получение статуса системы и статистики"""
+async def get_system_status(account_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """
+    Получение статуса системы и статистики
+
+    Состояние воркеров, очередей и СБИС берется из кэша в Redis
+    (возраст значений - age_seconds), воркеры не опрашиваются.
+
+    - **account_id**: статистика документов только по учетной записи СБИС
+    """
     try:
-        # Проверяем статус Celery
-        celery_status = "unknown"
         try:
-            inspect = celery_app.control.inspect()
-            stats = inspect.stats()
-            celery_status = "active" if stats else "inactive"
-        except:
+            health = await health_service.snapshot()
+            celery_status = health["celery_status"]
+        except Exception as e:
+            logger.warning(f"Состояние воркеров недоступно: {e}")
+            health = {"workers": [], "queues": None, "sbis": None}
             celery_status = "error"
 
         # Получаем статистику из БД
-        total_docs = db.query(MailDocument).count()
-        fns_docs = db.query(MailDocument).filter(MailDocument.is_from_fns == True).count()
+        documents = apply_document_filters(db.query(MailDocument), account_id=account_id)
+        total_docs = documents.count()
+        fns_docs = documents.filter(MailDocument.is_from_fns == True).count()
 
         global last_check_time, processed_documents_count
         return {
@@ -305,6 +656,11 @@ async def get_system_status(db: Session = Depends(get_db)):
                 "fns_documents": fns_docs,
                 "regular_documents": total_docs - fns_docs
             },
+            "workers": health["workers"],
+            "queues": health["queues"],
+            "sbis": health["sbis"],
+            # Синхронный клиент Redis - в пуле потоков, не в event loop
+            "polling": await run_in_threadpool(poll_scheduler.status),
             "config": {
                 "check_interval_minutes": settings.CHECK_INTERVAL_MINUTES,
                 "documents_period_days": settings.DOCUMENTS_PERIOD_DAYS,
@@ -318,32 +674,33 @@ async def get_system_status(db: Session = Depends(get_db)):
 
 
 @router.get("/test-sbis")
-async def test_sbis_connection():
-    """Тестирование подключения к СБИС"""
-    try:
-        from app.services.sbis_client import SBISClient
-
-        async with SBISClient() as client:
-            auth_success = await client.authenticate()
+async def test_sbis_connection(refresh: bool = False):
+    """
+    Тестирование подключения к СБИС
 
-            if not auth_success:
-                return {
-                    "status": "error",
-                    "message": "Ошибка авторизации в СБИС",
-                    "timestamp": datetime.now().isoformat()
-                }
+    Проверяется только авторизация; результат кэшируется на
+    HEALTH_SBIS_PROBE_INTERVAL_SECONDS.
 
-            # Пробуем получить документы
-            documents = await client.get_fns_documents(days_back=30)
+    - **refresh**: проверить заново, не используя кэш
+    """
+    try:
+        probe = await health_service.probe_sbis(force=refresh)
 
+        if probe["status"] != "ok":
             return {
-                "status": "success",
-                "message": "Подключение к СБИС работает",
-                "documents_found": len(documents),
-                "sample_documents": documents[:3] if documents else [],
+                "status": "error",
+                "message": probe.get("error") or "Ошибка авторизации в СБИС",
+                "probe": probe,
                 "timestamp": datetime.now().isoformat()
             }
 
+        return {
+            "status": "success",
+            "message": "Подключение к СБИС работает",
+            "probe": probe,
+            "timestamp": datetime.now().isoformat()
+        }
+
     except Exception as e:
         logger.error(f"Ошибка тестирования СБИС: {str(e)}")
         return {
@@ -362,6 +719,7 @@ async def generate_json_report(
         fns_only: bool = False,
         days_back: Optional[int] = None,
         filename: Optional[str] = None,
+        account_id: Optional[int] = None,
         db: Session = Depends(get_db)
 ):
     """
@@ -370,22 +728,14 @@ async def generate_json_report(
     - **fns_only**: только документы от ФНС
     - **days_back**: документы за последние N дней
     - **filename**: имя файла для сохранения (опционально)
+    - **account_id**: учетная запись СБИС (организация)
     """
     try:
         # Используем ту же логику фильтрации что и в get_documents
-        query = db.query(MailDocument)
+        query = apply_document_filters(db.query(MailDocument), fns_only, days_back, account_id=account_id)
 
-        # Фильтр по ФНС
-        if fns_only is True:
-            query = query.filter(MailDocument.is_from_fns == True)
-        elif fns_only is False:
-            query = query.filter(MailDocument.is_from_fns == False)
-
-        # Фильтр по дате
         period_description = "all_time"
         if days_back:
-            start_date = datetime.now() - timedelta(days=days_back)
-            query = query.filter(MailDocument.date >= start_date)
             period_description = f"last_{days_back}_days"
 
         # Получаем документы
@@ -394,6 +744,8 @@ async def generate_json_report(
         # Уточняем описание периода
         if fns_only:
             period_description += "_fns_only"
+        if account_id:
+            period_description += f"_account_{account_id}"
 
         # Генерируем отчет
         result = json_report_service.generate_report(
@@ -464,15 +816,58 @@ async def download_report(filename: str):
         raise HTTPException(status_code=500, detail=f"Ошибка скачивания: {str(e)}")
 
 
+# ===============================
+# ФАЙЛЫ ВЛОЖЕНИЙ
+# ===============================
+
+@router.post("/attachments/download")
+async def download_attachments(limit: int = 500):
+    """Запустить загрузку еще не скачанных вложений в локальное хранилище"""
+    try:
+        from app.tasks.celery_tasks import download_attachments_task
+        task = download_attachments_task.delay(limit)
+
+        return {
+            "status": "accepted",
+            "task_id": task.id,
+            "timestamp": datetime.now().isoformat()
+        }
+
+    except Exception as e:
+        logger.error(f"Ошибка запуска загрузки вложений: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка запуска загрузки: {str(e)}")
+
+
+@router.get("/attachments/{attachment_id}/content")
+def get_attachment_content(attachment_id: int, request: Request, db: Session = Depends(get_db)):
+    """Скачать файл вложения из локального хранилища (поддерживается Range)"""
+    attachment = db.query(MailAttachment).filter(MailAttachment.id == attachment_id).first()
+    if not attachment:
+        raise HTTPException(status_code=404, detail="Вложение не найдено")
+
+    if not attachment.sha256 or not attachment_store.exists(attachment.sha256):
+        raise HTTPException(status_code=404, detail="Файл вложения еще не загружен")
+
+    media_type = mimetypes.guess_type(attachment.name)[0] or "application/octet-stream"
+    return range_file_response(
+        request,
+        attachment_store.path_for(attachment.sha256),
+        media_type=media_type,
+        filename=attachment.name
+    )
+
+
 # ===============================
 # ДАШБОРД (ЗАМЕНЯЕМ НА JSON API)
 # ===============================
 
 @router.get("/dashboard")
-async def dashboard_api(db: Session = Depends(get_db)):
+async def dashboard_api(account_id: Optional[int] = None, db: Session = Depends(get_db)):
     """
     API дашборда - возвращает JSON с полной информацией о системе
     (заменяет HTML дашборд)
+
+    - **account_id**: статистика только по учетной записи СБИС
     """
     try:
         # Получаем системную статистику
@@ -483,19 +878,20 @@ async def dashboard_api(db: Session = Depends(get_db)):
 
         # Получаем статистику по документам за разные периоды
         now = datetime.now()
+        documents = apply_document_filters(db.query(MailDocument), account_id=account_id)
 
         # За последние 30 дней
-        last_30_days = db.query(MailDocument).filter(
+        last_30_days = documents.filter(
             MailDocument.date >= now - timedelta(days=30)
         ).all()
 
         # За последние 7 дней
-        last_7_days = db.query(MailDocument).filter(
+        last_7_days = documents.filter(
             MailDocument.date >= now - timedelta(days=7)
         ).all()
 
         # Только ФНС за последние 30 дней
-        fns_last_30_days = db.query(MailDocument).filter(
+        fns_last_30_days = documents.filter(
             MailDocument.is_from_fns == True,
             MailDocument.date >= now - timedelta(days=30)
         ).all()
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List, Optional
+from typing import List, Dict, Optional
 import os
 
 
@@ -20,6 +20,87 @@ class Settings(BaseSettings):
     SBIS_BASE_URL: str = "https://online.sbis.ru"
     SBIS_AUTH_URL: str = "https://online.sbis.ru/auth/service/"  # Для авторизации
     SBIS_SERVICE_URL: str = "https://online.sbis.ru/service/?srv=1&protocol=4"  # Для документов
+    # Ключ Fernet для паролей учетных записей СБИС в базе (app/utils/crypto.py)
+    ACCOUNT_SECRET_KEY: Optional[str] = None
+
+    # Лимиты запросов к СБИС (общие для API и Celery через Redis)
+    SBIS_RATE_LIMITS: Dict[str, float] = {  # запросов в секунду по методам
+        "default": 5.0,
+        "СБИС.Аутентифицировать": 0.5,
+        "СБИС.СписокДокументовПоСобытиям": 2.0,
+    }
+    SBIS_MIN_CONCURRENCY: int = 1
+    SBIS_MAX_CONCURRENCY: int = 8
+    SBIS_TARGET_LATENCY_SECONDS: float = 5.0
+    SBIS_MAX_ATTEMPTS: int = 3
+
+    # Учетные записи СБИС загружаются параллельно, не больше N одновременно
+    SBIS_ACCOUNT_CONCURRENCY: int = 4
+
+    # Постраничная загрузка с чекпоинтами
+    SBIS_PAGE_SIZE: int = 200
+    INGEST_SLICE_DAYS: int = 30
+    INGEST_CHUNK_PAGES: int = 25  # страниц за один запуск фоновой задачи, дальше - продолжение в очереди
+    INGEST_CHECKPOINT_RETENTION_DAYS: int = 7  # чекпоинты брошенных задач (без обновлений) удаляются
+
+    # Адаптивный интервал опроса (celery beat), время московское
+    POLL_MIN_INTERVAL_SECONDS: int = 60
+    POLL_MAX_INTERVAL_SECONDS: int = 30 * 60
+    POLL_BUSINESS_HOURS_START: int = 9
+    POLL_BUSINESS_HOURS_END: int = 19
+    POLL_HIT_BOOST_MINUTES: int = 30  # после письма от ФНС опрашиваем с минимальным интервалом
+    POLL_ARRIVAL_WINDOW_MINUTES: int = 120
+
+    # Демон загрузки (python -m app.ingestd)
+    INGESTD_POLL_INTERVAL_SECONDS: float = 20.0
+    INGESTD_POLL_JITTER_SECONDS: float = 5.0
+    INGESTD_WINDOW_DAYS: int = 2  # опрашиваемый период: последние N дней
+    INGESTD_QUEUE_SIZE: int = 10  # пачек в очереди на запись, дальше опрос ждет
+
+    # Блокировка от параллельных одинаковых синхронизаций
+    SYNC_LOCK_LEASE_SECONDS: int = 120
+    SYNC_LOCK_HANDOFF_SECONDS: int = 30 * 60  # пока продолжение ждет в очереди bulk
+
+    # Прием событий СБИС (POST /api/v1/ingest/events)
+    INGEST_EVENTS_TOKEN: Optional[str] = None  # заголовок X-Ingest-Token, пусто - прием событий закрыт
+    INGEST_EVENT_DEDUPE_TTL_SECONDS: int = 7 * 24 * 3600
+
+    # Состояние воркеров и СБИС для /status (кэш в Redis)
+    HEALTH_HEARTBEAT_SECONDS: int = 15
+    HEALTH_WORKER_TTL_SECONDS: int = 60  # воркер без пульса дольше - считается остановленным
+    HEALTH_SBIS_PROBE_INTERVAL_SECONDS: int = 300
+
+    # Экспорт метрик Prometheus из воркеров Celery и демона загрузки (API - /metrics)
+    METRICS_EXPORTER_PORT: int = 9100
+
+    # Профилирование (cProfile): с токеном - запросы с заголовком X-Profile, без токена - все запросы и задачи
+    PROFILING_ENABLED: bool = False
+    PROFILING_ADMIN_TOKEN: Optional[str] = None  # также X-Admin-Token для /profiles и изменения /accounts
+    PROFILES_DIR: str = "logs/profiles"
+    PROFILES_KEEP: int = 200
+
+    # Разбор и классификация реестра в пуле процессов (0 - в текущем процессе);
+    # в prefork-воркерах Celery всегда в текущем процессе, см. parse_pool.py
+    PARSE_POOL_WORKERS: int = 0
+    PARSE_POOL_CHUNK_SIZE: int = 500  # записей на задачу пула, страницы не больше - на месте
+
+    # Потоковый разбор больших ответов реестра (ijson): меньше памяти, но медленнее json.loads
+    SBIS_STREAM_DECODE: bool = True
+    SBIS_STREAM_DECODE_MIN_BYTES: int = 1024 * 1024  # ответы меньше (после распаковки) - json.loads
+
+    # Архив сырых ответов СБИС (NDJSON.gz по периодам) для повторной обработки без сети
+    SBIS_ARCHIVE_ENABLED: bool = False
+    SBIS_ARCHIVE_DIR: str = "archive/sbis"
+    SBIS_ARCHIVE_SERVE_PAST: bool = False  # страницы прошедших периодов - из архива, если есть
+
+    # Хранилище файлов вложений
+    ATTACHMENTS_DIR: str = "attachments"
+    ATTACHMENT_DOWNLOAD_CONCURRENCY: int = 4
+    ATTACHMENT_DOWNLOAD_RETRIES: int = 3
+    ATTACHMENT_CHUNK_SIZE: int = 64 * 1024
+
+    # Разбор XML вложений ФНС (0 - в текущем процессе)
+    XML_PARSE_WORKERS: int = 2
 
     # FNS filtering
     FNS_INN_PREFIXES: List[str] = ["770", "771", "772", "773", "774", "775", "7718", "7736"]
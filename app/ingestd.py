@@ -0,0 +1,250 @@
+"""
+Демон загрузки документов из СБИС
+
+Запуск: python -m app.ingestd
+
+Альтернатива опросу через Celery beat с меньшей задержкой: один event
+loop, открытые сессии SBISClient и пул соединений БД на все время
+работы. СБИС опрашивается каждые INGESTD_POLL_INTERVAL_SECONDS (со
+случайным сдвигом) по всем активным учетным записям (не больше
+SBIS_ACCOUNT_CONCURRENCY одновременно), пачки документов передаются
+на запись через ограниченную очередь. По SIGTERM/SIGINT опрос
+останавливается, а уже полученные пачки дописываются.
+"""
+import asyncio
+import random
+import signal
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.models.models import ProcessingLog, SBISAccount
+from app.services.accounts import account_service
+from app.services.event_bus import publish_documents
+from app.services.fns_filter import FNSFilterService
+from app.services.parse_pool import parse_pool
+from app.services.sbis_client import SBISClient
+from app.utils.logger import logger
+from app.utils.metrics import start_exporter
+from app.utils.run_stats import RunStats, collect_run_stats
+
+
+class PollBatch:
+    """Документы одного опроса учетной записи и показатели опроса"""
+
+    def __init__(self, account_id: int, documents: List[Dict[str, Any]], started_at: datetime, stats: RunStats):
+        self.task_id = f"ingestd-{uuid.uuid4()}"
+        self.account_id = account_id
+        self.documents = documents
+        self.started_at = started_at
+        self.stats = stats
+
+
+class IngestDaemon:
+    def __init__(
+            self,
+            interval: float = settings.INGESTD_POLL_INTERVAL_SECONDS,
+            jitter: float = settings.INGESTD_POLL_JITTER_SECONDS,
+            window_days: int = settings.INGESTD_WINDOW_DAYS,
+            queue_size: int = settings.INGESTD_QUEUE_SIZE
+    ):
+        self.interval = interval
+        self.jitter = jitter
+        self.window_days = window_days
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.stopping = asyncio.Event()
+        # Открытые сессии СБИС по учетным записям
+        self.clients: Dict[int, SBISClient] = {}
+        # Один поток записи: пачки пишутся по порядку, event loop не блокируется
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingestd-db")
+
+    def stop(self) -> None:
+        if not self.stopping.is_set():
+            logger.info("Остановка демона загрузки: дописываем полученные документы")
+            self.stopping.set()
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stop)
+
+        logger.info(
+            f"Демон загрузки запущен: интервал {self.interval}±{self.jitter} с, "
+            f"период {self.window_days} дн."
+        )
+
+        try:
+            start_exporter(settings.METRICS_EXPORTER_PORT)
+        except OSError as e:
+            # Порт занят (воркер Celery на той же машине) - демон работает без экспорта
+            logger.warning(f"Экспорт метрик на порту {settings.METRICS_EXPORTER_PORT} не запущен: {e}")
+
+        writer = asyncio.create_task(self.write_loop())
+        try:
+            await self.poll_loop()
+        finally:
+            for client in self.clients.values():
+                await client.__aexit__(None, None, None)
+            await self.queue.put(None)
+            await writer
+            self.executor.shutdown(wait=True)
+            parse_pool.shutdown()
+            engine.dispose()
+            logger.info("Демон загрузки остановлен")
+
+    async def poll_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(settings.SBIS_ACCOUNT_CONCURRENCY)
+
+        async def poll_account(account) -> None:
+            started_at = datetime.now()
+            async with semaphore:
+                # Каждая учетная запись - своя задача gather со своим контекстом,
+                # сборщик получает загрузку и разбор только ее страниц
+                with collect_run_stats() as stats:
+                    try:
+                        client = await self.get_client(account)
+                        documents = await self.fetch(client)
+                    except Exception as e:
+                        logger.error(f"Демон загрузки: ошибка опроса СБИС ({account.login}): {e}")
+                        return
+
+            if documents is not None:
+                # Если запись отстает, опрос ждет здесь (очередь ограничена)
+                await self.queue.put(PollBatch(account.id, documents, started_at, stats))
+
+        while not self.stopping.is_set():
+            started = time.monotonic()
+
+            try:
+                accounts = await loop.run_in_executor(self.executor, self.load_accounts)
+                await asyncio.gather(*(poll_account(account) for account in accounts))
+            except Exception as e:
+                logger.error(f"Демон загрузки: ошибка цикла опроса: {e}")
+
+            delay = self.interval + random.uniform(-self.jitter, self.jitter)
+            delay = max(0.0, delay - (time.monotonic() - started))
+            try:
+                await asyncio.wait_for(self.stopping.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def get_client(self, account: SBISAccount) -> SBISClient:
+        """Сессия учетной записи: создается один раз, при смене пароля пересоздается"""
+        client = self.clients.get(account.id)
+        if client is not None and client.password != account_service.password(account):
+            await client.__aexit__(None, None, None)
+            client = None
+
+        if client is None:
+            client = await SBISClient(account=account).__aenter__()
+            self.clients[account.id] = client
+        return client
+
+    @staticmethod
+    def load_accounts() -> List[SBISAccount]:
+        db = SessionLocal()
+        try:
+            accounts = account_service.active_accounts(db)
+            db.expunge_all()
+            return accounts
+        finally:
+            db.close()
+
+    async def fetch(self, client: SBISClient) -> Optional[List[Dict[str, Any]]]:
+        """Все страницы реестра за последние window_days дней (None - ошибка опроса)"""
+        date_to = date.today()
+        date_from = date_to - timedelta(days=self.window_days)
+        documents = []
+        page = 0
+
+        while True:
+            raw_result = await client.get_documents_page(date_from, date_to, page, settings.SBIS_PAGE_SIZE)
+            if not raw_result:
+                # Возможно истекла сессия - следующий опрос авторизуется заново
+                client.session_id = None
+                logger.warning("Опрос СБИС не удался, повтор в следующем цикле")
+                return None
+
+            page_documents = await parse_pool.parse_documents(client, raw_result)
+            documents.extend(page_documents)
+            if not page_documents or not client.has_more(raw_result):
+                return documents
+            page += 1
+
+    async def write_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.queue.get()
+            try:
+                if batch is None:
+                    return
+                await loop.run_in_executor(self.executor, self.write_batch, batch)
+            finally:
+                self.queue.task_done()
+
+    @staticmethod
+    def write_batch(batch: PollBatch) -> None:
+        """
+        Запись пачки (в потоке записи)
+
+        Строка ProcessingLog пишется только для опросов с новыми документами
+        и для ошибок: опрос без изменений каждые ~20 секунд по каждой
+        учетной записи вытеснил бы из /logs остальную историю.
+        """
+        db = SessionLocal()
+        try:
+            with collect_run_stats(batch.stats) as stats:
+                result = FNSFilterService.save_documents(
+                    db, batch.documents, source=batch.task_id, account_id=batch.account_id
+                )
+            if result["new_documents"]:
+                log_entry = ProcessingLog(
+                    task_id=batch.task_id,
+                    task_name="ingestd",
+                    account_id=batch.account_id,
+                    total_documents=result["total_documents"],
+                    fns_documents=result["fns_documents"],
+                    status="success",
+                    started_at=batch.started_at
+                )
+                stats.apply_to(log_entry)
+                db.add(log_entry)
+            db.commit()
+            publish_documents(result["created"])
+
+            if result["new_documents"]:
+                logger.info(
+                    f"Демон загрузки: новых документов {result['new_documents']}, "
+                    f"из них от ФНС {result['fns_documents']}"
+                )
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Демон загрузки: ошибка записи пачки {batch.task_id}: {e}")
+            try:
+                log_entry = ProcessingLog(
+                    task_id=batch.task_id,
+                    task_name="ingestd",
+                    account_id=batch.account_id,
+                    status="error",
+                    error_message=str(e),
+                    started_at=batch.started_at
+                )
+                batch.stats.apply_to(log_entry)
+                db.add(log_entry)
+                db.commit()
+            except Exception:
+                db.rollback()
+        finally:
+            db.close()
+
+
+def main() -> None:
+    asyncio.run(IngestDaemon().run())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,18 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from app.api.routes import router
+from app.config import settings
 from app.database import engine
 from app.models import models
 from fastapi.staticfiles import StaticFiles
 from app.utils.logger import logger
 from app.tasks.celery_tasks import check_all_documents_task
+from app.services.sync_lock import enqueue_single_flight
+from app.services.health import health_service
+from app.utils.metrics import HTTP_REQUEST_SECONDS, render_latest
+from app.utils.profiling import ProfilingMiddleware
+import asyncio
 import os
+import time
 
 # Создаем папку для логов если её нет
 os.makedirs("logs", exist_ok=True)
@@ -38,6 +45,29 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 app.include_router(router, prefix="/api/v1", tags=["documents"])
 
 
+# Профилирование запросов: без PROFILING_ENABLED middleware не подключается
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+
+@app.middleware("http")
+async def http_metrics(request: Request, call_next):
+    """Время ответа по шаблону маршрута (а не по URL с id)"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.labels(
+            method=request.method,
+            route=route.path if route else "unmatched",
+            status=str(status)
+        ).observe(time.perf_counter() - started)
+
+
 @app.get("/", tags=["health"])
 async def root():
     """Главная страница"""
@@ -55,14 +85,39 @@ async def health():
     """Проверка состояния сервиса"""
     return {"status": "healthy"}
 
+
+@app.get("/metrics", tags=["health"], include_in_schema=False)
+async def metrics():
+    """Метрики Prometheus"""
+    body, content_type = render_latest()
+    return Response(content=body, headers={"Content-Type": content_type})
+
 @app.on_event("startup")
 async def startup_event():
     """Выполняется при старте приложения"""
     # Запускаем полную проверку один раз
     if not hasattr(app.state, "startup_completed"):
         app.state.startup_completed = True
-        task = check_all_documents_task.delay(3600)
-        logger.info(f"Запущена полная проверка документов, Task ID: {task.id}")
+        # Несколько реплик API не должны запускать одну и ту же загрузку
+        task, started = enqueue_single_flight(
+            check_all_documents_task, "check_all_documents", 3600, args=(3600,)
+        )
+        if started:
+            logger.info(f"Запущена полная проверка документов, Task ID: {task.id}")
+        else:
+            logger.info(f"Полная проверка уже выполняется, Task ID: {task.id}")
+
+        # Проверка СБИС для /status в фоне, а не при каждом запросе
+        app.state.health_probe = asyncio.create_task(health_service.probe_loop())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Выполняется при остановке приложения"""
+    probe = getattr(app.state, "health_probe", None)
+    if probe is not None:
+        probe.cancel()
+    await health_service.close()
 
 if __name__ == "__main__":
     import uvicorn
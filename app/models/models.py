@@ -1,13 +1,41 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text
+from sqlalchemy import (
+    Column, Integer, BigInteger, Float, String, Date, DateTime, Boolean, Text, JSON, Computed, Index, DDL, event,
+    ForeignKey
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
 from app.database import Base
 
 
+class SBISAccount(Base):
+    """Учетная запись СБИС (организация), почта которой проверяется"""
+    __tablename__ = "sbis_accounts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(255), nullable=False)
+    inn = Column(String(12), nullable=True, index=True)
+    login = Column(String(255), unique=True, nullable=False)
+    password = Column(Text, nullable=False)  # Зашифрован (app/utils/crypto.py), у записи по умолчанию пусто
+    is_active = Column(Boolean, default=True, index=True)
+    is_default = Column(Boolean, default=False)  # Создана из SBIS_LOGIN/SBIS_PASSWORD
+
+    # Состояние последней синхронизации
+    last_sync_at = Column(DateTime, nullable=True)
+    last_sync_status = Column(String(50), nullable=True)  # success, auth_error, error
+    last_sync_error = Column(Text, nullable=True)
+    last_new_documents = Column(Integer, default=0)
+
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
 class MailDocument(Base):
     __tablename__ = "mail_documents"
 
     id = Column(Integer, primary_key=True, index=True)
-    external_id = Column(String, unique=True, index=True)  # ID из СБИС
+    account_id = Column(Integer, ForeignKey("sbis_accounts.id"), nullable=True, index=True)
+    external_id = Column(String, index=True)  # ID из СБИС, уникален в пределах учетной записи
     date = Column(DateTime, nullable=False)
     subject = Column(Text, nullable=False)
     sender_inn = Column(String(12), nullable=True, index=True)
@@ -18,14 +46,135 @@ class MailDocument(Base):
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
+    # Метаданные из XML вложения ФНС
+    knd_code = Column(String(10), nullable=True, index=True)  # Код формы по КНД
+    tax_office_code = Column(String(4), nullable=True, index=True)  # Код налогового органа
+    response_deadline = Column(Date, nullable=True, index=True)  # Срок ответа
+    metadata_extracted_at = Column(DateTime, nullable=True)
+
+    # Полнотекстовый индекс: тема важнее отправителя
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed(
+            "setweight(to_tsvector('russian', coalesce(subject, '')), 'A') || "
+            "setweight(to_tsvector('russian', coalesce(sender_name, '')), 'B')",
+            persisted=True
+        )
+    ))
+
+    attachments = relationship(
+        "MailAttachment",
+        back_populates="document",
+        cascade="all, delete-orphan",
+        passive_deletes=True
+    )
+
+    __table_args__ = (
+        Index("uq_mail_documents_account_external_id", "account_id", "external_id", unique=True),
+        Index("ix_mail_documents_search_vector", "search_vector", postgresql_using="gin"),
+        Index(
+            "ix_mail_documents_sender_name_trgm", "sender_name",
+            postgresql_using="gin", postgresql_ops={"sender_name": "gin_trgm_ops"}
+        ),
+        Index(
+            "ix_mail_documents_sender_inn_trgm", "sender_inn",
+            postgresql_using="gin", postgresql_ops={"sender_inn": "gin_trgm_ops"}
+        ),
+    )
+
+
+class MailAttachment(Base):
+    __tablename__ = "mail_attachments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(
+        Integer, ForeignKey("mail_documents.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    name = Column(String(500), nullable=False, index=True)
+    size = Column(BigInteger, nullable=True)
+    type = Column(String(100), nullable=True)
+    sbis_id = Column(String(255), nullable=True)  # Идентификатор вложения в СБИС
+    url = Column(Text, nullable=True)  # Ссылка на файл в СБИС
+    sha256 = Column(String(64), nullable=True, index=True)  # Ключ файла в локальном хранилище
+    stored_size = Column(BigInteger, nullable=True)
+    downloaded_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+
+    document = relationship("MailDocument", back_populates="attachments")
+
 
 class ProcessingLog(Base):
     __tablename__ = "processing_logs"
 
     id = Column(Integer, primary_key=True, index=True)
     task_id = Column(String, nullable=True)
+    task_name = Column(String(100), nullable=True, index=True)
+    account_id = Column(Integer, ForeignKey("sbis_accounts.id"), nullable=True, index=True)  # пусто - все учетные записи
     total_documents = Column(Integer, default=0)
     fns_documents = Column(Integer, default=0)
     status = Column(String(50), default="success")  # success, error
     error_message = Column(Text, nullable=True)
-    processed_at = Column(DateTime, server_default=func.now())
\ No newline at end of file
+    processed_at = Column(DateTime, server_default=func.now())
+
+    # Показатели запуска (RunStats) для /logs/performance
+    started_at = Column(DateTime, nullable=True, index=True)
+    finished_at = Column(DateTime, nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+    stage_durations = Column(JSON, nullable=True)  # {"parse": 0.12, "db_write": 1.5, ...}, секунды
+    sbis_bytes_received = Column(BigInteger, default=0)
+    rows_inserted = Column(Integer, default=0)
+    rows_updated = Column(Integer, default=0)
+    rows_skipped = Column(Integer, default=0)  # уже сохраненные, повторы и карантин
+    peak_rss_kb = Column(Integer, nullable=True)
+    retry_count = Column(Integer, default=0)
+
+
+class IngestionCheckpoint(Base):
+    """Позиция загрузки из СБИС, сохраняется после каждой записанной страницы"""
+    __tablename__ = "ingestion_checkpoints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    task_id = Column(String, index=True, nullable=False)
+    account_id = Column(Integer, ForeignKey("sbis_accounts.id"), nullable=True)
+    sync_type = Column(String(50), nullable=False)
+    date_from = Column(Date, nullable=False)  # Период фиксируется при первом запуске
+    date_to = Column(Date, nullable=False)
+    cursor_date = Column(Date, nullable=False)  # Начало текущего среза
+    cursor_page = Column(Integer, default=0)  # Следующая страница в срезе
+    last_external_id = Column(String, nullable=True)
+    pages_done = Column(Integer, default=0)
+    total_documents = Column(Integer, default=0)
+    new_documents = Column(Integer, default=0)
+    fns_documents = Column(Integer, default=0)
+    status = Column(String(20), default="running")  # running, completed
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # Одна задача ведет отдельный чекпоинт для каждой учетной записи
+        Index("uq_ingestion_checkpoints_task_account", "task_id", "account_id", unique=True),
+    )
+
+
+class QuarantinedDocument(Base):
+    """Документы, которые не удалось записать (плохие данные из СБИС)"""
+    __tablename__ = "quarantined_documents"
+
+    id = Column(Integer, primary_key=True, index=True)
+    external_id = Column(String(255), nullable=True, index=True)
+    account_id = Column(Integer, ForeignKey("sbis_accounts.id"), nullable=True, index=True)
+    source = Column(String, nullable=True)  # task_id или источник загрузки
+    payload = Column(JSON, nullable=False)  # Документ в том виде, как пришел в запись
+    error = Column(Text, nullable=True)
+    status = Column(String(20), default="quarantined", index=True)  # quarantined, replayed
+    replay_attempts = Column(Integer, default=0)
+    created_at = Column(DateTime, server_default=func.now())
+    replayed_at = Column(DateTime, nullable=True)
+
+
+# Триграммные индексы требуют расширения pg_trgm
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
@@ -1,10 +1,11 @@
-from pydantic import BaseModel
-from datetime import datetime
-from typing import Optional, List
+from pydantic import BaseModel, Field
+from datetime import datetime, date
+from typing import Optional, List, Dict, Any
 
 
 class MailDocumentBase(BaseModel):
     external_id: str
+    account_id: Optional[int] = None
     date: datetime
     subject: str
     sender_inn: Optional[str] = None
@@ -20,6 +21,9 @@ class MailDocumentCreate(MailDocumentBase):
 class MailDocument(MailDocumentBase):
     id: int
     is_from_fns: bool
+    knd_code: Optional[str] = None
+    tax_office_code: Optional[str] = None
+    response_deadline: Optional[date] = None
     created_at: datetime
     updated_at: datetime
 
@@ -27,6 +31,23 @@ class MailDocument(MailDocumentBase):
         from_attributes = True
 
 
+class MailAttachment(BaseModel):
+    id: int
+    document_id: int
+    name: str
+    size: Optional[int] = None
+    type: Optional[str] = None
+    sbis_id: Optional[str] = None
+    url: Optional[str] = None
+    sha256: Optional[str] = None
+    stored_size: Optional[int] = None
+    downloaded_at: Optional[datetime] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
 class ProcessingResult(BaseModel):
     total_documents: int
     fns_documents: int
@@ -38,11 +59,91 @@ class ProcessingResult(BaseModel):
 class ProcessingLogResponse(BaseModel):
     id: int
     task_id: Optional[str]
+    task_name: Optional[str] = None
+    account_id: Optional[int] = None
     total_documents: int
     fns_documents: int
     status: str
     error_message: Optional[str]
     processed_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    duration_seconds: Optional[float] = None
+    stage_durations: Optional[Dict[str, float]] = None
+    sbis_bytes_received: Optional[int] = None
+    rows_inserted: Optional[int] = None
+    rows_updated: Optional[int] = None
+    rows_skipped: Optional[int] = None
+    peak_rss_kb: Optional[int] = None
+    retry_count: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+
+class DocumentSearchResult(BaseModel):
+    document: MailDocument
+    rank: float
+    subject_highlight: str
+    sender_name_highlight: Optional[str] = None
+
+
+class QuarantinedDocument(BaseModel):
+    id: int
+    external_id: Optional[str]
+    account_id: Optional[int] = None
+    source: Optional[str]
+    payload: Dict[str, Any]
+    error: Optional[str]
+    status: str
+    replay_attempts: int
+    created_at: datetime
+    replayed_at: Optional[datetime]
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class SBISAccountBase(BaseModel):
+    name: str
+    inn: Optional[str] = None
+    login: str
+    is_active: bool = True
+
+
+class SBISAccountCreate(SBISAccountBase):
+    password: str
+
+
+class SBISAccountUpdate(BaseModel):
+    name: Optional[str] = None
+    inn: Optional[str] = None
+    password: Optional[str] = None
+    is_active: Optional[bool] = None
+
+
+class SBISAccount(SBISAccountBase):
+    """Учетная запись без пароля"""
+    id: int
+    is_default: bool
+    last_sync_at: Optional[datetime] = None
+    last_sync_status: Optional[str] = None
+    last_sync_error: Optional[str] = None
+    last_new_documents: Optional[int] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class SBISEvent(BaseModel):
+    """Событие СБИС о новом или измененном документе"""
+    id: str = Field(..., min_length=1, max_length=255)  # Идентификатор события (ключ дедупликации)
+    document_id: str = Field(..., min_length=1, max_length=255)  # Идентификатор документа в СБИС
+    account_id: Optional[int] = None  # Учетная запись, пусто - по умолчанию
+    type: Optional[str] = None
+    occurred_at: Optional[datetime] = None
+
+
+class SBISEventBatch(BaseModel):
+    events: List[SBISEvent] = Field(..., min_length=1, max_length=1000)
@@ -0,0 +1,107 @@
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models.models import SBISAccount
+from app.utils.crypto import decrypt_secret, encrypt_secret, is_encrypted
+from app.utils.logger import logger
+
+
+class AccountService:
+    """Учетные записи СБИС, почта которых проверяется"""
+
+    def __init__(self):
+        self._default_account_id: Optional[int] = None
+
+    def ensure_default_account(self, db: Session) -> SBISAccount:
+        """
+        Учетная запись из SBIS_LOGIN/SBIS_PASSWORD
+
+        Создается при первом обращении, так что развертывание с одной
+        организацией работает без настройки таблицы учетных записей.
+        Создание идет в отдельной сессии со своим commit: транзакция
+        вызывающего кода (запись пачки, savepoint карантина) не
+        фиксируется посреди работы. Пароль записи по умолчанию в базе
+        не хранится - он берется из SBIS_PASSWORD.
+        """
+        if self._default_account_id is None:
+            with Session(bind=db.get_bind()) as session:
+                account = session.query(SBISAccount).filter(SBISAccount.is_default == True).first()
+                if account is None:
+                    account = session.query(SBISAccount).filter(SBISAccount.login == settings.SBIS_LOGIN).first()
+
+                if account is None:
+                    account = SBISAccount(
+                        name=settings.SBIS_LOGIN,
+                        login=settings.SBIS_LOGIN,
+                        password="",
+                        is_active=True,
+                        is_default=True
+                    )
+                    session.add(account)
+                    session.commit()
+                    logger.info(f"Создана учетная запись СБИС по умолчанию: {account.login}")
+                elif not account.is_default:
+                    account.is_default = True
+                    account.password = ""
+                    session.commit()
+
+                self._default_account_id = account.id
+
+        account = db.get(SBISAccount, self._default_account_id)
+        if account is None:
+            # Запись удалена после кэширования id
+            self._default_account_id = None
+            return self.ensure_default_account(db)
+        return account
+
+    def default_account_id(self, db: Session) -> int:
+        if self._default_account_id is None:
+            self.ensure_default_account(db)
+        return self._default_account_id
+
+    @staticmethod
+    def password(account: SBISAccount) -> str:
+        """Пароль учетной записи для авторизации в СБИС"""
+        if account.is_default:
+            return settings.SBIS_PASSWORD
+        return decrypt_secret(account.password)
+
+    @staticmethod
+    def encrypt_stored_passwords(db: Session) -> int:
+        """Шифрование паролей, записанных открытым текстом (миграция)"""
+        encrypted = 0
+        for account in db.query(SBISAccount).filter(SBISAccount.is_default == False):
+            if account.password and not is_encrypted(account.password):
+                account.password = encrypt_secret(account.password)
+                encrypted += 1
+        db.query(SBISAccount).filter(SBISAccount.is_default == True).update({"password": ""})
+        db.commit()
+        return encrypted
+
+    def active_accounts(self, db: Session) -> List[SBISAccount]:
+        self.ensure_default_account(db)
+        return db.query(SBISAccount).filter(SBISAccount.is_active == True).order_by(SBISAccount.id).all()
+
+    @staticmethod
+    def mark_synced(
+            db: Session,
+            account_id: int,
+            status: str,
+            new_documents: int = 0,
+            error: Optional[str] = None
+    ) -> None:
+        """Запись состояния последней синхронизации"""
+        account = db.get(SBISAccount, account_id)
+        if account is None:
+            return
+
+        account.last_sync_at = datetime.now()
+        account.last_sync_status = status
+        account.last_sync_error = error
+        account.last_new_documents = new_documents
+        db.commit()
+
+
+# Глобальный экземпляр сервиса
+account_service = AccountService()
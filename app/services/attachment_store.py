@@ -0,0 +1,186 @@
+import asyncio
+import fcntl
+import hashlib
+import os
+from typing import List, Dict, Optional, Tuple
+from app.config import settings
+from app.utils.logger import logger
+
+
+class AttachmentStore:
+    """
+    Контентно-адресуемое хранилище файлов вложений
+
+    Файл хранится под своим SHA-256 (objects/ab/cd/<sha256>), поэтому
+    одинаковые вложения из разных писем занимают место один раз.
+    Недокачанные файлы лежат в partial/ и дописываются при повторе.
+    """
+
+    def __init__(self, root: str = settings.ATTACHMENTS_DIR):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.partial_dir = os.path.join(root, "partial")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.partial_dir, exist_ok=True)
+
+    def path_for(self, sha256: str) -> str:
+        """Путь к файлу по его хешу"""
+        return os.path.join(self.objects_dir, sha256[:2], sha256[2:4], sha256)
+
+    def exists(self, sha256: str) -> bool:
+        return os.path.exists(self.path_for(sha256))
+
+    def partial_path(self, url: str) -> str:
+        """Путь недокачанного файла (стабилен между повторами)"""
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.partial_dir, f"{key}.part")
+
+    def commit(self, partial_path: str, sha256: str) -> str:
+        """Переносит докачанный файл в хранилище (или удаляет, если такой уже есть)"""
+        target = self.path_for(sha256)
+        if os.path.exists(target):
+            os.remove(partial_path)
+            return target
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(partial_path, target)
+        return target
+
+
+class AttachmentDownloader:
+    """Параллельная загрузка вложений из СБИС с ограничением конкурентности"""
+
+    def __init__(
+            self,
+            store: AttachmentStore,
+            concurrency: int = settings.ATTACHMENT_DOWNLOAD_CONCURRENCY,
+            retries: int = settings.ATTACHMENT_DOWNLOAD_RETRIES,
+            chunk_size: int = settings.ATTACHMENT_CHUNK_SIZE
+    ):
+        self.store = store
+        self.concurrency = concurrency
+        self.retries = retries
+        self.chunk_size = chunk_size
+
+    async def download_all(self, client, urls: List[str]) -> Dict[str, Tuple[str, int]]:
+        """
+        Загружает файлы по ссылкам, возвращает {url: (sha256, size)}
+
+        Одинаковые ссылки загружаются один раз. Неудачные загрузки
+        в результат не попадают, их частичные файлы остаются для докачки.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        unique_urls = list(dict.fromkeys(urls))
+
+        async def worker(url: str):
+            async with semaphore:
+                return url, await self.download_with_retries(client, url)
+
+        results = await asyncio.gather(*(worker(url) for url in unique_urls))
+        downloaded = {url: result for url, result in results if result}
+
+        logger.info(f"Загружено вложений: {len(downloaded)} из {len(unique_urls)}")
+        return downloaded
+
+    async def download_with_retries(self, client, url: str) -> Optional[Tuple[str, int]]:
+        for attempt in range(1, self.retries + 1):
+            try:
+                return await self.download(client, url)
+            except Exception as e:
+                logger.warning(f"Ошибка загрузки вложения {url} (попытка {attempt}/{self.retries}): {e}")
+                if attempt < self.retries:
+                    await asyncio.sleep(2 ** attempt)
+
+        return None
+
+    async def download(self, client, url: str) -> Tuple[str, int]:
+        """
+        Потоковая загрузка одного файла с докачкой
+
+        Частичный файл держится под flock: параллельная загрузка той же
+        ссылки (другая задача или процесс) получает ошибку и повторяет
+        попытку позже. Докачка проверяется по Content-Range: ответ не с
+        того смещения или частичный файл длиннее файла на сервере -
+        частичный файл удаляется и загрузка начинается заново. Размер
+        готового файла сверяется с размером на сервере.
+        """
+        partial_path = self.store.partial_path(url)
+
+        with open(partial_path, "a+b") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise RuntimeError("вложение уже загружается другой задачей")
+
+            try:
+                # Хеш уже скачанной части пересчитываем с диска
+                sha = hashlib.sha256()
+                offset = 0
+                f.seek(0)
+                for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                    sha.update(chunk)
+                    offset += len(chunk)
+
+                async with client.open_file(url, offset) as response:
+                    content_range = parse_content_range(response.headers.get("Content-Range"))
+                    if response.status == 416 and offset > 0:
+                        # Файл докачан полностью, но не перенесен в хранилище -
+                        # только если размер на сервере совпадает с частичным файлом
+                        total = content_range[2] if content_range else None
+                        if total != offset:
+                            self._restart(f)
+                            raise RuntimeError(f"частичный файл {offset} байт, на сервере {total}")
+                    elif response.status == 206:
+                        if content_range is None or content_range[0] != offset:
+                            self._restart(f)
+                            raise RuntimeError(
+                                f"докачка с {offset}, сервер вернул {response.headers.get('Content-Range')}"
+                            )
+                        total = content_range[2]
+                        await self._write_stream(response, f, sha)
+                    elif response.status == 200:
+                        # Сервер не поддержал Range - качаем заново
+                        self._restart(f)
+                        sha = hashlib.sha256()
+                        total = response.content_length
+                        await self._write_stream(response, f, sha)
+                    else:
+                        raise RuntimeError(f"HTTP {response.status}")
+
+                f.flush()
+                size = os.path.getsize(partial_path)
+                if total is not None and size != total:
+                    # Оборванный ответ: недостающая часть докачается при повторе
+                    raise RuntimeError(f"получено {size} байт из {total}")
+
+                digest = sha.hexdigest()
+                self.store.commit(partial_path, digest)
+                return digest, size
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _restart(f) -> None:
+        f.seek(0)
+        f.truncate()
+
+    async def _write_stream(self, response, f, sha) -> None:
+        async for chunk in response.content.iter_chunked(self.chunk_size):
+            sha.update(chunk)
+            f.write(chunk)
+
+
+def parse_content_range(value: Optional[str]) -> Optional[Tuple[Optional[int], Optional[int], Optional[int]]]:
+    """Content-Range "bytes 100-199/200" или "bytes */200" -> (начало, конец, размер)"""
+    if not value or not value.startswith("bytes "):
+        return None
+    try:
+        span, _, total = value[len("bytes "):].partition("/")
+        start, end = (int(part) for part in span.split("-")) if span != "*" else (None, None)
+        return start, end, int(total) if total not in ("", "*") else None
+    except ValueError:
+        return None
+
+
+# Глобальный экземпляр хранилища
+attachment_store = AttachmentStore()
@@ -33,6 +33,12 @@ class DocumentProcessor:
         if not date_str:
             return datetime.now()
 
+        # ISO формат (документы из карантина, синтетические данные)
+        try:
+            return datetime.fromisoformat(date_str)
+        except ValueError:
+            pass
+
         try:
             # Пробуем разные форматы даты
             for fmt in ['%d.%m.%Y', '%Y-%m-%d', '%d/%m/%Y']:
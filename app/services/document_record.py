@@ -0,0 +1,147 @@
+"""
+Компактная запись документа СБИС от разбора до записи в БД
+
+DocumentRecord заменяет словарь из parse_document: поля в __slots__,
+вложения - кортеж AttachmentRecord, отправитель (sender_name,
+sender_inn) интернируется, и одна строка на отправителя разделяется
+всеми его документами. save_documents пишет записи в БД напрямую
+(Core insert), без промежуточных MailDocumentCreate и MailDocument.
+
+Для кода, который читает документ как словарь (is_from_fns,
+format_documents_table), есть get/[]/in с прежними ключами, включая
+attachments (имена файлов) и attachment_details (словари вложений).
+"""
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+from app.services.common import DocumentProcessor
+
+
+def intern(value: Optional[str]) -> Optional[str]:
+    """Одна строка на повторяющееся значение (отправитель, ИНН)"""
+    return sys.intern(value) if type(value) is str else value
+
+
+@dataclass(slots=True)
+class AttachmentRecord:
+    name: str
+    size: Optional[int] = None
+    type: Optional[str] = None
+    sbis_id: Optional[str] = None
+    url: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "size": self.size, "type": self.type, "sbis_id": self.sbis_id, "url": self.url}
+
+
+@dataclass(slots=True)
+class DocumentRecord:
+    external_id: str
+    date: datetime
+    subject: str
+    sender_inn: Optional[str]
+    sender_name: Optional[str]
+    filename: str
+    has_attachment: bool
+    attachment_details: Tuple[AttachmentRecord, ...] = ()
+    is_from_fns: Optional[bool] = None  # None - еще не классифицирован
+    account_id: Optional[int] = None
+    id: Optional[int] = None  # после записи в БД
+
+    def __post_init__(self):
+        self.sender_inn = intern(self.sender_inn)
+        self.sender_name = intern(self.sender_name)
+
+    @property
+    def attachments(self) -> list:
+        """Имена вложений (ключ attachments словаря документа)"""
+        return [attachment.name for attachment in self.attachment_details]
+
+    # --- чтение как словаря ---
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key == "attachment_details":
+            return [attachment.to_dict() for attachment in self.attachment_details]
+        if key == "is_from_fns" and self.is_from_fns is None:
+            return default
+        return getattr(self, key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, KeyError)
+        if value is KeyError:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, KeyError) is not KeyError
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Словарь документа в формате parse_document (карантин, JSON)"""
+        return {
+            "external_id": self.external_id,
+            "date": self.date,
+            "subject": self.subject,
+            "sender_inn": self.sender_inn,
+            "sender_name": self.sender_name,
+            "filename": self.filename,
+            "has_attachment": self.has_attachment,
+            "attachments": self.attachments,
+            "attachment_details": self.get("attachment_details"),
+            **({"is_from_fns": self.is_from_fns} if self.is_from_fns is not None else {}),
+            **({"account_id": self.account_id} if self.account_id is not None else {}),
+        }
+
+    def to_row(self) -> Dict[str, Any]:
+        """Строка для insert(MailDocument)"""
+        return {
+            "account_id": self.account_id,
+            "external_id": self.external_id,
+            "date": self.date,
+            "subject": self.subject,
+            "sender_inn": self.sender_inn,
+            "sender_name": self.sender_name,
+            "filename": self.filename,
+            "has_attachment": self.has_attachment,
+            "is_from_fns": bool(self.is_from_fns),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DocumentRecord":
+        """Запись из словаря документа (карантин, синтетические данные)"""
+        date_value = data.get("date", "")
+        if not isinstance(date_value, datetime):
+            date_value = DocumentProcessor.parse_date(str(date_value))
+
+        details = data.get("attachment_details")
+        if details is None:
+            details = [{"name": name} for name in data.get("attachments", [])]
+
+        return cls(
+            external_id=data.get("external_id", ""),
+            date=date_value,
+            subject=data.get("subject", ""),
+            sender_inn=data.get("sender_inn", ""),
+            sender_name=data.get("sender_name", ""),
+            filename=data.get("filename", ""),
+            has_attachment=data.get("has_attachment", False),
+            attachment_details=tuple(
+                AttachmentRecord(
+                    name=attachment.get("name") or "",
+                    size=attachment.get("size"),
+                    type=attachment.get("type"),
+                    sbis_id=attachment.get("sbis_id"),
+                    url=attachment.get("url")
+                ) for attachment in details
+            ),
+            is_from_fns=data.get("is_from_fns"),
+            account_id=data.get("account_id")
+        )
+
+
+def to_records(documents: Iterable[Union[DocumentRecord, Dict[str, Any]]]) -> list:
+    """Записи из документов-записей или словарей"""
+    return [
+        document if isinstance(document, DocumentRecord) else DocumentRecord.from_dict(document)
+        for document in documents
+    ]
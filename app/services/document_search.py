@@ -0,0 +1,123 @@
+from typing import List, Dict, Any, Optional
+from datetime import datetime, timedelta, date
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session, Query
+from app.models.models import MailDocument
+from app.utils.logger import logger
+
+
+def apply_document_filters(
+        query: Query,
+        fns_only: Optional[bool] = None,
+        days_back: Optional[int] = None,
+        knd_code: Optional[str] = None,
+        tax_office_code: Optional[str] = None,
+        deadline_before: Optional[date] = None,
+        account_id: Optional[int] = None
+) -> Query:
+    """Общие фильтры списка документов"""
+    # Учетная запись СБИС (организация)
+    if account_id:
+        query = query.filter(MailDocument.account_id == account_id)
+
+    # Фильтр по ФНС
+    if fns_only is True:
+        query = query.filter(MailDocument.is_from_fns == True)
+    elif fns_only is False:
+        query = query.filter(MailDocument.is_from_fns == False)
+
+    # Фильтр по дате
+    if days_back:
+        start_date = datetime.now() - timedelta(days=days_back)
+        query = query.filter(MailDocument.date >= start_date)
+
+    # Фильтры по метаданным из XML вложений
+    if knd_code:
+        query = query.filter(MailDocument.knd_code == knd_code)
+    if tax_office_code:
+        query = query.filter(MailDocument.tax_office_code == tax_office_code)
+    if deadline_before:
+        query = query.filter(MailDocument.response_deadline <= deadline_before)
+
+    return query
+
+
+class DocumentSearchService:
+    """Полнотекстовый поиск по теме и отправителю (tsvector + pg_trgm)"""
+
+    TS_CONFIG = "russian"
+    HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20, MinWords=5"
+
+    def search(
+            self,
+            db: Session,
+            q: str,
+            fns_only: Optional[bool] = None,
+            days_back: Optional[int] = None,
+            knd_code: Optional[str] = None,
+            account_id: Optional[int] = None,
+            fuzzy: bool = False,
+            skip: int = 0,
+            limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """
+        Поиск документов с ранжированием и подсветкой
+
+        Сначала по индексам отбирается и ранжируется страница id,
+        ts_headline считается только для нее.
+        """
+        q = q.strip()
+        ts_query = func.websearch_to_tsquery(self.TS_CONFIG, q)
+        rank = func.ts_rank_cd(MailDocument.search_vector, ts_query)
+
+        conditions = [MailDocument.search_vector.op("@@")(ts_query)]
+
+        # ИНН ищем по подстроке (триграммный индекс)
+        if q.isdigit():
+            conditions.append(MailDocument.sender_inn.like(f"%{q}%"))
+            rank = func.greatest(rank, func.similarity(MailDocument.sender_inn, q))
+
+        # Нечеткое совпадение по названию отправителя
+        if fuzzy:
+            conditions.append(MailDocument.sender_name.op("%")(q))
+            rank = func.greatest(rank, func.similarity(MailDocument.sender_name, q))
+
+        page_query = db.query(MailDocument.id, rank.label("rank")).filter(or_(*conditions))
+        page_query = apply_document_filters(page_query, fns_only, days_back, knd_code=knd_code, account_id=account_id)
+        page = (
+            page_query
+            .order_by(rank.desc(), MailDocument.date.desc())
+            .offset(skip)
+            .limit(limit)
+            .subquery()
+        )
+
+        rows = (
+            db.query(
+                MailDocument,
+                page.c.rank,
+                func.ts_headline(self.TS_CONFIG, MailDocument.subject, ts_query, self.HEADLINE_OPTIONS),
+                func.ts_headline(
+                    self.TS_CONFIG, func.coalesce(MailDocument.sender_name, ""), ts_query, self.HEADLINE_OPTIONS
+                ),
+            )
+            .join(page, MailDocument.id == page.c.id)
+            .order_by(page.c.rank.desc(), MailDocument.date.desc())
+            .all()
+        )
+
+        logger.info(f"Поиск документов: q='{q}', fuzzy={fuzzy}, найдено={len(rows)}")
+
+        return [
+            {
+                "document": document,
+                "rank": float(doc_rank or 0),
+                "subject_highlight": subject_highlight,
+                "sender_name_highlight": sender_name_highlight or None
+            }
+            for document, doc_rank, subject_highlight, sender_name_highlight in rows
+        ]
+
+
+# Глобальный экземпляр сервиса
+document_search_service = DocumentSearchService()
@@ -0,0 +1,99 @@
+import asyncio
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+from app.utils.logger import logger
+from app.utils.redis_client import create_async_redis, get_redis
+
+CHANNEL = "fns:events"
+
+
+def document_event(document) -> Dict[str, Any]:
+    """Краткое описание нового документа для уведомления"""
+    return {
+        "id": document.id,
+        "account_id": document.account_id,
+        "external_id": document.external_id,
+        "date": document.date.isoformat() if document.date else None,
+        "subject": document.subject,
+        "sender_inn": document.sender_inn,
+        "sender_name": document.sender_name,
+        "filename": document.filename,
+        "is_from_fns": bool(document.is_from_fns)
+    }
+
+
+def publish(event_type: str, data: Dict[str, Any]) -> None:
+    """
+    Публикация события для подключенных дашбордов (Redis pub/sub)
+
+    Вызывается из задач и сервисов после commit. Ошибки Redis не
+    влияют на загрузку: без уведомления дашборд просто не обновится.
+    """
+    message = json.dumps(
+        {"type": event_type, "data": data, "at": datetime.now().isoformat()},
+        ensure_ascii=False, default=str
+    )
+    try:
+        get_redis().publish(CHANNEL, message)
+    except Exception as e:
+        logger.debug(f"Не удалось опубликовать событие {event_type}: {e}")
+
+
+def publish_documents(created: List[Dict[str, Any]]) -> None:
+    if created:
+        publish("documents", {"documents": created})
+
+
+class EventBroadcaster:
+    """
+    Рассылка событий из Redis клиентам SSE одного процесса API
+
+    На процесс одна подписка на канал, каждое событие раскладывается
+    по очередям подключенных клиентов. Медленный клиент теряет самые
+    старые события, а не тормозит остальных.
+    """
+
+    QUEUE_SIZE = 100
+    RECONNECT_DELAY_SECONDS = 5
+
+    def __init__(self):
+        self.clients: Set[asyncio.Queue] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        self.clients.add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self.clients.discard(queue)
+
+    def broadcast(self, message: str) -> None:
+        for queue in list(self.clients):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    async def _listen(self) -> None:
+        while self.clients:
+            redis = create_async_redis()
+            pubsub = redis.pubsub()
+            try:
+                await pubsub.subscribe(CHANNEL)
+                while self.clients:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message and message["type"] == "message":
+                        self.broadcast(message["data"])
+            except Exception as e:
+                logger.warning(f"Подписка на события прервана: {e}, переподключение")
+                await asyncio.sleep(self.RECONNECT_DELAY_SECONDS)
+            finally:
+                await pubsub.aclose()
+                await redis.aclose()
+
+
+# Один на процесс API
+event_broadcaster = EventBroadcaster()
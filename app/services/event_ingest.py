@@ -0,0 +1,51 @@
+from typing import Dict, List, Optional, Tuple
+from app.config import settings
+from app.schemas.schemas import SBISEvent
+from app.utils.logger import logger
+from app.utils.redis_client import get_redis
+
+
+class EventIngestService:
+    """
+    Прием событий СБИС вместо опроса реестра
+
+    Событие проверяется на повтор по id (SET NX в Redis), документы
+    новых событий загружаются задачей Celery по одному через
+    ПрочитатьДокумент. Плановый опрос остается страховкой на случай
+    потерянных событий.
+    """
+
+    KEY_PREFIX = "ingest:event:"
+
+    def dedupe(self, events: List[SBISEvent]) -> Tuple[List[SBISEvent], int]:
+        """Новые события и число повторов (при недоступном Redis все события новые)"""
+        try:
+            pipe = get_redis().pipeline()
+            for event in events:
+                pipe.set(self.KEY_PREFIX + event.id, 1, nx=True, ex=settings.INGEST_EVENT_DEDUPE_TTL_SECONDS)
+            marked = pipe.execute()
+        except Exception as e:
+            logger.warning(f"Redis недоступен, события принимаются без дедупликации: {e}")
+            return events, 0
+
+        new_events = [event for event, is_new in zip(events, marked) if is_new]
+        return new_events, len(events) - len(new_events)
+
+    def forget(self, events: List[SBISEvent]) -> None:
+        """Снять отметку, если события не удалось поставить в очередь"""
+        try:
+            get_redis().delete(*(self.KEY_PREFIX + event.id for event in events))
+        except Exception:
+            pass
+
+    @staticmethod
+    def group_by_account(events: List[SBISEvent]) -> Dict[Optional[int], List[str]]:
+        """Идентификаторы документов по учетным записям, без повторов"""
+        grouped: Dict[Optional[int], Dict[str, None]] = {}
+        for event in events:
+            grouped.setdefault(event.account_id, {})[event.document_id] = None
+        return {account_id: list(document_ids) for account_id, document_ids in grouped.items()}
+
+
+# Глобальный экземпляр сервиса
+event_ingest_service = EventIngestService()
@@ -1,11 +1,30 @@
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+import json
+from typing import List, Dict, Any, Optional, Tuple, Union
+from datetime import datetime, date
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DataError, IntegrityError
 from sqlalchemy.orm import Session
-from app.models.models import MailDocument
+from app.models.models import MailDocument, MailAttachment, QuarantinedDocument
 from app.schemas.schemas import MailDocumentCreate
 from app.config import settings
 from app.utils.logger import logger
 from app.services.common import DocumentProcessor
+from app.services.document_record import DocumentRecord, to_records
+from app.services.accounts import account_service
+from app.services.event_bus import document_event, publish_documents
+from app.utils.metrics import count_documents, stage_timer
+from app.utils.run_stats import record_rows
+
+# Ошибки данных конкретного документа. Остальные (потеря соединения,
+# deadlock) не связаны с данными и прерывают всю пачку как раньше.
+QUARANTINE_ERRORS = (DataError, IntegrityError, ValueError, TypeError)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
 
 
 class FNSFilterService:
@@ -30,6 +49,7 @@ class FNSFilterService:
             parsed_date = DocumentProcessor.parse_date(str(date_str))
 
         return MailDocumentCreate(
+            account_id=document_data.get('account_id'),
             external_id=document_data.get('external_id', ''),
             date=parsed_date,
             subject=document_data.get('subject', ''),
@@ -40,44 +60,213 @@ class FNSFilterService:
         )
 
     @staticmethod
-    def process_documents(db: Session, documents_data: List[Dict[str, Any]]) -> dict:
-        """Обработка и сохранение документов в БД"""
-        total_count = len(documents_data)
-        fns_count = 0
-        new_count = 0
+    def save_attachments(db: Session, documents: List[DocumentRecord]) -> int:
+        """
+        Пакетная запись вложений новых документов в текущей транзакции
+
+        Документы должны быть уже записаны (id заполнен), все вложения
+        вставляются одним executemany.
+        """
+        rows = [
+            {
+                "document_id": document.id,
+                "name": (attachment.name or "")[:500],
+                "size": attachment.size,
+                "type": attachment.type,
+                "sbis_id": attachment.sbis_id,
+                "url": attachment.url
+            }
+            for document in documents
+            for attachment in document.attachment_details
+        ]
+
+        if rows:
+            db.execute(insert(MailAttachment), rows)
+
+        return len(rows)
+
+    @staticmethod
+    def save_documents(
+            db: Session,
+            documents_data: List[Union[DocumentRecord, Dict[str, Any]]],
+            source: Optional[str] = None,
+            quarantine: bool = True,
+            account_id: Optional[int] = None
+    ) -> dict:
+        """
+        Запись пачки документов в текущей транзакции (без commit)
+
+        Уже сохраненные документы и повторы external_id внутри пачки
+        пропускаются: наличие проверяется одним запросом на всю пачку.
+        Если пачка не записывается из-за плохих данных, она делится
+        пополам в savepoint'ах до сбойных строк, которые уходят
+        в карантин, а остальные документы записываются.
+
+        external_id уникален в пределах учетной записи СБИС, без account_id
+        документы относятся к учетной записи по умолчанию. Документы -
+        записи DocumentRecord (словари преобразуются), новым записям
+        проставляются account_id, is_from_fns и id.
+        """
+        if account_id is None:
+            account_id = account_service.default_account_id(db)
+
+        documents = to_records(documents_data)
+        external_ids = [document.external_id for document in documents]
+        existing_ids = {
+            row.external_id for row in
+            db.query(MailDocument.external_id).filter(
+                MailDocument.account_id == account_id,
+                MailDocument.external_id.in_(external_ids)
+            )
+        } if external_ids else set()
+
+        candidates = []
+        for document in documents:
+            if document.external_id in existing_ids:
+                continue
+            existing_ids.add(document.external_id)
+            document.account_id = account_id
+            candidates.append(document)
+
+        with stage_timer("classify"):
+            for candidate in candidates:
+                # Документы из пула разбора (parse_pool) уже классифицированы
+                if candidate.is_from_fns is None:
+                    candidate.is_from_fns = FNSFilterService.is_from_fns(candidate)
+
+        with stage_timer("db_write"):
+            if quarantine:
+                written, quarantined = FNSFilterService._write_bisecting(db, candidates, source)
+            else:
+                written, quarantined = FNSFilterService._write_batch(db, candidates), 0
+
+        if quarantined:
+            logger.warning(f"В карантин отправлено документов: {quarantined}")
+
+        fns_count = sum(1 for document in written if document.is_from_fns)
+        count_documents(len(documents), len(written), fns_count)
+        # Существующие документы не обновляются: rows_updated здесь всегда 0
+        record_rows(inserted=len(written), skipped=len(documents) - len(written))
+
+        return {
+            "total_documents": len(documents),
+            "fns_documents": fns_count,
+            "new_documents": len(written),
+            # Для уведомлений после commit
+            "created": [document_event(document) for document in written],
+            "quarantined_documents": quarantined,
+            "last_external_id": external_ids[-1] if external_ids else None
+        }
+
+    @staticmethod
+    def _write_batch(db: Session, documents: List[DocumentRecord]) -> List[DocumentRecord]:
+        """
+        Запись документов и их вложений, возвращает записанные документы
+
+        Один insert ... returning id на пачку (Core, без ORM объектов
+        и схем MailDocumentCreate). Документы, которые между проверкой
+        и записью успела записать другая загрузка (опрос и событие),
+        пропускаются через ON CONFLICT DO NOTHING по
+        (account_id, external_id), а не падают в карантин. Ошибки
+        данных проявляются здесь.
+        """
+        if not documents:
+            return []
+
+        statement = pg_insert(MailDocument).on_conflict_do_nothing(
+            index_elements=[MailDocument.account_id, MailDocument.external_id]
+        ).returning(MailDocument.id, MailDocument.external_id)
+        ids = dict(
+            (external_id, document_id) for document_id, external_id in
+            db.execute(statement, [document.to_row() for document in documents])
+        )
+
+        # external_id в пачке уникальны (save_documents убирает повторы)
+        written = []
+        for document in documents:
+            document.id = ids.get(document.external_id)
+            if document.id is not None:
+                written.append(document)
+
+        FNSFilterService.save_attachments(db, written)
+        return written
+
+    @staticmethod
+    def _write_bisecting(
+            db: Session,
+            documents: List[DocumentRecord],
+            source: Optional[str]
+    ) -> Tuple[List[DocumentRecord], int]:
+        """Запись с делением сбойной пачки пополам, возвращает (записанные, в карантине)"""
+        if not documents:
+            return [], 0
+
+        try:
+            with db.begin_nested():
+                written = FNSFilterService._write_batch(db, documents)
+            return written, 0
 
+        except QUARANTINE_ERRORS as e:
+            if len(documents) == 1:
+                FNSFilterService.quarantine_document(db, documents[0], e, source)
+                return [], 1
+
+            middle = len(documents) // 2
+            left = FNSFilterService._write_bisecting(db, documents[:middle], source)
+            right = FNSFilterService._write_bisecting(db, documents[middle:], source)
+            return left[0] + right[0], left[1] + right[1]
+
+    @staticmethod
+    def quarantine_document(
+            db: Session,
+            document: Union[DocumentRecord, Dict[str, Any]],
+            error: Exception,
+            source: Optional[str]
+    ) -> None:
+        """Сохранение документа, который не удалось записать"""
+        doc_data = document.to_dict() if isinstance(document, DocumentRecord) else document
+        error_text = str(getattr(error, "orig", None) or error)
+        logger.error(f"Документ {doc_data.get('external_id', '')} отправлен в карантин: {error_text}")
+
+        db.add(QuarantinedDocument(
+            external_id=str(doc_data.get('external_id', ''))[:255],
+            account_id=doc_data.get('account_id'),
+            source=source,
+            payload=json.loads(json.dumps(doc_data, ensure_ascii=False, default=_json_default)),
+            error=error_text,
+            status="quarantined"
+        ))
+
+    @staticmethod
+    def replay_quarantined(db: Session, item: QuarantinedDocument) -> QuarantinedDocument:
+        """Повторная запись документа из карантина"""
         try:
-            for doc_data in documents_data:
-                # Проверяем, есть ли уже такой документ
-                external_id = doc_data.get('external_id', '')
-                if db.query(MailDocument).filter_by(external_id=external_id).first():
-                    continue
-
-                # Проверяем, от ФНС ли документ
-                is_fns = FNSFilterService.is_from_fns(doc_data)
-                if is_fns:
-                    fns_count += 1
-
-                # Преобразуем в схему
-                doc_schema = FNSFilterService.convert_to_schema(doc_data)
-
-                # Создаем запись в БД
-                db_document = MailDocument(
-                    external_id=doc_schema.external_id,
-                    date=doc_schema.date,
-                    subject=doc_schema.subject,
-                    sender_inn=doc_schema.sender_inn,
-                    sender_name=doc_schema.sender_name,
-                    filename=doc_schema.filename,
-                    has_attachment=doc_schema.has_attachment,
-                    is_from_fns=is_fns
+            with db.begin_nested():
+                FNSFilterService.save_documents(
+                    db, [item.payload], source=item.source, quarantine=False,
+                    account_id=item.payload.get('account_id')
                 )
+            item.status = "replayed"
+            item.replayed_at = datetime.now()
+            item.error = None
+        except QUARANTINE_ERRORS as e:
+            item.error = str(getattr(e, "orig", None) or e)
 
-                db.add(db_document)
-                new_count += 1
+        item.replay_attempts = (item.replay_attempts or 0) + 1
+        db.commit()
+        return item
 
+    @staticmethod
+    def process_documents(db: Session, documents_data: List[Dict[str, Any]], source: Optional[str] = None) -> dict:
+        """Обработка и сохранение документов в БД"""
+        try:
+            result = FNSFilterService.save_documents(db, documents_data, source=source)
             db.commit()
-            logger.info(f"Обработано: {total_count} всего, {fns_count} от ФНС, {new_count} новых")
+            publish_documents(result["created"])
+            logger.info(
+                f"Обработано: {result['total_documents']} всего, {result['fns_documents']} от ФНС, "
+                f"{result['new_documents']} новых"
+            )
 
         except Exception as e:
             db.rollback()
@@ -85,9 +274,9 @@ class FNSFilterService:
             raise
 
         return {
-            "total_documents": total_count,
-            "fns_documents": fns_count,
-            "new_documents": new_count
+            "total_documents": result["total_documents"],
+            "fns_documents": result["fns_documents"],
+            "new_documents": result["new_documents"]
         }
 
     async def get_and_process_fns_documents(self, db: Session, days_back: Optional[int] = None) -> dict:
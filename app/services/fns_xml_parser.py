@@ -0,0 +1,81 @@
+import xml.etree.ElementTree as ET
+from datetime import date, datetime
+from typing import List, Dict, Any, Optional
+from app.config import settings
+from app.utils.logger import logger
+from app.utils.process_pool import map_in_pool
+
+# Атрибуты формализованных документов ФНС, из которых берем метаданные
+KND_ATTRIBUTES = ("КНД",)
+TAX_OFFICE_ATTRIBUTES = ("КодНО", "КодНОГО", "КодИФНС", "КодНОПол")
+DEADLINE_ATTRIBUTES = ("СрокИсп", "СрокИспТреб", "СрокПредст", "ДатаИсп", "СрокУпл")
+
+
+def parse_deadline(value: str) -> Optional[date]:
+    """Срок исполнения в формате ДД.ММ.ГГГГ или ГГГГ-ММ-ДД"""
+    for fmt in ("%d.%m.%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value.strip(), fmt).date()
+        except ValueError:
+            continue
+
+    return None
+
+
+def extract_fns_metadata(path: str) -> Dict[str, Any]:
+    """
+    Извлечение КНД, кода инспекции и срока ответа из XML вложения
+
+    Файл читается через iterparse, обработанные элементы очищаются,
+    поэтому память не зависит от размера файла. Разбор прекращается,
+    как только найдены все три поля.
+    """
+    metadata = {"knd_code": None, "tax_office_code": None, "response_deadline": None}
+    open_elements = []
+
+    try:
+        for event, elem in ET.iterparse(path, events=("start", "end")):
+            if event == "start":
+                open_elements.append(elem)
+
+                attrib = elem.attrib
+                if attrib:
+                    if metadata["knd_code"] is None:
+                        metadata["knd_code"] = _first_attribute(attrib, KND_ATTRIBUTES)
+                    if metadata["tax_office_code"] is None:
+                        metadata["tax_office_code"] = _first_attribute(attrib, TAX_OFFICE_ATTRIBUTES)
+                    if metadata["response_deadline"] is None:
+                        deadline = _first_attribute(attrib, DEADLINE_ATTRIBUTES)
+                        metadata["response_deadline"] = parse_deadline(deadline) if deadline else None
+
+                if all(value is not None for value in metadata.values()):
+                    break
+            else:
+                open_elements.pop()
+                elem.clear()
+                # Закрытый элемент - последний потомок родителя, отцепляем его
+                if open_elements:
+                    del open_elements[-1][-1]
+
+    except (ET.ParseError, OSError) as e:
+        logger.warning(f"Не удалось разобрать XML {path}: {e}")
+
+    if metadata["knd_code"]:
+        metadata["knd_code"] = metadata["knd_code"][:10]
+    if metadata["tax_office_code"]:
+        metadata["tax_office_code"] = metadata["tax_office_code"][:4]
+
+    return metadata
+
+
+def _first_attribute(attrib: Dict[str, str], names) -> Optional[str]:
+    for name in names:
+        value = attrib.get(name)
+        if value:
+            return value.strip()
+    return None
+
+
+def extract_many(paths: List[str], workers: int = settings.XML_PARSE_WORKERS) -> List[Dict[str, Any]]:
+    """Разбор нескольких файлов в пуле процессов"""
+    return map_in_pool(extract_fns_metadata, paths, workers)
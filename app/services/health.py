@@ -0,0 +1,179 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from app.config import settings
+from app.utils.logger import logger
+from app.utils.redis_client import get_redis, create_async_redis
+
+# Очереди Celery и шаги приоритетов (см. broker_transport_options)
+QUEUES = ("realtime", "interactive", "bulk")
+PRIORITY_STEPS = range(10)
+
+
+class HealthService:
+    """
+    Состояние воркеров, очередей и подключения к СБИС
+
+    Воркеры раз в HEALTH_HEARTBEAT_SECONDS пишут в Redis пульс и длину
+    очередей, API раз в HEALTH_SBIS_PROBE_INTERVAL_SECONDS проверяет
+    авторизацию в СБИС. /status только читает сохраненные значения и
+    показывает их возраст, без broadcast-запросов к воркерам.
+
+    Воркеры пишут синхронным клиентом из своего потока, а API читает
+    асинхронным: при недоступном Redis запросы /status и /test-sbis
+    ждут подключения, не блокируя event loop.
+    """
+
+    WORKERS_KEY = "health:workers"
+    QUEUES_KEY = "health:queues"
+    SBIS_KEY = "health:sbis"
+    SBIS_PROBE_LOCK_KEY = "health:sbis:probing"
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._async_redis = None
+
+    def _aredis(self):
+        """Асинхронный клиент для процесса API (один event loop на процесс)"""
+        if self._async_redis is None:
+            self._async_redis = create_async_redis()
+        return self._async_redis
+
+    async def close(self) -> None:
+        if self._async_redis is not None:
+            await self._async_redis.aclose()
+            self._async_redis = None
+
+    # --- воркеры ---
+
+    @staticmethod
+    def queue_depths(redis) -> Dict[str, int]:
+        """Число задач в очередях брокера (по списку на каждый приоритет)"""
+        pipe = redis.pipeline()
+        for queue in QUEUES:
+            for priority in PRIORITY_STEPS:
+                pipe.llen(f"{queue}:{priority}" if priority else queue)
+        lengths = iter(pipe.execute())
+        return {queue: sum(next(lengths) for _ in PRIORITY_STEPS) for queue in QUEUES}
+
+    def publish_worker_heartbeat(self, hostname: str, queues: List[str]) -> None:
+        now = time.time()
+        try:
+            redis = get_redis()
+            depths = self.queue_depths(redis)
+            pipe = redis.pipeline()
+            pipe.hset(self.WORKERS_KEY, hostname, json.dumps({"queues": queues, "pid": os.getpid(), "at": now}))
+            pipe.set(self.QUEUES_KEY, json.dumps({"depths": depths, "at": now}))
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Не удалось записать пульс воркера {hostname}: {e}")
+
+    def start_worker_heartbeat(self, hostname: str, queues: List[str]) -> None:
+        """Фоновый поток пульса в главном процессе воркера"""
+        def beat():
+            while not self._stop.is_set():
+                self.publish_worker_heartbeat(hostname, queues)
+                self._stop.wait(settings.HEALTH_HEARTBEAT_SECONDS)
+
+        self._stop.clear()
+        threading.Thread(target=beat, name="health-heartbeat", daemon=True).start()
+        logger.info(f"Пульс воркера {hostname} запущен, очереди: {', '.join(queues)}")
+
+    def stop_worker_heartbeat(self, hostname: str) -> None:
+        self._stop.set()
+        try:
+            get_redis().hdel(self.WORKERS_KEY, hostname)
+        except Exception:
+            pass
+
+    # --- СБИС ---
+
+    async def probe_sbis(self, force: bool = False) -> Dict[str, Any]:
+        """
+        Проверка авторизации в СБИС с кэшем
+
+        Без force возвращает сохраненный результат, если он моложе
+        HEALTH_SBIS_PROBE_INTERVAL_SECONDS. Несколько процессов API не
+        проверяют одновременно: остальные получают последний результат.
+        """
+        redis = self._aredis()
+        cached = await redis.get(self.SBIS_KEY)
+        if cached and not force:
+            result = json.loads(cached)
+            if time.time() - result["at"] < settings.HEALTH_SBIS_PROBE_INTERVAL_SECONDS:
+                return self._with_age(result)
+
+        if not force and not await redis.set(self.SBIS_PROBE_LOCK_KEY, os.getpid(), nx=True, ex=60):
+            return self._with_age(json.loads(cached)) if cached else {"status": "unknown"}
+
+        from app.services.sbis_client import SBISClient
+
+        started = time.monotonic()
+        error = None
+        try:
+            async with SBISClient() as client:
+                ok = await client.authenticate()
+            if not ok:
+                error = "Ошибка авторизации в СБИС"
+        except Exception as e:
+            error = str(e)
+
+        result = {
+            "status": "error" if error else "ok",
+            "latency_ms": round((time.monotonic() - started) * 1000),
+            "error": error,
+            "at": time.time()
+        }
+        await redis.set(self.SBIS_KEY, json.dumps(result, ensure_ascii=False))
+        await redis.delete(self.SBIS_PROBE_LOCK_KEY)
+        if error:
+            logger.warning(f"Проверка СБИС не прошла: {error}")
+        return self._with_age(result)
+
+    async def probe_loop(self) -> None:
+        """Периодическая проверка СБИС в процессе API"""
+        while True:
+            try:
+                await self.probe_sbis()
+            except Exception as e:
+                logger.warning(f"Фоновая проверка СБИС не выполнена: {e}")
+            await asyncio.sleep(settings.HEALTH_SBIS_PROBE_INTERVAL_SECONDS)
+
+    # --- чтение ---
+
+    @staticmethod
+    def _with_age(entry: Optional[Dict[str, Any]], now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        if entry is None:
+            return None
+        now = now or time.time()
+        return {**entry, "age_seconds": round(now - entry["at"], 1)}
+
+    async def snapshot(self) -> Dict[str, Any]:
+        """Сохраненное состояние: три чтения из Redis одним pipeline"""
+        pipe = self._aredis().pipeline()
+        pipe.hgetall(self.WORKERS_KEY)
+        pipe.get(self.QUEUES_KEY)
+        pipe.get(self.SBIS_KEY)
+        workers_raw, queues_raw, sbis_raw = await pipe.execute()
+        now = time.time()
+
+        workers = []
+        for hostname, raw in sorted(workers_raw.items()):
+            worker = self._with_age(json.loads(raw), now)
+            worker["hostname"] = hostname
+            worker["alive"] = worker["age_seconds"] < settings.HEALTH_WORKER_TTL_SECONDS
+            workers.append(worker)
+
+        return {
+            "celery_status": "active" if any(w["alive"] for w in workers) else "inactive",
+            "workers": workers,
+            "queues": self._with_age(json.loads(queues_raw), now) if queues_raw else None,
+            "sbis": self._with_age(json.loads(sbis_raw), now) if sbis_raw else None
+        }
+
+
+# Глобальный экземпляр сервиса
+health_service = HealthService()
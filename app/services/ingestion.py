@@ -0,0 +1,282 @@
+import asyncio
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal
+from app.models.models import IngestionCheckpoint, SBISAccount
+from app.services.accounts import account_service
+from app.services.event_bus import publish_documents
+from app.services.fns_filter import FNSFilterService
+from app.services.parse_pool import parse_pool
+from app.services.sbis_client import SBISClient
+from app.utils.logger import logger
+
+
+class IngestionError(Exception):
+    """Страницу не удалось получить - загрузку нужно повторить с чекпоинта"""
+
+
+class IngestionService:
+    """
+    Постраничная загрузка документов из СБИС с чекпоинтами
+
+    Период делится на срезы по INGEST_SLICE_DAYS дней, каждый срез
+    читается страницами. Документы страницы и новая позиция чекпоинта
+    фиксируются одним commit, поэтому повтор задачи (тот же task_id)
+    продолжает ровно с первой незаписанной страницы. После успешного
+    завершения задачи ее чекпоинты удаляются (delete_checkpoints), иначе
+    каждый плановый опрос оставлял бы строку на учетную запись.
+    """
+
+    def __init__(self, slice_days: int = settings.INGEST_SLICE_DAYS, page_size: int = settings.SBIS_PAGE_SIZE):
+        self.slice_days = slice_days
+        self.page_size = page_size
+
+    @staticmethod
+    def get_or_create_checkpoint(
+            db: Session,
+            task_id: str,
+            sync_type: str,
+            days_back: int,
+            account_id: Optional[int] = None
+    ) -> IngestionCheckpoint:
+        """Чекпоинт задачи по учетной записи: восстанавливается при повторе, иначе создается"""
+        checkpoint = db.query(IngestionCheckpoint).filter(
+            IngestionCheckpoint.task_id == task_id,
+            IngestionCheckpoint.account_id == account_id
+        ).first()
+        if checkpoint:
+            logger.info(
+                f"Продолжаем загрузку {task_id} с {checkpoint.cursor_date}, страница {checkpoint.cursor_page} "
+                f"(уже обработано {checkpoint.total_documents})"
+            )
+            return checkpoint
+
+        date_to = date.today()
+        date_from = date_to - timedelta(days=days_back)
+        checkpoint = IngestionCheckpoint(
+            task_id=task_id,
+            account_id=account_id,
+            sync_type=sync_type,
+            date_from=date_from,
+            date_to=date_to,
+            cursor_date=date_from,
+            cursor_page=0,
+            pages_done=0,
+            total_documents=0,
+            new_documents=0,
+            fns_documents=0,
+            status="running"
+        )
+        db.add(checkpoint)
+        db.commit()
+        return checkpoint
+
+    @staticmethod
+    def delete_checkpoints(db: Session, task_id: str) -> int:
+        """
+        Удаление чекпоинтов завершенной задачи
+
+        Заодно удаляются чекпоинты задач, брошенных после последнего
+        повтора: без обновлений дольше INGEST_CHECKPOINT_RETENTION_DAYS.
+        """
+        stale_before = datetime.now() - timedelta(days=settings.INGEST_CHECKPOINT_RETENTION_DAYS)
+        deleted = db.query(IngestionCheckpoint).filter(
+            (IngestionCheckpoint.task_id == task_id) | (IngestionCheckpoint.updated_at < stale_before)
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+
+    def progress(self, checkpoint: IngestionCheckpoint) -> int:
+        """Доля пройденного периода, %"""
+        total_days = (checkpoint.date_to - checkpoint.date_from).days + 1
+        done_days = (checkpoint.cursor_date - checkpoint.date_from).days
+        return min(100, int(done_days / total_days * 100)) if total_days > 0 else 100
+
+    def slice_end(self, checkpoint: IngestionCheckpoint, slice_from: date) -> date:
+        return min(slice_from + timedelta(days=self.slice_days - 1), checkpoint.date_to)
+
+    async def run(
+            self,
+            db: Session,
+            client,
+            checkpoint: IngestionCheckpoint,
+            on_progress: Optional[Callable[[IngestionCheckpoint], None]] = None,
+            max_pages: Optional[int] = None
+    ) -> IngestionCheckpoint:
+        """
+        Загрузка с позиции чекпоинта до конца периода
+
+        С max_pages загрузка останавливается после указанного числа страниц,
+        чекпоинт остается в статусе running - продолжить можно тем же вызовом.
+        Следующая страница запрашивается заранее, пока текущая разбирается
+        (parse_pool) и пишется, в чекпоинт она попадает только после записи.
+        """
+        if on_progress:
+            on_progress(checkpoint)
+
+        pages = 0
+        # Следующая страница запрашивается, пока текущая разбирается и пишется
+        prefetch: Optional[asyncio.Task] = None
+        try:
+            while checkpoint.status != "completed" and checkpoint.cursor_date <= checkpoint.date_to:
+                if max_pages is not None and pages >= max_pages:
+                    logger.info(
+                        f"Загрузка {checkpoint.task_id} приостановлена на {checkpoint.cursor_date}, "
+                        f"страница {checkpoint.cursor_page}"
+                    )
+                    return checkpoint
+                slice_to = self.slice_end(checkpoint, checkpoint.cursor_date)
+
+                if prefetch is not None:
+                    raw_result, prefetch = await prefetch, None
+                else:
+                    raw_result = await client.get_documents_page(
+                        checkpoint.cursor_date, slice_to, checkpoint.cursor_page, self.page_size
+                    )
+                if not raw_result:
+                    raise IngestionError(
+                        f"Не удалось получить страницу {checkpoint.cursor_page} за "
+                        f"{checkpoint.cursor_date} - {slice_to}"
+                    )
+
+                # Позиция после страницы: следующая страница или следующий срез
+                registry = (raw_result.get("result") or {}).get("Реестр")
+                if registry and client.has_more(raw_result):
+                    next_date, next_page = checkpoint.cursor_date, checkpoint.cursor_page + 1
+                else:
+                    next_date, next_page = slice_to + timedelta(days=1), 0
+
+                if next_date <= checkpoint.date_to and (max_pages is None or pages + 1 < max_pages):
+                    prefetch = asyncio.create_task(client.get_documents_page(
+                        next_date, self.slice_end(checkpoint, next_date), next_page, self.page_size
+                    ))
+
+                documents = await parse_pool.parse_documents(client, raw_result)
+                result = FNSFilterService.save_documents(
+                    db, documents, source=checkpoint.task_id, account_id=checkpoint.account_id
+                )
+
+                checkpoint.cursor_date, checkpoint.cursor_page = next_date, next_page
+                checkpoint.pages_done += 1
+                pages += 1
+                checkpoint.total_documents += result["total_documents"]
+                checkpoint.new_documents += result["new_documents"]
+                checkpoint.fns_documents += result["fns_documents"]
+                if result["last_external_id"]:
+                    checkpoint.last_external_id = result["last_external_id"]
+
+                # Документы страницы и чекпоинт - в одной транзакции
+                db.commit()
+                publish_documents(result["created"])
+
+                if on_progress:
+                    on_progress(checkpoint)
+        finally:
+            if prefetch is not None:
+                prefetch.cancel()
+
+        checkpoint.status = "completed"
+        db.commit()
+
+        logger.info(
+            f"Загрузка {checkpoint.task_id} завершена: страниц {checkpoint.pages_done}, "
+            f"документов {checkpoint.total_documents}, новых {checkpoint.new_documents}"
+        )
+        return checkpoint
+
+    async def run_accounts(
+            self,
+            task_id: str,
+            sync_type: str,
+            days_back: int,
+            on_progress: Optional[Callable[[IngestionCheckpoint], None]] = None,
+            max_pages: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Загрузка по всем активным учетным записям СБИС
+
+        Учетные записи обрабатываются параллельно (не больше
+        SBIS_ACCOUNT_CONCURRENCY одновременно), у каждой свои сессия СБИС,
+        сессия БД и чекпоинт. Ошибка одной учетной записи не прерывает
+        остальные - она возвращается в ее результате.
+        """
+        db = SessionLocal()
+        try:
+            account_ids = [account.id for account in account_service.active_accounts(db)]
+        finally:
+            db.close()
+
+        semaphore = asyncio.Semaphore(settings.SBIS_ACCOUNT_CONCURRENCY)
+
+        async def run_account(account_id: int) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._run_account(task_id, sync_type, days_back, account_id, on_progress, max_pages)
+
+        return list(await asyncio.gather(*(run_account(account_id) for account_id in account_ids)))
+
+    async def _run_account(
+            self,
+            task_id: str,
+            sync_type: str,
+            days_back: int,
+            account_id: int,
+            on_progress: Optional[Callable[[IngestionCheckpoint], None]],
+            max_pages: Optional[int]
+    ) -> Dict[str, Any]:
+        db = SessionLocal()
+        result = {"account_id": account_id, "total_documents": 0, "new_documents": 0, "fns_documents": 0}
+
+        try:
+            account = db.get(SBISAccount, account_id)
+            checkpoint = self.get_or_create_checkpoint(db, task_id, sync_type, days_back, account_id)
+            if checkpoint.status == "completed":
+                # Повтор задачи: эта учетная запись уже загружена
+                return {**result, "status": "completed", "total_documents": checkpoint.total_documents,
+                        "new_documents": checkpoint.new_documents, "fns_documents": checkpoint.fns_documents}
+
+            async with SBISClient(account=account) as client:
+                if not await client.authenticate():
+                    account_service.mark_synced(db, account_id, "auth_error", error="Ошибка авторизации в СБИС")
+                    return {**result, "status": "auth_error", "error": "Ошибка авторизации в СБИС"}
+
+                checkpoint = await self.run(db, client, checkpoint, on_progress, max_pages)
+
+            result.update(
+                status=checkpoint.status,
+                total_documents=checkpoint.total_documents,
+                new_documents=checkpoint.new_documents,
+                fns_documents=checkpoint.fns_documents
+            )
+            if checkpoint.status == "completed":
+                account_service.mark_synced(db, account_id, "success", checkpoint.new_documents)
+            return result
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Загрузка {task_id} по учетной записи {account_id} прервана: {e}")
+            try:
+                account_service.mark_synced(db, account_id, "error", error=str(e))
+            except Exception:
+                db.rollback()
+            return {**result, "status": "error", "error": str(e)}
+
+        finally:
+            db.close()
+
+    @staticmethod
+    def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Итог загрузки по всем учетным записям"""
+        return {
+            "total_documents": sum(r["total_documents"] for r in results),
+            "new_documents": sum(r["new_documents"] for r in results),
+            "fns_documents": sum(r["fns_documents"] for r in results),
+            "completed": all(r["status"] in ("completed", "auth_error") for r in results),
+            "errors": {r["account_id"]: r["error"] for r in results if r.get("error")},
+            "accounts": results
+        }
+
+
+# Глобальный экземпляр сервиса
+ingestion_service = IngestionService()
@@ -0,0 +1,106 @@
+"""
+Разбор и классификация реестра СБИС в пуле процессов
+
+При PARSE_POOL_WORKERS > 0 записи Реестр делятся на части по
+PARSE_POOL_CHUNK_SIZE и разбираются (SBISClient.parse_document +
+is_from_fns) в ProcessPoolExecutor, пока event loop продолжает читать
+следующие страницы. Процессы возвращают компактные кортежи
+(DOCUMENT_FIELDS), записи DocumentRecord собираются уже в основном
+процессе. Небольшие страницы разбираются на месте.
+
+Пул создается через LazyProcessPool (app/utils/process_pool.py) и
+работает только в процессах, которым можно порождать дочерние: демон
+app.ingestd, бенчмарки, воркер Celery с --pool=solo или threads.
+Дочерние процессы prefork-воркера Celery (пул по умолчанию)
+демонические, в них реестр всегда разбирается на месте, и
+PARSE_POOL_WORKERS загрузку в Celery не ускоряет.
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Tuple
+from app.config import settings
+from app.services.common import DocumentProcessor
+from app.services.document_record import AttachmentRecord, DocumentRecord
+from app.utils.metrics import observe_stage
+from app.utils.process_pool import LazyProcessPool
+
+# Порядок полей в кортеже документа из процесса разбора
+DOCUMENT_FIELDS = (
+    "external_id", "date", "subject", "sender_inn", "sender_name", "filename",
+    "has_attachment", "attachment_details", "is_from_fns"
+)
+ATTACHMENT_FIELDS = ("name", "size", "type", "sbis_id", "url")
+
+_worker_client = None
+
+
+def _init_worker() -> None:
+    global _worker_client
+    from app.services.sbis_client import SBISClient
+
+    _worker_client = SBISClient()
+
+
+def _parse_chunk(entries: List[Dict[str, Any]]) -> List[Tuple]:
+    """Разбор части реестра в процессе пула"""
+    rows = []
+    for entry in entries:
+        document = _worker_client.parse_document(entry.get("Документ", {}))
+        if not document:
+            continue
+        rows.append((
+            document.external_id,
+            document.date,
+            document.subject,
+            document.sender_inn,
+            document.sender_name,
+            document.filename,
+            document.has_attachment,
+            tuple(
+                tuple(getattr(details, field) for field in ATTACHMENT_FIELDS)
+                for details in document.attachment_details
+            ),
+            DocumentProcessor.is_from_fns(document),
+        ))
+    return rows
+
+
+def _unpack(row: Tuple) -> DocumentRecord:
+    document = DocumentRecord(*row)
+    document.attachment_details = tuple(AttachmentRecord(*details) for details in document.attachment_details)
+    return document
+
+
+class ParsePool:
+    def __init__(self, workers: int = settings.PARSE_POOL_WORKERS, chunk_size: int = settings.PARSE_POOL_CHUNK_SIZE):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        # spawn: процессы пула не наследуют потоки и соединения родителя
+        self._pool = LazyProcessPool("Пул разбора реестра", initializer=_init_worker, start_method="spawn")
+
+    async def parse_documents(self, client, raw_result: dict) -> List[DocumentRecord]:
+        """
+        То же, что client.parse_documents(raw_result), но в пуле процессов
+
+        Документы из пула уже классифицированы (is_from_fns),
+        save_documents повторно их не проверяет.
+        """
+        registry = ((raw_result or {}).get("result") or {}).get("Реестр")
+        executor = self._pool.get(self.workers) if registry and len(registry) > self.chunk_size else None
+        if executor is None:
+            return client.parse_documents(raw_result)
+
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        chunks = [registry[i:i + self.chunk_size] for i in range(0, len(registry), self.chunk_size)]
+        results = await asyncio.gather(*(loop.run_in_executor(executor, _parse_chunk, chunk) for chunk in chunks))
+        documents = [_unpack(row) for rows in results for row in rows]
+        observe_stage("parse", time.perf_counter() - started)
+        return documents
+
+    def shutdown(self) -> None:
+        self._pool.shutdown()
+
+
+# Глобальный экземпляр пула
+parse_pool = ParsePool()
@@ -0,0 +1,155 @@
+import json
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from celery.schedules import schedule
+from app.config import settings
+from app.utils.logger import logger
+from app.utils.redis_client import get_redis
+
+# Москва без перехода на летнее время с 2014 года, tzdata не нужна
+MOSCOW_TZ = timezone(timedelta(hours=3), "Europe/Moscow")
+
+
+class PollScheduler:
+    """
+    Адаптивный интервал опроса СБИС
+
+    В рабочее время интервал - CHECK_INTERVAL_MINUTES, ночью и в выходные -
+    POLL_MAX_INTERVAL_SECONDS. Чем больше новых документов пришло за
+    последние POLL_ARRIVAL_WINDOW_MINUTES, тем чаще опрос; после нового
+    письма от ФНС опрос идет с минимальным интервалом POLL_HIT_BOOST_MINUTES
+    минут. Статистика хранится в Redis, ее пишут воркеры, читает beat.
+    """
+
+    ARRIVALS_KEY = "poll:arrivals"
+    LAST_HIT_KEY = "poll:last_hit"
+    INTERVAL_KEY = "poll:interval"
+    HISTORY_KEY = "poll:interval_history"
+    HISTORY_SIZE = 100
+
+    def __init__(
+            self,
+            min_interval: int = settings.POLL_MIN_INTERVAL_SECONDS,
+            max_interval: int = settings.POLL_MAX_INTERVAL_SECONDS
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+    def record_poll(self, new_documents: int, fns_documents: int) -> None:
+        """Результат опроса: сколько пришло новых документов и сколько из них от ФНС"""
+        now = time.time()
+        window = settings.POLL_ARRIVAL_WINDOW_MINUTES * 60
+        try:
+            redis = get_redis()
+            pipe = redis.pipeline()
+            if new_documents:
+                pipe.zadd(self.ARRIVALS_KEY, {f"{new_documents}:{uuid.uuid4().hex}": now})
+            pipe.zremrangebyscore(self.ARRIVALS_KEY, 0, now - window)
+            pipe.expire(self.ARRIVALS_KEY, window)
+            if fns_documents:
+                pipe.set(self.LAST_HIT_KEY, now)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Не удалось записать статистику опроса: {e}")
+
+    @staticmethod
+    def is_business_hours(now: datetime) -> bool:
+        return (
+            now.weekday() < 5
+            and settings.POLL_BUSINESS_HOURS_START <= now.hour < settings.POLL_BUSINESS_HOURS_END
+        )
+
+    def compute_interval(self, now: Optional[datetime] = None) -> Tuple[int, str]:
+        """Интервал опроса в секундах и причина"""
+        now = now or datetime.now(MOSCOW_TZ)
+        now_ts = now.timestamp()
+        window = settings.POLL_ARRIVAL_WINDOW_MINUTES * 60
+
+        redis = get_redis()
+        last_hit = float(redis.get(self.LAST_HIT_KEY) or 0)
+        arrivals = redis.zrangebyscore(self.ARRIVALS_KEY, now_ts - window, "+inf")
+        arrived = sum(int(member.split(":", 1)[0]) for member in arrivals)
+
+        if now_ts - last_hit < settings.POLL_HIT_BOOST_MINUTES * 60:
+            return self.min_interval, "новое письмо от ФНС"
+
+        if self.is_business_hours(now):
+            base, reason = settings.CHECK_INTERVAL_MINUTES * 60, "рабочее время"
+        else:
+            base, reason = self.max_interval, "нерабочее время"
+
+        # Документы приходят пачками: поток писем ускоряет опрос
+        rate = arrived / (window / 3600)
+        interval = int(base / (1 + rate))
+        if arrived:
+            reason += f", {rate:.1f} док/ч"
+
+        return max(self.min_interval, min(self.max_interval, interval)), reason
+
+    def current_interval(self) -> int:
+        """Пересчет интервала с записью истории изменений"""
+        try:
+            interval, reason = self.compute_interval()
+            redis = get_redis()
+            previous = redis.get(self.INTERVAL_KEY)
+            entry = json.dumps(
+                {"interval_seconds": interval, "reason": reason, "at": datetime.now(MOSCOW_TZ).isoformat()},
+                ensure_ascii=False
+            )
+            if previous is None or json.loads(previous)["interval_seconds"] != interval:
+                logger.info(f"Интервал опроса СБИС: {interval} с ({reason})")
+                pipe = redis.pipeline()
+                pipe.lpush(self.HISTORY_KEY, entry)
+                pipe.ltrim(self.HISTORY_KEY, 0, self.HISTORY_SIZE - 1)
+                pipe.set(self.INTERVAL_KEY, entry)
+                pipe.execute()
+            return interval
+        except Exception as e:
+            logger.warning(f"Адаптивный интервал недоступен, используем CHECK_INTERVAL_MINUTES: {e}")
+            return settings.CHECK_INTERVAL_MINUTES * 60
+
+    def status(self, history_limit: int = 20) -> Dict[str, Any]:
+        """Текущий интервал и история изменений (для /status)"""
+        try:
+            redis = get_redis()
+            current = redis.get(self.INTERVAL_KEY)
+            history: List[Dict[str, Any]] = [
+                json.loads(item) for item in redis.lrange(self.HISTORY_KEY, 0, history_limit - 1)
+            ]
+            return {
+                "current": json.loads(current) if current else None,
+                "min_interval_seconds": self.min_interval,
+                "max_interval_seconds": self.max_interval,
+                "history": history
+            }
+        except Exception as e:
+            return {"current": None, "error": str(e)}
+
+
+class adaptive_schedule(schedule):
+    """
+    Расписание celery beat с интервалом из PollScheduler
+
+    Интервал пересчитывается при каждой проверке beat, поэтому
+    изменение статистики сразу сдвигает следующий запуск.
+    """
+
+    def __init__(self, app=None):
+        super().__init__(run_every=timedelta(seconds=settings.POLL_MIN_INTERVAL_SECONDS), app=app)
+
+    def is_due(self, last_run_at):
+        self.run_every = timedelta(seconds=poll_scheduler.current_interval())
+        return super().is_due(last_run_at)
+
+    def __reduce__(self):
+        # beat сохраняет расписание в shelve
+        return self.__class__, ()
+
+    def __repr__(self):
+        return f"<adaptive_schedule: {self.run_every}>"
+
+
+# Глобальный экземпляр
+poll_scheduler = PollScheduler()
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+from app.config import settings
+from app.utils.logger import logger
+
+# Резервирует токен и возвращает, сколько миллисекунд ждать до него.
+# Токены могут уходить в минус: каждый вызывающий получает свое место
+# в очереди за один запрос к Redis, без повторных опросов.
+TOKEN_BUCKET_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local rate = tonumber(redis.call('HGET', KEYS[1], 'rate')) or tonumber(ARGV[1])
+local burst = math.max(1, rate)
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens')) or burst
+local ts = tonumber(redis.call('HGET', KEYS[1], 'ts')) or now
+
+tokens = math.min(burst, tokens + (now - ts) / 1000 * rate) - 1
+local wait = 0
+if tokens < 0 then
+    wait = math.ceil(-tokens / rate * 1000)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now, 'rate', rate)
+redis.call('PEXPIRE', KEYS[1], ARGV[2])
+return wait
+"""
+
+# AIMD для общей скорости: уменьшение не чаще раза в cooldown,
+# чтобы пачка одновременных 429 не обрушила скорость до минимума
+AIMD_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local rate = tonumber(redis.call('HGET', KEYS[1], 'rate')) or tonumber(ARGV[1])
+local min_rate = tonumber(ARGV[2])
+local max_rate = tonumber(ARGV[3])
+
+if ARGV[4] == 'decrease' then
+    local last = tonumber(redis.call('HGET', KEYS[1], 'decreased_at')) or 0
+    if now - last < tonumber(ARGV[5]) then
+        return tostring(rate)
+    end
+    rate = math.max(min_rate, rate * 0.5)
+    redis.call('HSET', KEYS[1], 'decreased_at', now)
+else
+    rate = math.min(max_rate, rate + max_rate * 0.05)
+end
+
+redis.call('HSET', KEYS[1], 'rate', rate)
+return tostring(rate)
+"""
+
+THROTTLE_STATUSES = {429, 502, 503, 504}
+
+# HTTP 500 СБИС отдает и на ошибки API (авторизация, параметры), и при
+# перегрузке - перегрузкой считается только ответ с таким текстом
+OVERLOAD_MARKERS = ("перегруз", "перегруж", "слишком много запросов", "too many requests", "превышен лимит")
+
+
+def is_overload_error(status: int, body: bytes) -> bool:
+    """Ответ 500 из-за перегрузки СБИС (а не ошибка вызова)"""
+    if status != 500:
+        return False
+    text = body.decode("utf-8", "replace")
+    try:
+        # Ошибка JSON-RPC может прийти с \uXXXX вместо кириллицы
+        text = json.dumps(json.loads(text), ensure_ascii=False)
+    except ValueError:
+        pass
+    text = text.lower()
+    return any(marker in text for marker in OVERLOAD_MARKERS)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Ограничение числа одновременных запросов к СБИС в процессе (AIMD)
+
+    Успешный быстрый ответ увеличивает лимит примерно на 1 за "окно",
+    429/502/503/504 и 500 при перегрузке уменьшают вдвое, медленный
+    ответ - на 10%.
+    """
+
+    def __init__(
+            self,
+            initial: int = settings.SBIS_MAX_CONCURRENCY,
+            min_limit: int = settings.SBIS_MIN_CONCURRENCY,
+            max_limit: int = settings.SBIS_MAX_CONCURRENCY,
+            target_latency: float = settings.SBIS_TARGET_LATENCY_SECONDS
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self._loop = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        # Celery создает новый event loop на каждую задачу
+        loop = asyncio.get_running_loop()
+        if self._condition is None or self._loop is not loop:
+            self._condition = asyncio.Condition()
+            self._loop = loop
+            self.in_flight = 0
+        return self._condition
+
+    async def acquire(self) -> None:
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, throttled: bool, latency: float) -> None:
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight = max(0, self.in_flight - 1)
+
+            if throttled:
+                self.limit = max(self.min_limit, self.limit * 0.5)
+            elif latency > self.target_latency:
+                self.limit = max(self.min_limit, self.limit * 0.9)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            condition.notify_all()
+
+
+class RequestSlot:
+    """Результат запроса, который заполняет вызывающий код"""
+
+    def __init__(self):
+        self.status: Optional[int] = None
+        self.overloaded = False  # 500 с признаком перегрузки (is_overload_error)
+
+
+class SBISRateLimiter:
+    """
+    Общий для всех процессов лимит запросов к СБИС
+
+    Token bucket в Redis с отдельным бюджетом на каждый метод
+    (SBIS_RATE_LIMITS, запросов в секунду). Скорость бюджета
+    адаптируется по ответам (AIMD), конкурентность - локально в процессе.
+    """
+
+    KEY_PREFIX = "sbis:ratelimit:"
+    BUCKET_TTL_MS = 10 * 60 * 1000
+    DECREASE_COOLDOWN_MS = 1000
+
+    def __init__(self, redis=None, concurrency: Optional[AdaptiveConcurrencyLimiter] = None):
+        self.redis = redis
+        self.concurrency = concurrency or sbis_concurrency
+        self._redis_failed = False
+
+    @staticmethod
+    def budget(method: str) -> float:
+        limits = settings.SBIS_RATE_LIMITS
+        return float(limits.get(method, limits.get("default", 5.0)))
+
+    async def acquire(self, method: str) -> None:
+        """Ждет токен для метода"""
+        if self.redis is None:
+            return
+
+        try:
+            wait_ms = await self.redis.eval(
+                TOKEN_BUCKET_SCRIPT, 1, self.KEY_PREFIX + method, self.budget(method), self.BUCKET_TTL_MS
+            )
+        except Exception as e:
+            self._warn_redis(e)
+            return
+
+        if wait_ms:
+            await asyncio.sleep(int(wait_ms) / 1000)
+
+    async def report(self, method: str, throttled: bool) -> None:
+        """Обратная связь для общей скорости метода"""
+        if self.redis is None:
+            return
+
+        budget = self.budget(method)
+        try:
+            rate = await self.redis.eval(
+                AIMD_SCRIPT, 1, self.KEY_PREFIX + method,
+                budget, budget * 0.1, budget, "decrease" if throttled else "increase",
+                self.DECREASE_COOLDOWN_MS
+            )
+            if throttled:
+                logger.warning(f"СБИС ограничивает запросы {method}, скорость снижена до {float(rate):.2f}/с")
+        except Exception as e:
+            self._warn_redis(e)
+
+    @asynccontextmanager
+    async def limit(self, method: str):
+        """Слот для одного запроса: конкурентность + токен + обратная связь"""
+        await self.concurrency.acquire()
+        slot = RequestSlot()
+        started = time.monotonic()
+
+        try:
+            await self.acquire(method)
+            started = time.monotonic()
+            yield slot
+        finally:
+            # Нет статуса - сетевая ошибка или таймаут, считаем перегрузкой
+            throttled = slot.status is None or slot.status in THROTTLE_STATUSES or slot.overloaded
+            latency = time.monotonic() - started
+            await self.concurrency.release(throttled, latency)
+            await self.report(method, throttled)
+
+    def _warn_redis(self, error: Exception) -> None:
+        # Без Redis работаем без общего лимита, предупреждаем один раз
+        if not self._redis_failed:
+            self._redis_failed = True
+            logger.warning(f"Redis недоступен для лимита запросов СБИС: {error}")
+
+
+# Общий на процесс ограничитель конкурентности
+sbis_concurrency = AdaptiveConcurrencyLimiter()
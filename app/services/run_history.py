@@ -0,0 +1,166 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.models.models import ProcessingLog
+from app.utils.metrics import STAGES
+
+PERCENTILES = (0.5, 0.9, 0.99)
+
+
+class RunHistoryService:
+    """
+    Показатели запусков загрузки из ProcessingLog: перцентили и динамика
+
+    Учитываются завершенные успешные запуски (finished_at заполнен).
+    С account_id - только запуски по этой учетной записи СБИС (демон
+    загрузки, догрузка по событиям); общие задачи по всем учетным
+    записям пишут строку без account_id.
+    Сравнение последних recent_days дней с остальным окном показывает
+    регрессии: замедление СБИС (sbis_list_documents), разбора, записи в БД.
+    """
+
+    REGRESSION_RATIO = 1.5
+
+    @staticmethod
+    def _metrics() -> Dict[str, Any]:
+        metrics = {
+            "duration_seconds": ProcessingLog.duration_seconds,
+            "documents_per_second": ProcessingLog.total_documents / func.nullif(ProcessingLog.duration_seconds, 0),
+            "sbis_bytes_received": ProcessingLog.sbis_bytes_received,
+            "rows_inserted": ProcessingLog.rows_inserted,
+            "peak_rss_kb": ProcessingLog.peak_rss_kb,
+        }
+        for stage in STAGES:
+            metrics[f"stage_{stage}_seconds"] = ProcessingLog.stage_durations[stage].as_float()
+        return metrics
+
+    @staticmethod
+    def _base_query(
+            db: Session,
+            since: datetime,
+            until: Optional[datetime],
+            task_name: Optional[str],
+            account_id: Optional[int] = None
+    ):
+        query = db.query(ProcessingLog).filter(
+            ProcessingLog.status == "success",
+            ProcessingLog.finished_at.isnot(None),
+            ProcessingLog.started_at >= since
+        )
+        if until:
+            query = query.filter(ProcessingLog.started_at < until)
+        if task_name:
+            query = query.filter(ProcessingLog.task_name == task_name)
+        if account_id:
+            query = query.filter(ProcessingLog.account_id == account_id)
+        return query
+
+    def percentiles(
+            self,
+            db: Session,
+            since: datetime,
+            until: Optional[datetime] = None,
+            task_name: Optional[str] = None,
+            account_id: Optional[int] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """{task_name: {runs, metric: {p50, p90, p99}}}"""
+        metrics = self._metrics()
+        columns = [ProcessingLog.task_name, func.count(ProcessingLog.id).label("runs")]
+        for name, expression in metrics.items():
+            for q in PERCENTILES:
+                columns.append(func.percentile_cont(q).within_group(expression).label(f"{name}:p{int(q * 100)}"))
+
+        rows = self._base_query(db, since, until, task_name, account_id).with_entities(*columns).group_by(
+            ProcessingLog.task_name
+        ).all()
+
+        result = {}
+        for row in rows:
+            values = row._asdict()
+            entry: Dict[str, Any] = {"runs": values.pop("runs")}
+            values.pop("task_name")
+            for key, value in values.items():
+                name, percentile = key.split(":")
+                entry.setdefault(name, {})[percentile] = round(value, 4) if value is not None else None
+            result[row.task_name or "unknown"] = entry
+        return result
+
+    def trend(
+            self,
+            db: Session,
+            since: datetime,
+            bucket: str = "day",
+            task_name: Optional[str] = None,
+            account_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Медианы по интервалам (hour/day/week) для графиков"""
+        metrics = self._metrics()
+        period = func.date_trunc(bucket, ProcessingLog.started_at).label("period")
+        columns = [period, ProcessingLog.task_name, func.count(ProcessingLog.id).label("runs")]
+        columns += [
+            func.percentile_cont(0.5).within_group(expression).label(name)
+            for name, expression in metrics.items()
+        ]
+        columns.append(func.percentile_cont(0.9).within_group(ProcessingLog.duration_seconds).label("duration_p90"))
+
+        rows = self._base_query(db, since, None, task_name, account_id).with_entities(*columns).group_by(
+            period, ProcessingLog.task_name
+        ).order_by(period).all()
+
+        return [
+            {
+                key: (value.isoformat() if isinstance(value, datetime) else
+                      round(value, 4) if isinstance(value, float) else value)
+                for key, value in row._asdict().items()
+            }
+            for row in rows
+        ]
+
+    def performance(
+            self,
+            db: Session,
+            days: int = 30,
+            recent_days: int = 1,
+            bucket: str = "day",
+            task_name: Optional[str] = None,
+            account_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        now = datetime.now()
+        since = now - timedelta(days=days)
+        recent_since = now - timedelta(days=recent_days)
+
+        baseline = self.percentiles(db, since, recent_since, task_name, account_id)
+        recent = self.percentiles(db, recent_since, None, task_name, account_id)
+
+        # Медиана последних дней против медианы остального окна
+        regressions = []
+        for name, recent_entry in recent.items():
+            baseline_entry = baseline.get(name)
+            if not baseline_entry:
+                continue
+            for metric, values in recent_entry.items():
+                if metric in ("runs", "documents_per_second") or not isinstance(values, dict):
+                    continue
+                before, after = baseline_entry[metric]["p50"], values["p50"]
+                if before and after and after / before >= self.REGRESSION_RATIO:
+                    regressions.append({
+                        "task_name": name,
+                        "metric": metric,
+                        "baseline_p50": before,
+                        "recent_p50": after,
+                        "ratio": round(after / before, 2)
+                    })
+
+        return {
+            "window_days": days,
+            "recent_days": recent_days,
+            "percentiles": self.percentiles(db, since, None, task_name, account_id),
+            "recent": recent,
+            "regressions": sorted(regressions, key=lambda item: item["ratio"], reverse=True),
+            "trend": self.trend(db, since, bucket, task_name, account_id)
+        }
+
+
+# Глобальный экземпляр сервиса
+run_history_service = RunHistoryService()
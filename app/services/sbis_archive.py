@@ -0,0 +1,274 @@
+"""
+Архив сырых ответов СБИС.СписокДокументовПоСобытиям
+
+Каждый успешный ответ дописывается строкой NDJSON в gzip файл раздела:
+SBIS_ARCHIVE_DIR/<учетная запись>/<ДатаС>_<ДатаПо>.ndjson.gz. Строка -
+запрошенный период, страница, размер страницы и ответ целиком. Дозапись
+идет отдельными членами gzip под flock, поэтому файл можно пополнять из
+нескольких процессов и читать обычным gzip.open.
+
+Архив используется для повторной обработки (replay) без сети и, с
+SBIS_ARCHIVE_SERVE_PAST, для загрузки прошедших периодов. Запрошенный
+период не обязан совпадать с архивными (окно загрузки сдвигается каждый
+день): он собирается по дням из разделов, которые пройдены полностью
+(до страницы без ЕстьЕще) и сохранены после окончания своего периода,
+когда документы его дней уже не меняются. Если хоть один день периода
+не покрыт, страница запрашивается у СБИС.
+"""
+import fcntl
+import glob
+import gzip
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from app.config import settings
+from app.utils.logger import logger
+
+# Сколько собранных периодов (записи реестра) держать в памяти для выдачи страниц
+CACHED_PERIODS = 4
+
+
+def _to_date(value) -> date:
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, "%d.%m.%Y").date()
+
+
+def _entry_day(entry: dict) -> Optional[date]:
+    """День записи реестра по Документ.Дата (None - даты нет или формат неизвестен)"""
+    value = (entry.get("Документ") or {}).get("Дата") or ""
+    for fmt in ("%d.%m.%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value[:10], fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+class SBISResponseArchive:
+    def __init__(self, archive_dir: str = settings.SBIS_ARCHIVE_DIR):
+        self.archive_dir = archive_dir
+        # LRU: (учетная запись, ДатаС, ДатаПо) -> (разделы и их mtime, записи реестра или None)
+        self._periods: "OrderedDict[tuple, Tuple[tuple, Optional[List[dict]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _account_key(account_id: Optional[int]) -> str:
+        return f"account_{account_id}" if account_id is not None else "default"
+
+    def partition_path(self, account_id: Optional[int], date_from, date_to) -> str:
+        return os.path.join(
+            self.archive_dir,
+            self._account_key(account_id),
+            f"{_to_date(date_from).isoformat()}_{_to_date(date_to).isoformat()}.ndjson.gz"
+        )
+
+    def append(
+            self,
+            account_id: Optional[int],
+            date_from: str,
+            date_to: str,
+            navigation: Optional[dict],
+            body: bytes,
+            result: Dict[str, Any]
+    ) -> None:
+        """Дописать ответ в раздел периода (ошибки записи только логируются)"""
+        navigation = navigation or {}
+        header = json.dumps({
+            "archived_at": datetime.now().isoformat(),
+            "account_id": account_id,
+            "date_from": _to_date(date_from).isoformat(),
+            "date_to": _to_date(date_to).isoformat(),
+            "page": int(navigation.get("Страница", 0)),
+            "page_size": int(navigation.get("РазмерСтраницы", 0)),
+        }, ensure_ascii=False).encode("utf-8")
+
+        # Тело ответа вставляется как есть, без повторной сериализации
+        response = body.strip()
+        if b"\n" in response:
+            response = json.dumps(result, ensure_ascii=False).encode("utf-8")
+        line = header[:-1] + b', "response": ' + response + b"}\n"
+
+        path = self.partition_path(account_id, date_from, date_to)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "ab") as raw:
+                fcntl.flock(raw, fcntl.LOCK_EX)
+                try:
+                    with gzip.GzipFile(fileobj=raw, mode="ab", compresslevel=6) as f:
+                        f.write(line)
+                finally:
+                    fcntl.flock(raw, fcntl.LOCK_UN)
+        except OSError as e:
+            logger.warning(f"Не удалось записать ответ СБИС в архив {path}: {e}")
+
+    @staticmethod
+    def read_partition(path: str) -> Iterator[Dict[str, Any]]:
+        """Строки раздела; оборванная последняя запись пропускается"""
+        try:
+            with gzip.open(path, "rb") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        logger.warning(f"Поврежденная строка в архиве {path}")
+        except EOFError:
+            logger.warning(f"Архив {path} оборван (запись прервана)")
+
+    def _closed_registry(self, path: str, end: date) -> Optional[List[dict]]:
+        """
+        Записи реестра полного обхода раздела (None - полного обхода нет)
+
+        Учитываются только ответы, сохраненные после последнего дня раздела.
+        Повторная выдача той же страницы - действует последняя.
+        """
+        from app.services.sbis_client import SBISClient
+
+        pages_by_size: Dict[int, Dict[int, dict]] = {}
+        for entry in self.read_partition(path):
+            if datetime.fromisoformat(entry["archived_at"]).date() <= end:
+                continue
+            pages_by_size.setdefault(entry["page_size"], {})[entry["page"]] = entry["response"]
+
+        for pages in pages_by_size.values():
+            registry = []
+            for page in range(len(pages)):
+                response = pages.get(page)
+                if response is None:
+                    break
+                page_registry = (response.get("result") or {}).get("Реестр") or []
+                registry.extend(page_registry)
+                if not page_registry or not SBISClient.has_more(response):
+                    return registry
+        return None
+
+    def _collect(self, partitions: List[Tuple[str, date, date]], date_from: date, date_to: date) -> Optional[List[dict]]:
+        """Записи реестра за период по дням из полных разделов (None - не все дни покрыты)"""
+        covered = set()
+        entries: Dict[str, Tuple[date, dict]] = {}
+        for path, start, end in partitions:
+            registry = self._closed_registry(path, end)
+            if registry is None:
+                continue
+            days = [_entry_day(entry) for entry in registry]
+            if None in days:
+                logger.warning(f"Раздел архива {path} не используется: записи без даты")
+                continue
+
+            covered.update(start + timedelta(days=offset) for offset in range((end - start).days + 1))
+            for day, entry in zip(days, registry):
+                if date_from <= day <= date_to:
+                    # Пересекающиеся разделы содержат одни и те же записи
+                    entries.setdefault(json.dumps(entry, ensure_ascii=False, sort_keys=True), (day, entry))
+
+        if any(date_from + timedelta(days=offset) not in covered for offset in range((date_to - date_from).days + 1)):
+            return None
+        # Порядок устойчив между вызовами: по дню, внутри дня - по порядку в архиве
+        return [entry for _, entry in sorted(entries.values(), key=lambda item: item[0])]
+
+    def _period(self, account_id: Optional[int], date_from: date, date_to: date) -> Optional[List[dict]]:
+        """Записи реестра за период, кэш до изменения файлов разделов"""
+        partitions = list(self._overlapping(account_id, date_from, date_to))
+        signature = tuple((path, os.path.getmtime(path)) for path, _, _ in partitions)
+        key = (account_id, date_from, date_to)
+        with self._lock:
+            cached = self._periods.get(key)
+            if cached and cached[0] == signature:
+                self._periods.move_to_end(key)
+                return cached[1]
+
+        registry = self._collect(partitions, date_from, date_to)
+
+        with self._lock:
+            self._periods[key] = (signature, registry)
+            while len(self._periods) > CACHED_PERIODS:
+                self._periods.popitem(last=False)
+        return registry
+
+    def page(
+            self,
+            account_id: Optional[int],
+            date_from: date,
+            date_to: date,
+            page: int,
+            page_size: int
+    ) -> Optional[Dict[str, Any]]:
+        """Ответ на страницу, собранный из архива, или None"""
+        registry = self._period(account_id, date_from, date_to)
+        if registry is None:
+            return None
+
+        start = page * page_size
+        return {
+            "jsonrpc": "2.0",
+            "result": {
+                "Реестр": registry[start:start + page_size],
+                "Навигация": {
+                    "Страница": str(page),
+                    "РазмерСтраницы": str(page_size),
+                    "ЕстьЕще": "Да" if start + page_size < len(registry) else "Нет"
+                }
+            },
+            "id": 1
+        }
+
+    def _overlapping(self, account_id: Optional[int], date_from: date, date_to: date) -> Iterator[Tuple[str, date, date]]:
+        pattern = os.path.join(self.archive_dir, self._account_key(account_id), "*.ndjson.gz")
+        for path in sorted(glob.glob(pattern)):
+            name = os.path.basename(path)[:-len(".ndjson.gz")]
+            try:
+                start, end = (date.fromisoformat(part) for part in name.split("_"))
+            except ValueError:
+                continue
+            if start <= date_to and end >= date_from:
+                yield path, start, end
+
+    def partitions(self, account_id: Optional[int], date_from: date, date_to: date) -> Iterator[str]:
+        """Разделы учетной записи, пересекающиеся с периодом, по дате начала"""
+        for path, _, _ in self._overlapping(account_id, date_from, date_to):
+            yield path
+
+    def replay(self, db, account_id: Optional[int], date_from: date, date_to: date) -> Dict[str, Any]:
+        """
+        Повторная обработка архива: разбор, классификация и запись как при загрузке
+
+        Страницы разделов за период проходят тот же путь, что и ответы СБИС
+        (parse_documents -> save_documents), по commit на страницу.
+        """
+        from app.services.event_bus import publish_documents
+        from app.services.fns_filter import FNSFilterService
+        from app.services.sbis_client import SBISClient
+
+        client = SBISClient()
+        result = {"partitions": 0, "pages": 0, "total_documents": 0, "new_documents": 0, "fns_documents": 0}
+
+        for path in self.partitions(account_id, date_from, date_to):
+            pages = {}
+            for entry in self.read_partition(path):
+                pages[(entry["page_size"], entry["page"])] = entry["response"]
+
+            result["partitions"] += 1
+            for key in sorted(pages):
+                documents = client.parse_documents(pages[key])
+                saved = FNSFilterService.save_documents(db, documents, source="replay", account_id=account_id)
+                db.commit()
+                publish_documents(saved["created"])
+
+                result["pages"] += 1
+                result["total_documents"] += saved["total_documents"]
+                result["new_documents"] += saved["new_documents"]
+                result["fns_documents"] += saved["fns_documents"]
+
+        logger.info(
+            f"Повтор архива СБИС ({self._account_key(account_id)}, {date_from} - {date_to}): "
+            f"разделов {result['partitions']}, страниц {result['pages']}, "
+            f"документов {result['total_documents']}, новых {result['new_documents']}"
+        )
+        return result
+
+
+# Глобальный экземпляр архива
+sbis_archive = SBISResponseArchive()
@@ -1,31 +1,103 @@
 import aiohttp
 import asyncio
-from datetime import datetime, timedelta
+import json
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urljoin
+from datetime import date, datetime, timedelta
 import logging
 from typing import List, Dict, Any, Optional
 from app.config import settings
+from app.services.accounts import account_service
 from app.services.common import DocumentProcessor
+from app.services.document_record import AttachmentRecord, DocumentRecord
+from app.services.rate_limiter import SBISRateLimiter, THROTTLE_STATUSES, is_overload_error
+from app.services.sbis_archive import sbis_archive
+from app.services.sbis_stream import PrefixedStream, RegistryDecoder
+from app.utils.redis_client import create_async_redis
+from app.utils.metrics import (
+    SBIS_ERRORS, SBIS_REQUEST_SECONDS, SBIS_REQUESTS, SBIS_RETRIES, observe_stage, stage_timer
+)
+from app.utils.run_stats import record_sbis_bytes
 
 
 class SBISClient:
-    def __init__(self, timeout: int = 30):
-        self.login = settings.SBIS_LOGIN
-        self.password = settings.SBIS_PASSWORD
+    def __init__(self, timeout: int = 30, account=None):
+        """account - учетная запись SBISAccount, без нее используются SBIS_LOGIN/SBIS_PASSWORD"""
+        self.account_id = account.id if account is not None else None
+        self.login = account.login if account is not None else settings.SBIS_LOGIN
+        self.password = account_service.password(account) if account is not None else settings.SBIS_PASSWORD
         self.auth_url = settings.SBIS_AUTH_URL
         self.service_url = settings.SBIS_SERVICE_URL
         self.timeout = timeout
         self.session = None
         self.session_id = None
+        self.redis = None
+        self.rate_limiter = SBISRateLimiter()
         self.logger = logging.getLogger(__name__)
 
     async def __aenter__(self):
         timeout = aiohttp.ClientTimeout(total=self.timeout)
         self.session = aiohttp.ClientSession(timeout=timeout)
+        self.redis = create_async_redis()
+        self.rate_limiter = SBISRateLimiter(self.redis)
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         if self.session:
             await self.session.close()
+        if self.redis:
+            await self.redis.aclose()
+
+    @asynccontextmanager
+    async def _post(self, url: str, payload: dict, headers: Optional[dict] = None):
+        """
+        JSON-RPC запрос через общий лимит запросов
+
+        При 429/502/503/504 и 500 с признаком перегрузки запрос
+        повторяется (с учетом Retry-After) до SBIS_MAX_ATTEMPTS раз,
+        вызывающий код получает последний ответ. Остальные 500 - ошибки
+        вызова, они возвращаются сразу.
+        """
+        method = payload.get("method", "default")
+        attempt = 0
+        started = time.perf_counter()
+
+        while True:
+            attempt += 1
+            try:
+                async with self.rate_limiter.limit(method) as slot:
+                    async with self.session.post(url, json=payload, headers=headers) as response:
+                        slot.status = response.status
+                        if response.status == 500:
+                            # Тело остается доступным вызывающему коду (кэшируется aiohttp)
+                            slot.overloaded = is_overload_error(response.status, await response.read())
+                        SBIS_REQUESTS.labels(sbis_method=method, status=str(response.status)).inc()
+                        throttled = response.status in THROTTLE_STATUSES or slot.overloaded
+                        if not throttled or attempt >= settings.SBIS_MAX_ATTEMPTS:
+                            SBIS_REQUEST_SECONDS.labels(sbis_method=method).observe(time.perf_counter() - started)
+                            if response.status != 200:
+                                SBIS_ERRORS.labels(sbis_method=method, reason="http").inc()
+                            yield response
+                            return
+
+                        delay = self._retry_delay(response, attempt)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                SBIS_ERRORS.labels(sbis_method=method, reason="exception").inc()
+                raise
+
+            SBIS_RETRIES.labels(sbis_method=method).inc()
+            self.logger.warning(
+                f"{method}: HTTP {response.status}, повтор {attempt}/{settings.SBIS_MAX_ATTEMPTS} через {delay:.1f} с"
+            )
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _retry_delay(response: aiohttp.ClientResponse, attempt: int) -> float:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), 60.0)
+        return float(2 ** attempt)
 
     async def authenticate(self) -> bool:
         """Авторизация в СБИС"""
@@ -37,73 +109,210 @@ class SBISClient:
         }
 
         try:
-            async with self.session.post(self.auth_url, json=auth_data) as response:
-                self.logger.info(f"Запрос авторизации отправлен на {self.auth_url}")
-                self.logger.info(f"Статус ответа: {response.status}")
-                if response.status != 200:
-                    error_text = await response.text()
-                    self.logger.error(f"HTTP ошибка авторизации: {response.status}")
-                    self.logger.error(f"HTTP ошибка авторизации: {response.status}, текст: {error_text}")
-                    return False
-
-                result = await response.json()
-                self.logger.info(f"Ответ API: {result}")
+            with stage_timer("sbis_auth"):
+                async with self._post(self.auth_url, auth_data) as response:
+                    self.logger.info(f"Запрос авторизации отправлен на {self.auth_url}")
+                    self.logger.info(f"Статус ответа: {response.status}")
+                    if response.status != 200:
+                        error_text = await response.text()
+                        self.logger.error(f"HTTP ошибка авторизации: {response.status}")
+                        self.logger.error(f"HTTP ошибка авторизации: {response.status}, текст: {error_text}")
+                        return False
+
+                    result = await response.json()
+                    self.logger.info(f"Ответ API: {result}")
+
+                    if 'error' in result:
+                        SBIS_ERRORS.labels(sbis_method=auth_data["method"], reason="api").inc()
+                        self.logger.error(f"Ошибка авторизации: {result['error']}")
+                        return False
+
+                    self.session_id = result.get('result')
+                    if self.session_id:
+                        self.logger.info(f"Сессия: {self.session_id[:10]}...")
+                        return True
 
-                if 'error' in result:
-                    self.logger.error(f"Ошибка авторизации: {result['error']}")
                     return False
 
-                self.session_id = result.get('result')
-                if self.session_id:
-                    self.logger.info(f"Сессия: {self.session_id[:10]}...")
-                    return True
-
-                return False
-
         except Exception as e:
             self.logger.error(f"Исключение при авторизации: {str(e)}")
             return False
 
     async def get_documents_raw(self, days_back: int = 7) -> dict:
         """Получение сырых данных документов БЕЗ пагинации (как в рабочем коде)"""
+        date_to = datetime.now().strftime("%d.%m.%Y")
+        date_from = (datetime.now() - timedelta(days=days_back)).strftime("%d.%m.%Y")
+
+        return await self._list_documents(date_from, date_to)
+
+    async def get_documents_page(self, date_from: date, date_to: date, page: int = 0, page_size: int = 100) -> dict:
+        """Получение одной страницы реестра за период (даты включительно)"""
+        if settings.SBIS_ARCHIVE_SERVE_PAST and date_to < date.today():
+            # Прошедшие дни не меняются - страница из архива, если период в нем покрыт
+            archived = sbis_archive.page(self.account_id, date_from, date_to, page, page_size)
+            if archived is not None:
+                return archived
+
+        navigation = {"Страница": str(page), "РазмерСтраницы": str(page_size)}
+        return await self._list_documents(
+            date_from.strftime("%d.%m.%Y"), date_to.strftime("%d.%m.%Y"), navigation
+        )
+
+    @staticmethod
+    def has_more(raw_result: dict) -> bool:
+        """Есть ли следующая страница реестра"""
+        navigation = (raw_result.get("result") or {}).get("Навигация") or {}
+        return str(navigation.get("ЕстьЕще", "")).lower() in ("да", "true", "1")
+
+    async def _list_documents(self, date_from: str, date_to: str, navigation: Optional[dict] = None) -> dict:
+        """Вызов СБИС.СписокДокументовПоСобытиям, при ошибке возвращает {}"""
         if not self.session_id:
             if not await self.authenticate():
                 return {}
 
-        date_to = datetime.now().strftime("%d.%m.%Y")
-        date_from = (datetime.now() - timedelta(days=days_back)).strftime("%d.%m.%Y")
+        params = {
+            "Фильтр": {"ДатаС": date_from, "ДатаПо": date_to, "ТипРеестра": "Входящие"}
+        }
+        if navigation:
+            params["Фильтр"]["Навигация"] = navigation
 
         docs_data = {
             "jsonrpc": "2.0",
             "method": "СБИС.СписокДокументовПоСобытиям",
-            "params": {
-                "Фильтр": {"ДатаС": date_from, "ДатаПо": date_to, "ТипРеестра": "Входящие"}
-            },
+            "params": params,
             "id": 1
         }
 
         headers = {"X-SBISSessionID": self.session_id}
 
         try:
-            async with self.session.post(self.service_url, json=docs_data, headers=headers) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    self.logger.error(f"HTTP ошибка: {response.status}, {error_text}")
-                    return {}
-
-                result = await response.json()
-
-                if 'error' in result:
-                    self.logger.error(f"Ошибка API: {result['error']}")
-                    return {}
+            started = time.perf_counter()
+            decode_seconds = 0.0
+            body = None
+            try:
+                async with self._post(self.service_url, docs_data, headers=headers) as response:
+                    if response.status != 200:
+                        error_text = await response.text()
+                        self.logger.error(f"HTTP ошибка: {response.status}, {error_text}")
+                        return {}
+
+                    stream_decode = self._stream_decode(response)
+                    stream = response.content
+                    if stream_decode is None:
+                        # Размер неизвестен (сжатие, chunked): читаем до порога,
+                        # короткий ответ разбирается целиком, длинный - потоково
+                        try:
+                            body = await stream.readexactly(settings.SBIS_STREAM_DECODE_MIN_BYTES)
+                        except asyncio.IncompleteReadError as e:
+                            body, stream_decode = e.partial, False
+                        else:
+                            stream, body, stream_decode = PrefixedStream(body, stream), None, True
+
+                    if stream_decode:
+                        # Разбор идет по мере чтения: этапу json_decode - время без ожидания сети
+                        decoder = RegistryDecoder(stream)
+                        decode_started = time.perf_counter()
+                        result = await decoder.decode()
+                        decode_seconds = time.perf_counter() - decode_started - decoder.wait_seconds
+                        record_sbis_bytes(decoder.bytes_read)
+                    else:
+                        if body is None:
+                            body = await response.read()
+                        record_sbis_bytes(len(body))
+            finally:
+                observe_stage("sbis_list_documents", time.perf_counter() - started - decode_seconds)
+
+            if body is not None:
+                with stage_timer("json_decode"):
+                    result = json.loads(body)
+            else:
+                observe_stage("json_decode", decode_seconds)
+
+            if 'error' in result:
+                SBIS_ERRORS.labels(sbis_method=docs_data["method"], reason="api").inc()
+                self.logger.error(f"Ошибка API: {result['error']}")
+                return {}
 
-                return result
+            if settings.SBIS_ARCHIVE_ENABLED:
+                sbis_archive.append(self.account_id, date_from, date_to, navigation, body, result)
+            return result
 
         except Exception as e:
             self.logger.error(f"Исключение при получении документов: {str(e)}")
             return {}
 
-    def parse_documents(self, raw_result: dict) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _stream_decode(response: aiohttp.ClientResponse):
+        """
+        Разбирать ли ответ потоково (RegistryDecoder)
+
+        Архиву нужно тело целиком. Размер известен только без сжатия
+        (Content-Length) - тогда ответ сразу сравнивается с порогом
+        SBIS_STREAM_DECODE_MIN_BYTES. None - размер неизвестен, решение
+        принимается после чтения начала тела до порога.
+        """
+        if not settings.SBIS_STREAM_DECODE or settings.SBIS_ARCHIVE_ENABLED:
+            return False
+        if response.content_length is None or response.headers.get("Content-Encoding"):
+            return None
+        return response.content_length >= settings.SBIS_STREAM_DECODE_MIN_BYTES
+
+    async def read_document(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """СБИС.ПрочитатьДокумент: один документ по идентификатору, при ошибке None"""
+        if not self.session_id:
+            if not await self.authenticate():
+                return None
+
+        payload = {
+            "jsonrpc": "2.0",
+            "method": "СБИС.ПрочитатьДокумент",
+            "params": {"Документ": {"Идентификатор": document_id}},
+            "id": 1
+        }
+        headers = {"X-SBISSessionID": self.session_id}
+
+        try:
+            async with self._post(self.service_url, payload, headers=headers) as response:
+                if response.status != 200:
+                    self.logger.error(f"HTTP ошибка чтения документа {document_id}: {response.status}")
+                    return None
+
+                body = await response.read()
+                record_sbis_bytes(len(body))
+                result = json.loads(body)
+                if 'error' in result:
+                    SBIS_ERRORS.labels(sbis_method=payload["method"], reason="api").inc()
+                    self.logger.error(f"Ошибка API при чтении документа {document_id}: {result['error']}")
+                    return None
+
+                return result.get("result") or None
+
+        except Exception as e:
+            self.logger.error(f"Исключение при чтении документа {document_id}: {str(e)}")
+            return None
+
+    @asynccontextmanager
+    async def open_file(self, url: str, offset: int = 0):
+        """
+        Открывает поток файла вложения
+
+        Используется как `async with client.open_file(url) as response`.
+        При offset > 0 запрашивается докачка с указанной позиции (Range).
+        Загрузки учитываются в общем лимите запросов (метод "file"),
+        конкурентность ограничивает сам загрузчик.
+        """
+        headers = {"X-SBISSessionID": self.session_id} if self.session_id else {}
+        if offset > 0:
+            headers["Range"] = f"bytes={offset}-"
+
+        await self.rate_limiter.acquire("file")
+
+        # Для загрузки файлов общий таймаут сессии не подходит
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=self.timeout)
+        async with self.session.get(urljoin(settings.SBIS_BASE_URL, url), headers=headers, timeout=timeout) as response:
+            yield response
+
+    def parse_documents(self, raw_result: dict) -> List[DocumentRecord]:
         """Парсинг документов из сырого ответа"""
         documents = []
 
@@ -118,49 +327,71 @@ class SBISClient:
         registry = result_data["Реестр"]
         self.logger.info(f"Найдено записей в реестре: {len(registry)}")
 
-        for doc_entry in registry:
-            document = doc_entry.get("Документ", {})
-            if not document:
-                continue
-
-            # Извлекаем ИНН контрагента
-            kontragent = document.get("Контрагент", {})
-            inn = None
-            if "СвЮЛ" in kontragent and "ИНН" in kontragent["СвЮЛ"]:
-                inn = kontragent["СвЮЛ"]["ИНН"]
-            elif "СвФЛ" in kontragent and "ИНН" in kontragent["СвФЛ"]:
-                inn = kontragent["СвФЛ"]["ИНН"]
-
-            # Извлекаем вложения
-            attachments = document.get("Вложение", [])
-            attachment_names = []
-            if attachments:
-                for att in attachments:
-                    if isinstance(att, dict) and "Название" in att:
-                        attachment_names.append(att["Название"])
-
-            # Парсим дату с помощью общего метода
-            date_str = document.get("Дата", "")
-            parsed_date = DocumentProcessor.parse_date(date_str)
-
-            # Формируем структуру документа
-            parsed_doc = {
-                "external_id": f"{document.get('Дата', '')}_{document.get('Название', '')}_{inn or 'no_inn'}",
-                "date": parsed_date,
-                "subject": document.get("Название", ""),
-                "sender_inn": inn,
-                "sender_name": kontragent.get("Название", ""),
-                "filename": attachment_names[0] if attachment_names else "",
-                "has_attachment": len(attachments) > 0,
-                "attachments": attachment_names
-            }
-
-            documents.append(parsed_doc)
+        with stage_timer("parse"):
+            for doc_entry in registry:
+                parsed_doc = self.parse_document(doc_entry.get("Документ", {}))
+                if parsed_doc:
+                    documents.append(parsed_doc)
 
         self.logger.info(f"Распарсено документов: {len(documents)}")
         return documents
 
-    async def get_fns_documents(self, days_back: int = 7) -> List[Dict[str, Any]]:
+    def parse_document(self, document: Dict[str, Any]) -> Optional[DocumentRecord]:
+        """Парсинг одного документа (запись реестра или ответ ПрочитатьДокумент)"""
+        if not document:
+            return None
+
+        # Извлекаем ИНН контрагента
+        kontragent = document.get("Контрагент", {})
+        inn = None
+        if "СвЮЛ" in kontragent and "ИНН" in kontragent["СвЮЛ"]:
+            inn = kontragent["СвЮЛ"]["ИНН"]
+        elif "СвФЛ" in kontragent and "ИНН" in kontragent["СвФЛ"]:
+            inn = kontragent["СвФЛ"]["ИНН"]
+
+        # Извлекаем вложения
+        attachments = document.get("Вложение", [])
+        attachment_details = []
+        if attachments:
+            for att in attachments:
+                if isinstance(att, dict) and "Название" in att:
+                    attachment_details.append(self.parse_attachment(att))
+
+        # Парсим дату с помощью общего метода
+        date_str = document.get("Дата", "")
+        parsed_date = DocumentProcessor.parse_date(date_str)
+
+        # Формируем запись документа
+        return DocumentRecord(
+            external_id=f"{document.get('Дата', '')}_{document.get('Название', '')}_{inn or 'no_inn'}",
+            date=parsed_date,
+            subject=document.get("Название", ""),
+            sender_inn=inn,
+            sender_name=kontragent.get("Название", ""),
+            filename=attachment_details[0].name if attachment_details else "",
+            has_attachment=len(attachments) > 0,
+            attachment_details=tuple(attachment_details)
+        )
+
+    @staticmethod
+    def parse_attachment(attachment: Dict[str, Any]) -> AttachmentRecord:
+        """Извлечение метаданных вложения"""
+        file_info = attachment.get("Файл") or {}
+        size = file_info.get("Размер") or attachment.get("Размер")
+        try:
+            size = int(size) if size not in (None, "") else None
+        except (TypeError, ValueError):
+            size = None
+
+        return AttachmentRecord(
+            name=attachment.get("Название", ""),
+            size=size,
+            type=attachment.get("Тип") or None,
+            sbis_id=attachment.get("Идентификатор") or None,
+            url=file_info.get("Ссылка") or attachment.get("Ссылка") or None
+        )
+
+    async def get_fns_documents(self, days_back: int = 7) -> List[DocumentRecord]:
         """Получение документов от ФНС"""
         try:
             # Получаем все документы
@@ -176,7 +407,7 @@ class SBISClient:
             self.logger.error(f"Ошибка получения документов ФНС: {str(e)}")
             return []
 
-    async def get_all_documents(self, days_back: int = 7) -> List[Dict[str, Any]]:
+    async def get_all_documents(self, days_back: int = 7) -> List[DocumentRecord]:
         """Получение ВСЕХ документов (без пагинации, как в рабочем коде)"""
         try:
             # Получаем сырые данные
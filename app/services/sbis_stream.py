@@ -0,0 +1,157 @@
+"""
+Потоковый разбор ответа СБИС.СписокДокументовПоСобытиям
+
+Тело ответа читается частями (ijson), записи Реестр собираются по одной
+и только из полей, которые использует SBISClient.parse_document:
+остальные поддеревья (Состояние, Редакция, лишние поля Контрагент и
+вложений) пропускаются, не превращаясь в объекты Python. Пиковая память
+- одна запись реестра плюс буфер чтения, а не весь ответ целиком.
+"""
+import sys
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import ijson
+
+REGISTRY_ITEM = "result.Реестр.item"
+NAVIGATION = "result.Навигация"
+ERROR = "error"
+
+# Пути от записи реестра: нужные значения и контейнеры, в которых они лежат
+DOCUMENT_FIELDS = frozenset({
+    "Документ.Дата",
+    "Документ.Название",
+    "Документ.Контрагент.Название",
+    "Документ.Контрагент.СвЮЛ.ИНН",
+    "Документ.Контрагент.СвФЛ.ИНН",
+    "Документ.Вложение.item.Название",
+    "Документ.Вложение.item.Тип",
+    "Документ.Вложение.item.Идентификатор",
+    "Документ.Вложение.item.Размер",
+    "Документ.Вложение.item.Ссылка",
+    "Документ.Вложение.item.Файл.Размер",
+    "Документ.Вложение.item.Файл.Ссылка",
+})
+DOCUMENT_CONTAINERS = frozenset(
+    ".".join(field.split(".")[:depth]) for field in DOCUMENT_FIELDS for depth in range(1, field.count(".") + 1)
+)
+
+READ_SIZE = 64 * 1024
+
+
+class PrefixedStream:
+    """Поток тела, начало которого уже прочитано (head), затем остаток stream"""
+
+    def __init__(self, head: bytes, stream):
+        self.head = head
+        self.stream = stream
+
+    async def read(self, size: int = -1) -> bytes:
+        if not self.head:
+            return await self.stream.read(size)
+        if size < 0:
+            chunk, self.head = self.head, b""
+            return chunk + await self.stream.read()
+        chunk, self.head = self.head[:size], self.head[size:]
+        return chunk
+
+
+class _TimedReader:
+    """Чтение тела ответа с учетом байтов и времени ожидания сети"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+        self.wait_seconds = 0.0
+
+    async def read(self, size: int = -1) -> bytes:
+        started = time.perf_counter()
+        chunk = await self.stream.read(size)
+        self.wait_seconds += time.perf_counter() - started
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+class RegistryDecoder:
+    """
+    `async for entry in decoder.entries(): ...` - записи Реестр по одной,
+    `await decoder.decode()` - ответ целиком
+
+    После прохода доступны navigation (Навигация), error (ошибка JSON-RPC),
+    bytes_read и wait_seconds - время ожидания данных от сети.
+    """
+
+    def __init__(self, stream, read_size: int = READ_SIZE):
+        self.reader = _TimedReader(stream)
+        self.read_size = read_size
+        self.navigation: Dict[str, Any] = {}
+        self.error: Optional[Any] = None
+
+    @property
+    def bytes_read(self) -> int:
+        return self.reader.bytes_read
+
+    @property
+    def wait_seconds(self) -> float:
+        return self.reader.wait_seconds
+
+    async def entries(self) -> AsyncIterator[Dict[str, Any]]:
+        builder = None  # запись реестра, навигация или ошибка в сборке
+        target = None
+        skip_depth = 0  # > 0 - внутри пропускаемого поддерева
+        skip_next = False  # следующее значение относится к ненужному ключу
+        keys: Dict[tuple, str] = {}  # (prefix, ключ) -> ключ или "" для пропуска
+
+        async for prefix, event, value in ijson.parse_async(
+                self.reader, buf_size=self.read_size, use_float=True
+        ):
+            if builder is None:
+                if prefix == REGISTRY_ITEM and event == "start_map" or prefix in (NAVIGATION, ERROR):
+                    builder, target = ijson.ObjectBuilder(), prefix
+                else:
+                    continue
+
+            if skip_next or skip_depth:
+                skip_next = False
+                if event in ("start_map", "start_array"):
+                    skip_depth += 1
+                elif event in ("end_map", "end_array"):
+                    skip_depth -= 1
+                continue
+
+            if target == REGISTRY_ITEM and event == "map_key":
+                key = keys.get((prefix, value))
+                if key is None:
+                    path = f"{prefix}.{value}"[len(REGISTRY_ITEM) + 1:]
+                    wanted = path in DOCUMENT_FIELDS or path in DOCUMENT_CONTAINERS
+                    # Ключи одинаковы во всех записях - одна строка на ключ, как у json.loads
+                    key = keys[(prefix, value)] = sys.intern(value) if wanted else ""
+                if not key:
+                    skip_next = True
+                    continue
+                value = key
+
+            builder.event(event, value)
+
+            # Собираемый объект закрылся (или на его месте скаляр)
+            if prefix == target and event not in ("start_map", "start_array", "map_key"):
+                if target == REGISTRY_ITEM:
+                    yield builder.value
+                elif target == NAVIGATION:
+                    self.navigation = builder.value
+                else:
+                    self.error = builder.value
+                builder = target = None
+
+    async def decode(self) -> Dict[str, Any]:
+        """
+        Ответ целиком в виде {"result": {"Реестр": [...], "Навигация": {...}}}
+
+        Формат тот же, что у json.loads полного ответа, но записи реестра
+        содержат только поля для parse_document. При ошибке JSON-RPC
+        возвращается {"error": ...}.
+        """
+        registry: List[Dict[str, Any]] = [entry async for entry in self.entries()]
+        if self.error is not None:
+            return {"error": self.error}
+        return {"result": {"Реестр": registry, "Навигация": self.navigation}}
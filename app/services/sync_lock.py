@@ -0,0 +1,159 @@
+import threading
+import uuid
+from datetime import date, timedelta
+from typing import Optional, Tuple
+from celery.result import AsyncResult
+from app.config import settings
+from app.utils.logger import logger
+from app.utils.redis_client import get_redis
+
+# Снять/продлить блокировку может только ее владелец
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+EXTEND_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class SyncLock:
+    """
+    Блокировка синхронизации с арендой (single-flight)
+
+    Ключ - тип синхронизации и период, значение - task_id владельца.
+    Пока задача работает, фоновый поток продлевает аренду; если воркер
+    упал, блокировка освобождается сама через SYNC_LOCK_LEASE_SECONDS.
+    При недоступном Redis блокировка не мешает работе (fail-open).
+    """
+
+    KEY_PREFIX = "sync:lock:"
+
+    def __init__(self, sync_type: str, days_back: int, lease_seconds: int = settings.SYNC_LOCK_LEASE_SECONDS):
+        date_to = date.today()
+        date_from = date_to - timedelta(days=days_back)
+        self.key = f"{self.KEY_PREFIX}{sync_type}:{date_from.isoformat()}:{date_to.isoformat()}"
+        self.lease_ms = lease_seconds * 1000
+        self.owner: Optional[str] = None
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def acquire(self, owner: str, heartbeat: bool = False, lease_seconds: Optional[int] = None) -> bool:
+        """
+        Захват блокировки (True и если она уже принадлежит owner)
+
+        lease_seconds - аренда вместо обычной, например на время
+        ожидания задачи в очереди.
+        """
+        lease_ms = lease_seconds * 1000 if lease_seconds else self.lease_ms
+        try:
+            redis = get_redis()
+            acquired = bool(redis.set(self.key, owner, nx=True, px=lease_ms))
+            if not acquired and redis.get(self.key) == owner:
+                acquired = bool(redis.eval(EXTEND_SCRIPT, 1, self.key, owner, lease_ms))
+        except Exception as e:
+            logger.warning(f"Redis недоступен, синхронизация {self.key} без блокировки: {e}")
+            acquired = True
+
+        if acquired:
+            self.owner = owner
+            if heartbeat:
+                self._start_heartbeat()
+
+        return acquired
+
+    def holder(self) -> Optional[str]:
+        """task_id текущего владельца"""
+        try:
+            return get_redis().get(self.key)
+        except Exception:
+            return None
+
+    def release(self) -> None:
+        self._stop_heartbeat()
+
+        if self.owner:
+            try:
+                get_redis().eval(RELEASE_SCRIPT, 1, self.key, self.owner)
+            except Exception as e:
+                logger.warning(f"Не удалось снять блокировку {self.key}: {e}")
+            self.owner = None
+
+    def hand_off(self, lease_seconds: int = settings.SYNC_LOCK_HANDOFF_SECONDS) -> None:
+        """
+        Оставить блокировку за owner до продолжения задачи
+
+        Heartbeat останавливается, аренда продлевается на время ожидания
+        в очереди; продолжение с тем же task_id снова захватит блокировку.
+        """
+        self._stop_heartbeat()
+
+        if self.owner:
+            try:
+                get_redis().eval(EXTEND_SCRIPT, 1, self.key, self.owner, lease_seconds * 1000)
+            except Exception as e:
+                logger.warning(f"Не удалось продлить блокировку {self.key}: {e}")
+            self.owner = None
+
+    def _stop_heartbeat(self) -> None:
+        if self._heartbeat:
+            self._stop.set()
+            self._heartbeat.join(timeout=5)
+            self._heartbeat = None
+
+    def _start_heartbeat(self) -> None:
+        self._stop.clear()
+        interval = self.lease_ms / 1000 / 3
+
+        def beat():
+            while not self._stop.wait(interval):
+                try:
+                    if not get_redis().eval(EXTEND_SCRIPT, 1, self.key, self.owner, self.lease_ms):
+                        logger.warning(f"Блокировка {self.key} потеряна")
+                        return
+                except Exception as e:
+                    logger.warning(f"Не удалось продлить блокировку {self.key}: {e}")
+
+        self._heartbeat = threading.Thread(target=beat, name="sync-lock-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+
+def enqueue_single_flight(task, sync_type: str, days_back: int, args: tuple = (), **options) -> Tuple[AsyncResult, bool]:
+    """
+    Запуск синхронизации, если такая же еще не выполняется
+
+    Возвращает (результат, запущена_новая). Если синхронизация с тем же
+    типом и периодом уже идет, возвращается результат идущей задачи,
+    к которому можно присоединиться через .get().
+
+    Блокировка берется на время ожидания в очереди
+    (SYNC_LOCK_HANDOFF_SECONDS), при старте задача перехватывает ее со
+    своим task_id и продлевает heartbeat'ом. Задача, не начавшаяся за это
+    время, отбрасывается (expires): после истечения аренды могла быть
+    поставлена следующая, и обе выполнились бы.
+    """
+    lock = SyncLock(sync_type, days_back)
+    options.setdefault("expires", settings.SYNC_LOCK_HANDOFF_SECONDS)
+
+    for _ in range(2):
+        task_id = str(uuid.uuid4())
+        if lock.acquire(task_id, lease_seconds=settings.SYNC_LOCK_HANDOFF_SECONDS):
+            try:
+                return task.apply_async(args=args, task_id=task_id, **options), True
+            except Exception:
+                lock.release()
+                raise
+
+        holder = lock.holder()
+        if holder:
+            logger.info(f"Синхронизация {sync_type} уже выполняется ({holder}), присоединяемся")
+            return AsyncResult(holder, app=task.app), False
+
+    # Блокировка освобождалась между проверками - запускаем без нее
+    return task.apply_async(args=args, **options), True
@@ -1,10 +1,13 @@
 import os
 import sys
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import asyncio
 from celery import Celery
+from celery.exceptions import Ignore
 from celery.schedules import crontab
+from celery.signals import worker_process_shutdown, worker_ready, worker_shutdown
+from kombu import Queue
 from sqlalchemy.orm import Session
 
 # Добавляем путь к проекту
@@ -14,9 +17,19 @@ from app.config import settings
 from app.database import SessionLocal
 from app.services.sbis_client import SBISClient
 from app.services.fns_filter import FNSFilter
+from app.services.parse_pool import parse_pool
 from app.utils.logger import get_logger
-from app.models.models import MailDocument, ProcessingLog
+from app.models.models import MailDocument, ProcessingLog, SBISAccount
 from app.services.fns_filter import FNSFilterService
+from app.services.ingestion import ingestion_service
+from app.services.accounts import account_service
+from app.services.sync_lock import SyncLock
+from app.services.event_bus import publish, publish_documents
+from app.services.health import health_service
+from app.utils.metrics import mark_process_dead, start_exporter
+from app.utils.profiling import ProfiledTask
+from app.utils.run_stats import collect_run_stats
+from app.services.poll_scheduler import adaptive_schedule, poll_scheduler
 
 logger = get_logger(__name__)
 
@@ -25,7 +38,9 @@ celery_app = Celery(
     'fns_monitor',
     broker=settings.REDIS_URL,
     backend=settings.REDIS_URL,
-    include=['app.tasks.celery_tasks']
+    include=['app.tasks.celery_tasks'],
+    # profile=True в kwargs любой задачи сохраняет профиль запуска
+    task_cls=ProfiledTask
 )
 
 # Конфигурация Celery
@@ -41,31 +56,78 @@ celery_app.conf.update(
     worker_prefetch_multiplier=1,
     task_acks_late=True,
     worker_max_tasks_per_child=1000,
+    # Очереди: realtime - плановый опрос, interactive - запросы пользователя,
+    # bulk - полные загрузки, вложения, разбор XML. У каждой свой воркер.
+    task_queues=(
+        Queue('realtime', routing_key='realtime'),
+        Queue('interactive', routing_key='interactive'),
+        Queue('bulk', routing_key='bulk'),
+    ),
+    task_default_queue='interactive',
+    task_default_priority=5,
+    # Приоритеты в Redis: 0 - самый высокий, 9 - самый низкий
+    broker_transport_options={
+        'priority_steps': list(range(10)),
+        'sep': ':',
+        'queue_order_strategy': 'priority',
+    },
 )
 
 # Расписание задач
 celery_app.conf.beat_schedule = {
-    'check-fns-mails-every-5-minutes': {
+    'check-fns-mails-adaptive': {
         'task': 'app.tasks.celery_tasks.check_fns_mails',
-        'schedule': crontab(minute='*/5'),  # Каждые 5 минут
-        'options': {'queue': 'celery'}
+        # Интервал зависит от времени суток и потока писем (PollScheduler)
+        'schedule': adaptive_schedule(),
+        # Не копим тики в очереди, пока идет предыдущая проверка
+        'options': {'queue': 'realtime', 'expires': settings.POLL_MIN_INTERVAL_SECONDS}
     },
-    'check-fns-documents-daily': {
-        'task': 'app.tasks.celery_tasks.check_fns_documents',
+    'check-all-documents-daily': {
+        'task': 'app.tasks.celery_tasks.check_all_documents_task',
         'schedule': crontab(hour=9, minute=0),  # Каждый день в 9:00
-        'options': {'queue': 'celery'}
+        'args': (settings.DOCUMENTS_PERIOD_DAYS,),
+        'options': {'queue': 'bulk'}
     },
 }
 
 celery_app.conf.task_routes = {
-    'app.tasks.celery_tasks.check_fns_mails': {'queue': 'celery'},
-    'app.tasks.celery_tasks.check_fns_documents': {'queue': 'celery'},
-    'app.tasks.celery_tasks.get_fns_documents_manual': {'queue': 'celery'},
-    'app.tasks.celery_tasks.check_all_documents_task': {'queue': 'celery'},
-    'app.tasks.celery_tasks.test_task': {'queue': 'celery'},
+    'app.tasks.celery_tasks.check_fns_mails': {'queue': 'realtime', 'priority': 0},
+    'app.tasks.celery_tasks.fetch_event_documents_task': {'queue': 'realtime', 'priority': 0},
+    'app.tasks.celery_tasks.get_fns_documents_manual': {'queue': 'interactive', 'priority': 3},
+    'app.tasks.celery_tasks.test_task': {'queue': 'interactive', 'priority': 3},
+    'app.tasks.celery_tasks.check_all_documents_task': {'queue': 'bulk', 'priority': 6},
+    'app.tasks.celery_tasks.download_attachments_task': {'queue': 'bulk', 'priority': 8},
+    'app.tasks.celery_tasks.extract_attachment_metadata_task': {'queue': 'bulk', 'priority': 8},
 }
 
 
+@worker_ready.connect
+def start_health_heartbeat(sender, **kwargs):
+    """Пульс воркера и длина очередей для /status, экспорт метрик"""
+    health_service.start_worker_heartbeat(sender.hostname, [queue.name for queue in sender.task_consumer.queues])
+    try:
+        start_exporter(settings.METRICS_EXPORTER_PORT)
+    except OSError as e:
+        # Несколько воркеров на одной машине: метрики отдает первый
+        logger.warning(f"Экспорт метрик на порту {settings.METRICS_EXPORTER_PORT} не запущен: {e}")
+
+
+@worker_process_shutdown.connect
+def cleanup_process_metrics(pid=None, **kwargs):
+    mark_process_dead(pid)
+
+
+@worker_shutdown.connect
+def stop_parse_pool(**kwargs):
+    # Пул разбора создается только в главном процессе воркера (--pool=solo/threads)
+    parse_pool.shutdown()
+
+
+@worker_shutdown.connect
+def stop_health_heartbeat(sender, **kwargs):
+    health_service.stop_worker_heartbeat(sender.hostname)
+
+
 def get_database_session() -> Session:
     """Получить сессию базы данных для Celery задач"""
     db = SessionLocal()
@@ -83,6 +145,45 @@ def test_task(self):
     return {"status": "success", "message": "Тестовая задача выполнена успешно", "timestamp": str(datetime.now())}
 
 
+def get_or_create_log_entry(db: Session, task_id: str, task_name: Optional[str] = None) -> ProcessingLog:
+    """Лог обработки задачи (при повторе задачи используется тот же)"""
+    log_entry = db.query(ProcessingLog).filter(ProcessingLog.task_id == task_id).first()
+    if not log_entry:
+        log_entry = ProcessingLog(
+            task_id=task_id, task_name=task_name, status="processing", started_at=datetime.now()
+        )
+        db.add(log_entry)
+        db.commit()
+    return log_entry
+
+
+def run_ingestion(task_id: str, sync_type: str, days_back: int, on_progress=None, max_pages=None) -> dict:
+    """
+    Загрузка по всем учетным записям СБИС с позиций их чекпоинтов
+
+    Ошибка загрузки (не авторизации) хотя бы одной учетной записи
+    поднимается исключением: повтор задачи продолжит только незавершенные.
+    Когда загружены все учетные записи, чекпоинты задачи удаляются.
+    """
+    results = asyncio.run(ingestion_service.run_accounts(task_id, sync_type, days_back, on_progress, max_pages))
+    summary = ingestion_service.summarize(results)
+
+    failed = {r["account_id"]: r["error"] for r in results if r["status"] == "error"}
+    if failed:
+        raise RuntimeError(f"Ошибка загрузки по учетным записям СБИС: {failed}")
+
+    if summary["completed"]:
+        # Повторять нечего - позиции загрузки больше не нужны
+        db = SessionLocal()
+        try:
+            ingestion_service.delete_checkpoints(db, task_id)
+        finally:
+            db.close()
+
+    summary["auth_failed"] = bool(results) and all(r["status"] == "auth_error" for r in results)
+    return summary
+
+
 @celery_app.task(bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 3, 'countdown': 60})
 def check_fns_mails(self):
     logger.info("Запуск задачи проверки документов ФНС через СБИС")
@@ -90,80 +191,46 @@ def check_fns_mails(self):
     db = None
     task_id = self.request.id
 
-    try:
-        from app.models.models import MailDocument, ProcessingLog
+    # Тот же период уже загружается другой задачей
+    lock = SyncLock("check_fns_mails", settings.DOCUMENTS_PERIOD_DAYS)
+    if not lock.acquire(task_id, heartbeat=True):
+        logger.info(f"Проверка уже выполняется задачей {lock.holder()}, пропускаем")
+        return {"status": "skipped", "attached_to": lock.holder(), "task_id": task_id}
 
+    try:
         db = get_database_session()
 
-        log_entry = ProcessingLog(
-            task_id=task_id,
-            status="processing"
-        )
-        db.add(log_entry)
-        db.commit()
+        log_entry = get_or_create_log_entry(db, task_id, "check_fns_mails")
 
-        # Внутренняя асинхронная функция для работы с SBISClient
-        async def get_fns_docs():
-            async with SBISClient() as sbis_client:
-                if not await sbis_client.authenticate():
-                    logger.error("Не удалось авторизоваться в СБИС")
-                    return None
-                return await sbis_client.get_fns_documents(days_back=settings.DOCUMENTS_PERIOD_DAYS)
-
-        async def get_all_docs():
-            async with SBISClient() as sbis_client:
-                if not await sbis_client.authenticate():
-                    logger.error("Не удалось авторизоваться в СБИС")
-                    return None
-
-                # Получаем сырые данные
-                raw_result = await sbis_client.get_documents_raw(days_back=settings.DOCUMENTS_PERIOD_DAYS)
-                if not raw_result:
-                    return []
-
-                # Парсим ВСЕ документы (не только от ФНС)
-                all_documents = sbis_client.parse_documents(raw_result)
-                return all_documents
-
-        # Запускаем асинхронную функцию
-        # fns_documents = asyncio.run(get_fns_docs())
-        all_documents = asyncio.run(get_all_docs())
-
-        new_documents_count = 0
-        fns_documents_count = 0
-
-        for doc in all_documents:
-            existing_doc = db.query(MailDocument).filter(
-                MailDocument.external_id == doc.get('external_id', '')
-            ).first()
-
-            if not existing_doc:
-                # Определяем, от ФНС ли документ
-                is_fns = FNSFilterService.is_from_fns(doc)
-                if is_fns:
-                    fns_documents_count += 1
-
-                mail_doc = MailDocument(
-                    external_id=doc.get('external_id', ''),
-                    date=doc.get('date', datetime.now()),
-                    subject=doc.get('subject', ''),
-                    sender_inn=doc.get('sender_inn', ''),
-                    sender_name=doc.get('sender_name', ''),
-                    filename=doc.get('filename', ''),
-                    has_attachment=doc.get('has_attachment', False),
-                    is_from_fns=is_fns  # Правильно устанавливаем флаг!
-                )
-                db.add(mail_doc)
-                new_documents_count += 1
+        # При повторе задачи продолжаем с сохраненных позиций
+        with collect_run_stats() as stats:
+            summary = run_ingestion(task_id, "check_fns_mails", settings.DOCUMENTS_PERIOD_DAYS)
+        if summary["auth_failed"]:
+            raise RuntimeError("Не удалось авторизоваться в СБИС")
 
+        log_entry.status = "success"
+        log_entry.total_documents = summary["total_documents"]
+        log_entry.fns_documents = summary["fns_documents"]
+        stats.apply_to(log_entry, retries=self.request.retries)
         db.commit()
 
+        poll_scheduler.record_poll(summary["new_documents"], summary["fns_documents"])
+
+        publish("task_finished", {
+            "task_id": task_id,
+            "task": "check_fns_mails",
+            "total_documents": summary["total_documents"],
+            "fns_documents": summary["fns_documents"],
+            "new_documents": summary["new_documents"]
+        })
+
         return {
             "status": "success",
-            "message": f"Обработано {len(all_documents)} документов, {fns_documents_count} от ФНС",
-            "total_count": len(all_documents),
-            "fns_count": fns_documents_count,
-            "new_count": new_documents_count,
+            "message": f"Обработано {summary['total_documents']} документов, {summary['fns_documents']} от ФНС",
+            "total_count": summary["total_documents"],
+            "fns_count": summary["fns_documents"],
+            "new_count": summary["new_documents"],
+            "accounts": summary["accounts"],
             "task_id": task_id
         }
 
@@ -173,15 +240,81 @@ def check_fns_mails(self):
         if db:
             db.rollback()
             try:
-                from app.models.models import ProcessingLog
                 log_entry = db.query(ProcessingLog).filter(ProcessingLog.task_id == task_id).first()
                 if log_entry:
                     log_entry.status = "error"
                     log_entry.error_message = str(e)
+                    log_entry.retry_count = self.request.retries
                     db.commit()
             except:
                 pass
         raise self.retry(exc=e)
+    finally:
+        lock.release()
+        if db:
+            db.close()
+
+
+@celery_app.task(bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 3, 'countdown': 30})
+def fetch_event_documents_task(self, account_id: Optional[int], document_ids: List[str]):
+    """
+    Загрузка документов, о которых сообщили события СБИС
+
+    Читаются только указанные документы (ПрочитатьДокумент), реестр не
+    опрашивается. Документы, которые не удалось прочитать, подберет
+    плановый опрос.
+    """
+    logger.info(f"Загрузка документов по событиям СБИС: {len(document_ids)}")
+
+    db = None
+    task_id = self.request.id
+
+    try:
+        db = get_database_session()
+
+        account = db.get(SBISAccount, account_id) if account_id else account_service.ensure_default_account(db)
+        if account is None or not account.is_active:
+            logger.warning(f"События для неизвестной или отключенной учетной записи {account_id} пропущены")
+            return {"status": "skipped", "account_id": account_id, "task_id": task_id}
+
+        async def fetch():
+            async with SBISClient(account=account) as sbis_client:
+                if not await sbis_client.authenticate():
+                    raise RuntimeError(f"Не удалось авторизоваться в СБИС ({account.login})")
+
+                raw_documents = await asyncio.gather(
+                    *(sbis_client.read_document(document_id) for document_id in document_ids)
+                )
+                return [sbis_client.parse_document(raw) if raw else None for raw in raw_documents]
+
+        parsed = asyncio.run(fetch())
+        documents = [doc for doc in parsed if doc]
+        missing = [document_id for document_id, doc in zip(document_ids, parsed) if not doc]
+
+        result = FNSFilterService.save_documents(db, documents, source=f"event:{task_id}", account_id=account.id)
+        db.commit()
+        publish_documents(result["created"])
+
+        poll_scheduler.record_poll(result["new_documents"], result["fns_documents"])
+
+        if missing:
+            logger.warning(f"Не удалось прочитать документы {missing}, их получит плановый опрос")
+
+        return {
+            "status": "success",
+            "account_id": account.id,
+            "new_documents": result["new_documents"],
+            "fns_documents": result["fns_documents"],
+            "missing": missing,
+            "task_id": task_id
+        }
+
+    except Exception as e:
+        logger.error(f"Ошибка загрузки документов по событиям: {str(e)}")
+        if db:
+            db.rollback()
+        raise
+
     finally:
         if db:
             db.close()
@@ -262,6 +395,12 @@ def check_all_documents_task(self, days_back: int = 3600):
     """
     Celery задача для полной проверки всех документов за указанный период
 
+    Загрузка идет постранично с чекпоинтом: повтор задачи после ошибки
+    или перезапуска воркера продолжает с последней записанной страницы.
+    За один запуск обрабатывается INGEST_CHUNK_PAGES страниц, после чего
+    задача ставит продолжение с тем же task_id в конец очереди bulk и
+    освобождает воркер. Результат задачи появляется после последней части.
+
     Args:
         days_back: Количество дней назад для проверки (по умолчанию 2 года)
     """
@@ -269,106 +408,73 @@ def check_all_documents_task(self, days_back: int = 3600):
 
     db = None
     task_id = self.request.id
+    handed_off = False
 
-    try:
-        from app.models.models import MailDocument, ProcessingLog
+    # Тот же период уже загружается другой задачей
+    lock = SyncLock("check_all_documents", days_back)
+    if not lock.acquire(task_id, heartbeat=True):
+        logger.info(f"Celery: Полная проверка уже выполняется задачей {lock.holder()}, пропускаем")
+        return {"status": "skipped", "attached_to": lock.holder(), "task_id": task_id}
 
+    try:
         # Получаем сессию БД
         db = get_database_session()
 
-        # Создаем лог
-        log_entry = ProcessingLog(
-            task_id=task_id,
-            status="processing"
-        )
-        db.add(log_entry)
-        db.commit()
-
-        # Обновляем статус задачи
-        self.update_state(
-            state='PROGRESS',
-            meta={'status': 'Подключение к СБИС...', 'progress': 10}
-        )
-
-        # Внутренняя асинхронная функция
-        async def get_all_fns_docs():
-            async with SBISClient() as sbis_client:
-                if not await sbis_client.authenticate():
-                    logger.error("Не удалось авторизоваться в СБИС")
-                    return None
-
-                # Обновляем статус
-                self.update_state(
-                    state='PROGRESS',
-                    meta={'status': 'Получение документов из СБИС...', 'progress': 30}
-                )
-
-                return await sbis_client.get_all_documents(days_back=days_back)
-
-        # Запускаем асинхронную функцию
-        fns_documents = asyncio.run(get_all_fns_docs())
-
-        if fns_documents is None:
+        log_entry = get_or_create_log_entry(db, task_id, "check_all_documents")
+
+        # Прогресс по учетным записям (они загружаются параллельно)
+        progress = {}
+
+        def report_progress(checkpoint):
+            # Прогресс отражает восстановленную позицию, а не начало периода
+            progress[checkpoint.account_id] = {
+                'progress': ingestion_service.progress(checkpoint),
+                'cursor_date': checkpoint.cursor_date.isoformat(),
+                'cursor_page': checkpoint.cursor_page,
+                'processed': checkpoint.total_documents,
+                'new_documents': checkpoint.new_documents
+            }
+            processed = sum(p['processed'] for p in progress.values())
+            meta = {
+                'status': f'Загружено {processed} документов',
+                'progress': min(p['progress'] for p in progress.values()),
+                'processed': processed,
+                'new_documents': sum(p['new_documents'] for p in progress.values()),
+                'accounts': progress
+            }
+            self.update_state(state='PROGRESS', meta=meta)
+            publish("task_progress", {"task_id": task_id, "task": "check_all_documents", **meta})
+
+        # При повторе задачи продолжаем с сохраненных позиций
+        with collect_run_stats() as stats:
+            summary = run_ingestion(
+                task_id, "check_all_documents", days_back, report_progress, max_pages=settings.INGEST_CHUNK_PAGES
+            )
+
+        if summary["auth_failed"]:
             log_entry.status = "error"
             log_entry.error_message = "Ошибка авторизации в СБИС"
+            stats.apply_to(log_entry, retries=self.request.retries)
             db.commit()
             return {"status": "error", "message": "Ошибка авторизации в СБИС"}
 
-        # Обновляем статус
-        self.update_state(
-            state='PROGRESS',
-            meta={'status': 'Сохранение в базу данных...', 'progress': 60}
-        )
-
-        # Сохраняем документы
-        new_documents_count = 0
-        total_processed = 0
-
-        for i, doc in enumerate(fns_documents):
-            # Обновляем прогресс каждые 100 документов
-            if i % 100 == 0:
-                progress = 60 + (i / len(fns_documents)) * 30  # от 60% до 90%
-                self.update_state(
-                    state='PROGRESS',
-                    meta={
-                        'status': f'Обработано {i}/{len(fns_documents)} документов...',
-                        'progress': int(progress)
-                    }
-                )
-
-            existing_doc = db.query(MailDocument).filter(
-                MailDocument.external_id == doc.get('external_id', '')
-            ).first()
-
-            is_fns = FNSFilterService.is_from_fns(doc)
-
-            if not existing_doc:
-                mail_doc = MailDocument(
-                    external_id=doc.get('external_id', ''),
-                    date=doc.get('date', datetime.now()),
-                    subject=doc.get('subject', ''),
-                    sender_inn=doc.get('sender_inn', ''),
-                    sender_name=doc.get('sender_name', ''),
-                    filename=doc.get('filename', ''),
-                    has_attachment=doc.get('has_attachment', False),
-                    is_from_fns=is_fns
-                )
-                db.add(mail_doc)
-                new_documents_count += 1
-
-            total_processed += 1
+        if not summary["completed"]:
+            # Показатели части добавляются к общей строке лога
+            stats.apply_to(log_entry, retries=self.request.retries, finished=False)
+            db.commit()
 
-            # Коммитим каждые 500 документов для избежания блокировок
-            if total_processed % 500 == 0:
-                db.commit()
-
-        # Финальный коммит
-        db.commit()
+            # Отдаем воркер: продолжение получит те же чекпоинты, лог и блокировку
+            self.apply_async(args=(days_back,), task_id=task_id)
+            lock.hand_off()
+            handed_off = True
+            logger.info(f"Celery: Полная проверка {task_id} продолжится в следующей части")
+            raise Ignore()
 
         # Обновляем лог
         log_entry.status = "success"
-        log_entry.total_documents = len(fns_documents)
-        log_entry.fns_documents = len(fns_documents)
+        log_entry.total_documents = summary["total_documents"]
+        log_entry.fns_documents = summary["fns_documents"]
+        stats.apply_to(log_entry, retries=self.request.retries)
         db.commit()
 
         # Финальный статус
@@ -378,17 +484,31 @@ def check_all_documents_task(self, days_back: int = 3600):
         )
 
         logger.info(
-            f"Celery: Полная проверка завершена. Обработано {len(fns_documents)} документов, новых: {new_documents_count}")
+            f"Celery: Полная проверка завершена. Обработано {summary['total_documents']} документов, "
+            f"новых: {summary['new_documents']}")
+
+        publish("task_finished", {
+            "task_id": task_id,
+            "task": "check_all_documents",
+            "total_documents": summary["total_documents"],
+            "fns_documents": summary["fns_documents"],
+            "new_documents": summary["new_documents"]
+        })
 
         return {
             "status": "success",
-            "total_documents": len(fns_documents),
-            "new_documents": new_documents_count,
+            "total_documents": summary["total_documents"],
+            "fns_documents": summary["fns_documents"],
+            "new_documents": summary["new_documents"],
+            "accounts": summary["accounts"],
             "days_back": days_back,
             "task_id": task_id,
             "processed_at": datetime.now().isoformat()
         }
 
+    except Ignore:
+        raise
+
     except Exception as e:
         logger.error(f"Celery: Ошибка полной проверки: {str(e)}")
 
@@ -399,6 +519,7 @@ def check_all_documents_task(self, days_back: int = 3600):
                 if log_entry:
                     log_entry.status = "error"
                     log_entry.error_message = str(e)
+                    log_entry.retry_count = self.request.retries
                     db.commit()
             except:
                 pass
@@ -411,6 +532,176 @@ def check_all_documents_task(self, days_back: int = 3600):
 
         raise self.retry(exc=e)
 
+    finally:
+        if not handed_off:
+            lock.release()
+        if db:
+            db.close()
+
+
+@celery_app.task(bind=True)
+def download_attachments_task(self, limit: int = 500):
+    """
+    Загрузка файлов вложений в локальное хранилище
+
+    Берет вложения со ссылкой, которые еще не загружены, и качает их
+    параллельно. Незагруженные файлы будут докачаны следующим запуском.
+    """
+    logger.info(f"Celery: Загрузка вложений (лимит {limit})")
+
+    db = None
+    try:
+        from app.models.models import MailAttachment
+        from app.services.attachment_store import AttachmentDownloader, attachment_store
+
+        db = get_database_session()
+
+        rows = db.query(MailAttachment, MailDocument.account_id).join(
+            MailDocument, MailAttachment.document_id == MailDocument.id
+        ).filter(
+            MailAttachment.url.isnot(None),
+            MailAttachment.sha256.is_(None)
+        ).order_by(MailAttachment.id).limit(limit).all()
+        pending = [attachment for attachment, _ in rows]
+
+        if not pending:
+            return {"status": "success", "downloaded": 0, "pending": 0}
+
+        # Файл доступен только в сессии учетной записи, получившей документ
+        urls_by_account = {}
+        for attachment, account_id in rows:
+            urls_by_account.setdefault(account_id, []).append(attachment.url)
+        accounts = {account.id: account for account in account_service.active_accounts(db)}
+
+        async def download():
+            downloaded = {}
+            downloader = AttachmentDownloader(attachment_store)
+            for account_id, urls in urls_by_account.items():
+                account = accounts.get(account_id)
+                if account is None:
+                    continue
+
+                async with SBISClient(account=account) as sbis_client:
+                    if not await sbis_client.authenticate():
+                        logger.error(f"Не удалось авторизоваться в СБИС ({account.login})")
+                        continue
+                    downloaded.update(await downloader.download_all(sbis_client, urls))
+            return downloaded
+
+        downloaded = asyncio.run(download())
+
+        now = datetime.now()
+        updated = 0
+        for attachment in pending:
+            result = downloaded.get(attachment.url)
+            if result:
+                attachment.sha256, attachment.stored_size = result
+                attachment.downloaded_at = now
+                updated += 1
+
+        db.commit()
+
+        logger.info(f"Celery: Загружено вложений {updated} из {len(pending)}")
+
+        if updated:
+            extract_attachment_metadata_task.delay()
+
+        return {"status": "success", "downloaded": updated, "pending": len(pending) - updated}
+
+    except Exception as e:
+        logger.error(f"Celery: Ошибка загрузки вложений: {str(e)}")
+        if db:
+            db.rollback()
+        return {"status": "error", "message": str(e)}
+    finally:
+        if db:
+            db.close()
+
+
+@celery_app.task(bind=True)
+def extract_attachment_metadata_task(self, limit: int = 500):
+    """
+    Извлечение КНД, кода инспекции и срока ответа из XML вложений
+
+    Выполняется отдельно от загрузки писем. limit - число документов:
+    берутся документы, у которых все XML вложения уже загружены, и
+    разбираются все их XML. Документ помечается разобранным, только
+    если все его XML файлы есть в хранилище. Документ с распознанным
+    формализованным XML ФНС помечается как документ от ФНС.
+    """
+    logger.info(f"Celery: Разбор XML вложений (лимит документов {limit})")
+
+    db = None
+    try:
+        from sqlalchemy import and_, exists
+        from app.models.models import MailDocument, MailAttachment
+        from app.services.attachment_store import attachment_store
+        from app.services.fns_xml_parser import extract_many
+
+        db = get_database_session()
+
+        xml_attachment = and_(
+            MailAttachment.document_id == MailDocument.id,
+            MailAttachment.name.ilike('%.xml')
+        )
+        document_ids = [
+            row.id for row in db.query(MailDocument.id).filter(
+                MailDocument.metadata_extracted_at.is_(None),
+                exists().where(xml_attachment),
+                # Документы с недокачанными XML ждут загрузки
+                ~exists().where(and_(xml_attachment, MailAttachment.sha256.is_(None)))
+            ).order_by(MailDocument.id).limit(limit)
+        ]
+
+        if not document_ids:
+            return {"status": "success", "documents": 0}
+
+        rows = db.query(MailAttachment.document_id, MailAttachment.sha256).filter(
+            MailAttachment.document_id.in_(document_ids),
+            MailAttachment.name.ilike('%.xml')
+        ).order_by(MailAttachment.document_id, MailAttachment.id).all()
+
+        # Файл удален из хранилища - документ остается неразобранным
+        paths = [attachment_store.path_for(sha256) for _, sha256 in rows]
+        incomplete = {document_id for (document_id, _), path in zip(rows, paths) if not os.path.exists(path)}
+        if incomplete:
+            logger.warning(f"Celery: Нет XML файлов в хранилище для документов {sorted(incomplete)}")
+
+        pending = [(document_id, path) for (document_id, _), path in zip(rows, paths) if document_id not in incomplete]
+        results = extract_many([path for _, path in pending])
+
+        # Несколько XML у одного документа: берем первое найденное значение
+        by_document: Dict[int, Dict[str, Any]] = {
+            document_id: {} for document_id in document_ids if document_id not in incomplete
+        }
+        for (document_id, _), metadata in zip(pending, results):
+            merged = by_document[document_id]
+            for key, value in metadata.items():
+                if value is not None and merged.get(key) is None:
+                    merged[key] = value
+
+        now = datetime.now()
+        recognized = 0
+        for document in db.query(MailDocument).filter(MailDocument.id.in_(by_document.keys())):
+            metadata = by_document[document.id]
+            document.knd_code = metadata.get("knd_code")
+            document.tax_office_code = metadata.get("tax_office_code")
+            document.response_deadline = metadata.get("response_deadline")
+            document.metadata_extracted_at = now
+            if document.knd_code or document.tax_office_code:
+                document.is_from_fns = True
+                recognized += 1
+
+        db.commit()
+
+        logger.info(f"Celery: Разобрано XML документов: {len(by_document)}, распознано ФНС: {recognized}")
+        return {"status": "success", "documents": len(by_document), "recognized": recognized}
+
+    except Exception as e:
+        logger.error(f"Celery: Ошибка разбора XML вложений: {str(e)}")
+        if db:
+            db.rollback()
+        return {"status": "error", "message": str(e)}
     finally:
         if db:
             db.close()
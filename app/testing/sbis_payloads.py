@@ -0,0 +1,173 @@
+"""
+Синтетические ответы СБИС для бенчмарков и заглушки API
+
+Генератор воспроизводим (seed) и выдает ответы СБИС.СписокДокументовПоСобытиям
+в том же виде, что и настоящий API: Реестр с Документ/Контрагент (СвЮЛ или
+СвФЛ), списками Вложение и Навигация.ЕстьЕще. Доля писем ФНС и доля повторов
+(тот же документ в нескольких страницах, как при повторной выдаче событий)
+задаются параметрами.
+"""
+import random
+from collections import deque
+from datetime import date, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+FNS_SUBJECTS = [
+    "Требование о представлении документов (информации)",
+    "Уведомление о вызове в налоговый орган",
+    "Решение о привлечении к ответственности за совершение налогового правонарушения",
+    "Акт сверки расчетов по налогам, сборам, страховым взносам",
+    "Требование об уплате задолженности",
+    "Извещение о вводе сведений, указанных в налоговой декларации",
+    "Квитанция о приеме налоговой декларации (расчета) в электронной форме",
+    "Справка о состоянии расчетов по налогам",
+]
+FNS_NAMES = [
+    "ИФНС России № {n} по г. Москве",
+    "Межрайонная ИФНС России № {n} по Московской области",
+    "УФНС России по г. Москве",
+]
+# ИНН инспекций: префиксы из FNS_INN_PREFIXES
+FNS_INN_PREFIXES = ["7718", "7736", "7701", "7703", "7705", "7710"]
+
+REGULAR_SUBJECTS = [
+    "Счет на оплату № {n}",
+    "Акт выполненных работ № {n} от {d}",
+    "Универсальный передаточный документ № {n}",
+    "Товарная накладная ТОРГ-12 № {n}",
+    "Дополнительное соглашение к договору поставки № {n}",
+    "Счет-фактура № {n} от {d}",
+    "Письмо о смене банковских реквизитов",
+    "Претензия по договору № {n}",
+]
+REGULAR_NAMES = [
+    'ООО "Ромашка"', 'АО "СеверСталь-Логистик"', 'ООО "ТехноСнаб"', 'ООО "Вектор Плюс"',
+    'ПАО "Ростелеком"', 'ООО "Альфа-Строй"', 'ЗАО "Партнер"', 'ООО "Торговый дом Восток"',
+]
+PERSON_NAMES = ["Иванов Иван Иванович", "Петрова Анна Сергеевна", "Сидоров Петр Алексеевич"]
+# Регионы вне Москвы: ИНН не попадают под префиксы ФНС
+REGULAR_REGIONS = ["50", "78", "66", "54", "16", "23", "61", "52"]
+ATTACHMENT_TYPES = [
+    ("ON_NSCHFDOPPR", "xml"), ("ДОК", "pdf"), ("ТОРГ12", "xml"), ("Скан", "png"), ("Письмо", "docx"),
+]
+
+
+class SBISPayloadGenerator:
+    """
+    Поток документов в формате реестра СБИС
+
+    fns_ratio - доля писем ФНС, duplicate_ratio - доля повторов уже
+    выданных документов, max_attachments - до скольких вложений у документа,
+    даты документов - span_days дней начиная с start_date.
+    """
+
+    def __init__(
+            self,
+            seed: int = 42,
+            fns_ratio: float = 0.08,
+            duplicate_ratio: float = 0.02,
+            max_attachments: int = 4,
+            start_date: Optional[date] = None,
+            span_days: int = 365
+    ):
+        self.rng = random.Random(seed)
+        self.fns_ratio = fns_ratio
+        self.duplicate_ratio = duplicate_ratio
+        self.max_attachments = max_attachments
+        self.span_days = span_days
+        self.start_date = start_date or date.today() - timedelta(days=span_days)
+        self.issued = 0
+        self._recent: deque = deque(maxlen=1000)
+
+    def _inn(self, length: int, prefix: str = "") -> str:
+        return prefix + "".join(str(self.rng.randint(0, 9)) for _ in range(length - len(prefix)))
+
+    def _attachments(self, number: int, doc_type: str) -> List[Dict[str, Any]]:
+        attachments = []
+        for index in range(self.rng.randint(0, self.max_attachments)):
+            kind, extension = self.rng.choice(ATTACHMENT_TYPES)
+            attachment_id = f"{number:08d}-{index}"
+            attachments.append({
+                "Идентификатор": attachment_id,
+                "Название": f"{doc_type}_{number}_{index}.{extension}",
+                "Тип": kind,
+                "Файл": {
+                    "Имя": f"{doc_type}_{number}_{index}.{extension}",
+                    "Размер": str(self.rng.randint(2_000, 2_000_000)),
+                    "Ссылка": f"/disk/api/v1/{attachment_id}",
+                },
+            })
+        return attachments
+
+    def document(self) -> Dict[str, Any]:
+        """Следующий документ (Документ записи реестра)"""
+        if self._recent and self.rng.random() < self.duplicate_ratio:
+            return self.rng.choice(self._recent)
+
+        number = self.issued
+        self.issued += 1
+        doc_date = self.start_date + timedelta(days=self.rng.randint(0, self.span_days - 1))
+        date_text = doc_date.strftime("%d.%m.%Y")
+
+        if self.rng.random() < self.fns_ratio:
+            subject = self.rng.choice(FNS_SUBJECTS)
+            kontragent = {
+                "Название": self.rng.choice(FNS_NAMES).format(n=self.rng.randint(1, 51)),
+                "СвЮЛ": {"ИНН": self._inn(10, self.rng.choice(FNS_INN_PREFIXES)), "КПП": self._inn(9, "77")},
+            }
+            doc_type = "ФНС"
+        else:
+            subject = self.rng.choice(REGULAR_SUBJECTS).format(n=self.rng.randint(1, 99999), d=date_text)
+            if self.rng.random() < 0.15:
+                kontragent = {
+                    "Название": self.rng.choice(PERSON_NAMES),
+                    "СвФЛ": {"ИНН": self._inn(12, self.rng.choice(REGULAR_REGIONS))},
+                }
+            else:
+                kontragent = {
+                    "Название": self.rng.choice(REGULAR_NAMES),
+                    "СвЮЛ": {"ИНН": self._inn(10, self.rng.choice(REGULAR_REGIONS)), "КПП": self._inn(9)},
+                }
+            doc_type = "ДокОтгрИсх"
+
+        document = {
+            "Идентификатор": f"{number:08d}-{self.rng.getrandbits(32):08x}",
+            "Дата": date_text,
+            "Номер": str(number),
+            "Название": subject,
+            "Тип": doc_type,
+            "Направление": "Входящий",
+            "Контрагент": kontragent,
+            "Состояние": {"Код": "7", "Название": "Получен"},
+            "Вложение": self._attachments(number, doc_type),
+        }
+        self._recent.append(document)
+        return document
+
+    def documents(self, count: int) -> List[Dict[str, Any]]:
+        return [self.document() for _ in range(count)]
+
+    def page(self, page: int, page_size: int, has_more: bool) -> Dict[str, Any]:
+        """Ответ СБИС.СписокДокументовПоСобытиям с page_size документами"""
+        return {
+            "jsonrpc": "2.0",
+            "result": {
+                "Реестр": [{"Документ": document} for document in self.documents(page_size)],
+                "Навигация": {
+                    "Страница": str(page),
+                    "РазмерСтраницы": str(page_size),
+                    "ЕстьЕще": "Да" if has_more else "Нет",
+                },
+            },
+            "id": 1,
+        }
+
+    def pages(self, total: int, page_size: int = 200) -> Iterator[Dict[str, Any]]:
+        """Страницы реестра на total документов (генерируются по мере чтения)"""
+        page = 0
+        issued = 0
+        while issued < total:
+            size = min(page_size, total - issued)
+            issued += size
+            yield self.page(page, size, has_more=issued < total)
+            page += 1
@@ -0,0 +1,292 @@
+"""
+Локальная заглушка JSON-RPC API СБИС для нагрузочных испытаний
+
+    python -m app.testing.sbis_stub --documents 100000 --port 8090
+    python -m app.testing.sbis_stub --latency-ms 150 --latency-sigma 0.6 --rate-limit 20 \\
+        --session-ttl 300 --error-rate 0.02
+
+Приложение направляется на заглушку переменными окружения:
+
+    SBIS_BASE_URL=http://localhost:8090
+    SBIS_AUTH_URL=http://localhost:8090/auth/service/
+    SBIS_SERVICE_URL=http://localhost:8090/service/?srv=1&protocol=4
+
+Поддерживаются СБИС.Аутентифицировать, СБИС.СписокДокументовПоСобытиям
+(Фильтр.ДатаС/ДатаПо и Навигация) и СБИС.ПрочитатьДокумент. Набор
+документов генерирует SBISPayloadGenerator один раз при старте, даты -
+последние --days дней. Счетчики запросов и ответов - GET /stats.
+
+Отказы, как у настоящего API:
+- задержка ответа - логнормальная с медианой --latency-ms;
+- больше --rate-limit запросов в секунду - 429 с Retry-After;
+- --error-rate запросов - 500/502/503;
+- сессия старше --session-ttl секунд - 401 и ошибка JSON-RPC.
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from datetime import date, datetime, timedelta
+from functools import partial
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+from app.testing.sbis_payloads import SBISPayloadGenerator
+from app.utils.logger import logger
+
+AUTH_METHOD = "СБИС.Аутентифицировать"
+LIST_METHOD = "СБИС.СписокДокументовПоСобытиям"
+READ_METHOD = "СБИС.ПрочитатьДокумент"
+
+
+def json_response(data: Any, **kwargs) -> web.Response:
+    # Кириллица без \u-экранирования: размер ответа как у настоящего API
+    return web.json_response(data, dumps=partial(json.dumps, ensure_ascii=False), **kwargs)
+
+
+class SBISStub:
+    """
+    Состояние заглушки: набор документов, сессии, лимит и счетчики
+
+    latency_ms - медиана задержки, latency_sigma - разброс (0 - постоянная),
+    rate_limit - запросов в секунду на весь сервер (0 - без лимита),
+    session_ttl - время жизни сессии в секундах (0 - бессрочно),
+    error_rate - доля ответов 5xx.
+    """
+
+    def __init__(
+            self,
+            documents: int = 10000,
+            days: int = 30,
+            seed: int = 42,
+            fns_ratio: float = 0.08,
+            latency_ms: float = 0.0,
+            latency_sigma: float = 0.0,
+            rate_limit: float = 0.0,
+            session_ttl: float = 0.0,
+            error_rate: float = 0.0,
+            login: Optional[str] = None,
+            password: Optional[str] = None
+    ):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.rate_limit = rate_limit
+        self.session_ttl = session_ttl
+        self.error_rate = error_rate
+        self.login = login
+        self.password = password
+        self.rng = random.Random(seed)
+
+        generator = SBISPayloadGenerator(
+            seed=seed, fns_ratio=fns_ratio, start_date=date.today() - timedelta(days=days - 1), span_days=days
+        )
+        self.documents = sorted(generator.documents(documents), key=self._document_date)
+        self.dates = [self._document_date(document) for document in self.documents]
+        self.by_id = {document["Идентификатор"]: document for document in self.documents}
+
+        self.sessions: Dict[str, float] = {}
+        self.tokens = rate_limit
+        self.tokens_updated = time.monotonic()
+        self.stats: Counter = Counter()
+
+    @staticmethod
+    def _document_date(document: Dict[str, Any]) -> date:
+        return datetime.strptime(document["Дата"], "%d.%m.%Y").date()
+
+    # --- отказы ---
+
+    async def delay(self) -> None:
+        if self.latency_ms <= 0:
+            return
+        seconds = self.latency_ms / 1000
+        if self.latency_sigma > 0:
+            seconds = self.rng.lognormvariate(0, self.latency_sigma) * seconds
+        await asyncio.sleep(seconds)
+
+    def throttled(self) -> bool:
+        """Токен-бакет на rate_limit запросов в секунду (запас - одна секунда)"""
+        if self.rate_limit <= 0:
+            return False
+        now = time.monotonic()
+        self.tokens = min(self.rate_limit, self.tokens + (now - self.tokens_updated) * self.rate_limit)
+        self.tokens_updated = now
+        if self.tokens < 1:
+            return True
+        self.tokens -= 1
+        return False
+
+    def session_valid(self, session_id: Optional[str]) -> bool:
+        created = self.sessions.get(session_id or "")
+        if created is None:
+            return False
+        if self.session_ttl > 0 and time.monotonic() - created > self.session_ttl:
+            del self.sessions[session_id]
+            self.stats["sessions_expired"] += 1
+            return False
+        return True
+
+    # --- ответы ---
+
+    @staticmethod
+    def rpc_result(result: Any, request_id: Any) -> web.Response:
+        return json_response({"jsonrpc": "2.0", "result": result, "id": request_id})
+
+    @staticmethod
+    def rpc_error(message: str, request_id: Any, status: int = 200, code: int = -32000) -> web.Response:
+        return json_response(
+            {"jsonrpc": "2.0", "error": {"code": code, "message": message, "details": message}, "id": request_id},
+            status=status
+        )
+
+    def respond(self, response: web.Response) -> web.Response:
+        self.stats[f"status_{response.status}"] += 1
+        return response
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Общая обработка JSON-RPC запроса: лимит, задержка, отказы, метод"""
+        self.stats["requests"] += 1
+        try:
+            payload = await request.json()
+        except Exception:
+            return self.respond(self.rpc_error("Некорректный JSON", None, status=400, code=-32700))
+
+        method = payload.get("method", "")
+        request_id = payload.get("id")
+        params = payload.get("params") or {}
+        self.stats[f"method:{method}"] += 1
+
+        if self.throttled():
+            return self.respond(json_response(
+                {"jsonrpc": "2.0", "error": {"code": 429, "message": "Too Many Requests"}, "id": request_id},
+                status=429, headers={"Retry-After": "1"}
+            ))
+
+        await self.delay()
+
+        if self.error_rate > 0 and self.rng.random() < self.error_rate:
+            status = self.rng.choice((500, 502, 503))
+            return self.respond(web.Response(status=status, text=f"Injected error {status}: сервис перегружен"))
+
+        if method == AUTH_METHOD:
+            return self.respond(self.authenticate(params, request_id))
+
+        if not self.session_valid(request.headers.get("X-SBISSessionID")):
+            return self.respond(self.rpc_error("Пользователь не авторизован", request_id, status=401))
+
+        if method == LIST_METHOD:
+            return self.respond(self.list_documents(params, request_id))
+        if method == READ_METHOD:
+            return self.respond(self.read_document(params, request_id))
+        return self.respond(self.rpc_error(f"Метод {method} не поддерживается", request_id, code=-32601))
+
+    def authenticate(self, params: Dict[str, Any], request_id: Any) -> web.Response:
+        credentials = params.get("Параметр") or {}
+        if (self.login is not None and credentials.get("Логин") != self.login) or \
+                (self.password is not None and credentials.get("Пароль") != self.password):
+            return self.rpc_error("Неверный логин или пароль", request_id)
+
+        session_id = uuid.uuid4().hex
+        self.sessions[session_id] = time.monotonic()
+        self.stats["sessions_created"] += 1
+        return self.rpc_result(session_id, request_id)
+
+    def list_documents(self, params: Dict[str, Any], request_id: Any) -> web.Response:
+        filters = params.get("Фильтр") or {}
+        navigation = filters.get("Навигация") or {}
+        try:
+            date_from = datetime.strptime(filters["ДатаС"], "%d.%m.%Y").date() if filters.get("ДатаС") else date.min
+            date_to = datetime.strptime(filters["ДатаПо"], "%d.%m.%Y").date() if filters.get("ДатаПо") else date.max
+            page = int(navigation.get("Страница", 0))
+            page_size = int(navigation.get("РазмерСтраницы", 0)) or len(self.documents)
+        except (TypeError, ValueError) as e:
+            return self.rpc_error(f"Некорректный фильтр: {e}", request_id, code=-32602)
+
+        # Документы отсортированы по дате, период - срез списка
+        first = bisect.bisect_left(self.dates, date_from)
+        last = bisect.bisect_right(self.dates, date_to)
+        start = first + page * page_size
+        end = min(start + page_size, last)
+        registry: List[Dict[str, Any]] = [{"Документ": document} for document in self.documents[start:end]]
+        self.stats["documents_served"] += len(registry)
+
+        return self.rpc_result({
+            "Реестр": registry,
+            "Навигация": {
+                "Страница": str(page),
+                "РазмерСтраницы": str(page_size),
+                "ЕстьЕще": "Да" if end < last else "Нет",
+            },
+        }, request_id)
+
+    def read_document(self, params: Dict[str, Any], request_id: Any) -> web.Response:
+        document_id = (params.get("Документ") or {}).get("Идентификатор")
+        document = self.by_id.get(document_id)
+        if document is None:
+            return self.rpc_error(f"Документ {document_id} не найден", request_id)
+        return self.rpc_result(document, request_id)
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return json_response({
+            "documents": len(self.documents),
+            "active_sessions": len(self.sessions),
+            **self.stats
+        })
+
+    async def reset_stats(self, request: web.Request) -> web.Response:
+        self.stats.clear()
+        return json_response({"status": "ok"})
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/auth/service/", self.handle)
+        app.router.add_post("/service/", self.handle)
+        app.router.add_get("/stats", self.get_stats)
+        app.router.add_post("/stats/reset", self.reset_stats)
+        return app
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Заглушка JSON-RPC API СБИС")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--documents", type=int, default=10000, help="размер набора документов")
+    parser.add_argument("--days", type=int, default=30, help="даты документов - последние N дней")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--fns-ratio", type=float, default=0.08, help="доля писем ФНС")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="медиана задержки ответа")
+    parser.add_argument("--latency-sigma", type=float, default=0.0, help="разброс логнормальной задержки")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="запросов в секунду, сверх - 429")
+    parser.add_argument("--session-ttl", type=float, default=0.0, help="время жизни сессии, с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 5xx")
+    parser.add_argument("--login", help="ожидаемый логин (по умолчанию любой)")
+    parser.add_argument("--password", help="ожидаемый пароль (по умолчанию любой)")
+    args = parser.parse_args(argv)
+
+    stub = SBISStub(
+        documents=args.documents,
+        days=args.days,
+        seed=args.seed,
+        fns_ratio=args.fns_ratio,
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        rate_limit=args.rate_limit,
+        session_ttl=args.session_ttl,
+        error_rate=args.error_rate,
+        login=args.login,
+        password=args.password
+    )
+    base_url = f"http://{args.host}:{args.port}"
+    logger.info(f"Заглушка СБИС: {len(stub.documents)} документов на {base_url}")
+    logger.info(f"SBIS_BASE_URL={base_url}")
+    logger.info(f"SBIS_AUTH_URL={base_url}/auth/service/")
+    logger.info(f"SBIS_SERVICE_URL={base_url}/service/?srv=1&protocol=4")
+    web.run_app(stub.make_app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
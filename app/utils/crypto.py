@@ -0,0 +1,41 @@
+"""
+Шифрование паролей учетных записей СБИС в базе
+
+Пароль нужен в открытом виде для авторизации в СБИС, поэтому он не
+хешируется, а шифруется (Fernet) ключом ACCOUNT_SECRET_KEY. Ключ:
+`python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"`.
+Значения без префикса - пароли, записанные до шифрования (make migrate
+их шифрует).
+"""
+from typing import Optional
+from cryptography.fernet import Fernet, InvalidToken
+from app.config import settings
+
+PREFIX = "fernet:"
+
+
+class SecretKeyMissing(RuntimeError):
+    pass
+
+
+def _fernet() -> Fernet:
+    if not settings.ACCOUNT_SECRET_KEY:
+        raise SecretKeyMissing("ACCOUNT_SECRET_KEY не задан")
+    return Fernet(settings.ACCOUNT_SECRET_KEY.encode())
+
+
+def encrypt_secret(value: str) -> str:
+    return PREFIX + _fernet().encrypt(value.encode("utf-8")).decode("ascii")
+
+
+def decrypt_secret(value: Optional[str]) -> Optional[str]:
+    if not value or not value.startswith(PREFIX):
+        return value
+    try:
+        return _fernet().decrypt(value[len(PREFIX):].encode("ascii")).decode("utf-8")
+    except InvalidToken:
+        raise ValueError("Пароль зашифрован другим ключом ACCOUNT_SECRET_KEY")
+
+
+def is_encrypted(value: Optional[str]) -> bool:
+    return bool(value) and value.startswith(PREFIX)
@@ -0,0 +1,124 @@
+"""
+Метрики Prometheus
+
+API отдает метрики на /metrics, воркеры Celery и демон загрузки - на
+METRICS_EXPORTER_PORT. Процессы prefork-воркера и uvicorn с несколькими
+воркерами пишут метрики в файлы каталога PROMETHEUS_MULTIPROC_DIR
+(переменная окружения), экспорт собирает их вместе. Без переменной
+метрики хранятся в памяти процесса.
+
+Метки одинаковые во всех метриках: stage - этап загрузки,
+sbis_method - метод API СБИС, operation - тип SQL запроса,
+method/route/status - HTTP запрос к API.
+"""
+import os
+import time
+from contextlib import contextmanager
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+    start_http_server
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.utils.run_stats import record_stage
+
+# Этапы загрузки: от авторизации в СБИС до записи в БД
+STAGES = ("sbis_auth", "sbis_list_documents", "json_decode", "parse", "classify", "db_write")
+
+STAGE_SECONDS = Histogram(
+    "fns_ingest_stage_seconds", "Длительность этапа загрузки документов", ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+DOCUMENTS = Counter(
+    "fns_ingest_documents_total", "Документы, прошедшие загрузку (received/new/fns)", ["kind"]
+)
+SBIS_REQUESTS = Counter(
+    "fns_sbis_requests_total", "Запросы к API СБИС по HTTP статусу", ["sbis_method", "status"]
+)
+SBIS_REQUEST_SECONDS = Histogram(
+    "fns_sbis_request_seconds", "Длительность запроса к API СБИС (с ожиданием лимита)", ["sbis_method"]
+)
+SBIS_RETRIES = Counter(
+    "fns_sbis_retries_total", "Повторы запросов к СБИС после 429/5xx", ["sbis_method"]
+)
+SBIS_ERRORS = Counter(
+    "fns_sbis_errors_total", "Ошибки СБИС: http, api (error в ответе), exception", ["sbis_method", "reason"]
+)
+DB_QUERY_SECONDS = Histogram(
+    "fns_db_query_seconds", "Длительность SQL запроса", ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "fns_http_request_seconds", "Длительность HTTP запроса к API", ["method", "route", "status"]
+)
+
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage=stage).observe(seconds)
+    record_stage(stage, seconds)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Замер этапа загрузки: `with stage_timer("parse"): ...`"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def count_documents(received: int, new: int, fns: int) -> None:
+    DOCUMENTS.labels(kind="received").inc(received)
+    DOCUMENTS.labels(kind="new").inc(new)
+    DOCUMENTS.labels(kind="fns").inc(fns)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Время SQL запросов через события SQLAlchemy
+
+    Начало запроса хранится в контексте выполнения, а не в conn.info:
+    при ошибке запроса after_cursor_execute не вызывается, и значение
+    уходит вместе с контекстом, не оставаясь на соединении в пуле.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_query_started", None)
+        if started is None:
+            return
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+        DB_QUERY_SECONDS.labels(
+            operation=operation if operation in SQL_OPERATIONS else "OTHER"
+        ).observe(time.perf_counter() - started)
+
+
+def _registry():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render_latest():
+    """Тело и Content-Type ответа /metrics"""
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def start_exporter(port: int) -> None:
+    """HTTP экспорт метрик для процессов без API (воркер Celery, демон загрузки)"""
+    start_http_server(port, registry=_registry())
+
+
+def mark_process_dead(pid: int) -> None:
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
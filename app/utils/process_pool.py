@@ -0,0 +1,81 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, List, Optional
+from app.utils.logger import logger
+
+
+def can_use_process_pool() -> bool:
+    """
+    Можно ли запускать дочерние процессы из текущего процесса
+
+    Процессы пула Celery (prefork) демонические, multiprocessing
+    запрещает им порождать детей - там работа выполняется на месте.
+    """
+    return not multiprocessing.current_process().daemon
+
+
+class LazyProcessPool:
+    """
+    Пул процессов, создаваемый при первом обращении
+
+    get() возвращает None, если пул выключен (max_workers <= 0) или
+    текущему процессу нельзя порождать дочерние - вызывающий код тогда
+    выполняет работу на месте.
+    """
+
+    def __init__(self, name: str, initializer: Optional[Callable] = None, start_method: Optional[str] = None):
+        self.name = name
+        self.initializer = initializer
+        self.start_method = start_method
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._workers = 0
+        self._inline_logged = False
+
+    def get(self, max_workers: int) -> Optional[ProcessPoolExecutor]:
+        if max_workers <= 0:
+            return None
+        if not can_use_process_pool():
+            if not self._inline_logged:
+                logger.info(f"{self.name}: демонический процесс (prefork Celery), работа на месте")
+                self._inline_logged = True
+            return None
+
+        if self._executor is None or self._workers != max_workers:
+            self.shutdown()
+            self._executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context(self.start_method) if self.start_method else None,
+                initializer=self.initializer
+            )
+            self._workers = max_workers
+            logger.info(f"{self.name}: создан пул, процессов {max_workers}")
+
+        return self._executor
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._workers = 0
+
+
+_pool = LazyProcessPool("Общий пул процессов")
+
+
+def get_process_pool(max_workers: int) -> Optional[ProcessPoolExecutor]:
+    """Общий пул процессов (создается при первом обращении)"""
+    return _pool.get(max_workers)
+
+
+def map_in_pool(func: Callable, items: Iterable, max_workers: int) -> List:
+    """map через пул процессов, либо в текущем процессе если пул недоступен"""
+    items = list(items)
+    pool = get_process_pool(max_workers) if len(items) > 1 else None
+    if pool is None:
+        return [func(item) for item in items]
+
+    return list(pool.map(func, items))
+
+
+def shutdown_process_pool() -> None:
+    _pool.shutdown()
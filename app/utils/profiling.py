@@ -0,0 +1,146 @@
+"""
+Профилирование запросов API и задач Celery по запросу
+
+Профиль (cProfile, формат pstats) пишется в PROFILES_DIR. Включается:
+- аргумент profile=True задачи: task.apply_async(kwargs={..., "profile": True});
+- PROFILING_ENABLED с PROFILING_ADMIN_TOKEN - запросы API с заголовком
+  X-Profile: <токен>;
+- PROFILING_ENABLED без токена - все запросы и задачи (только для отладки).
+
+Middleware запросов (ProfilingMiddleware) подключается только при
+PROFILING_ENABLED, без него запросы идут без обертки. Просмотр:
+`python -m pstats файл` или snakeviz.
+"""
+import cProfile
+import hmac
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List
+from celery import Task
+from app.config import settings
+from app.utils.logger import logger
+
+PROFILE_SUFFIX = ".prof"
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_")[:80] or "root"
+
+
+@contextmanager
+def profiled(kind: str, name: str):
+    """
+    cProfile вокруг блока, профиль сохраняется при выходе (и при ошибке)
+
+    cProfile видит только текущий поток: для async-обработчиков в профиль
+    попадает весь event loop за время запроса, синхронные обработчики
+    FastAPI выполняются в пуле потоков и в профиль не попадают.
+    """
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        elapsed_ms = round((time.perf_counter() - started) * 1000)
+        os.makedirs(settings.PROFILES_DIR, exist_ok=True)
+        filename = (
+            f"{kind}-{_safe_name(name)}-{time.strftime('%Y%m%d_%H%M%S')}-"
+            f"{elapsed_ms}ms-{uuid.uuid4().hex[:6]}{PROFILE_SUFFIX}"
+        )
+        profiler.dump_stats(os.path.join(settings.PROFILES_DIR, filename))
+        logger.info(f"Профиль сохранен: {filename}")
+        _cleanup()
+
+
+def _cleanup() -> None:
+    """Оставляем PROFILES_KEEP последних профилей"""
+    profiles = list_profiles()
+    for profile in profiles[settings.PROFILES_KEEP:]:
+        try:
+            os.remove(os.path.join(settings.PROFILES_DIR, profile["filename"]))
+        except OSError:
+            pass
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """Сохраненные профили, новые первыми"""
+    if not os.path.isdir(settings.PROFILES_DIR):
+        return []
+
+    profiles = []
+    for entry in os.scandir(settings.PROFILES_DIR):
+        if entry.is_file() and entry.name.endswith(PROFILE_SUFFIX):
+            stat = entry.stat()
+            profiles.append({
+                "filename": entry.name,
+                "size": stat.st_size,
+                "created_at": stat.st_mtime
+            })
+    return sorted(profiles, key=lambda profile: profile["created_at"], reverse=True)
+
+
+def profile_path(filename: str) -> str:
+    """Путь к профилю; имена вне PROFILES_DIR не принимаются"""
+    if os.path.basename(filename) != filename or not filename.endswith(PROFILE_SUFFIX):
+        raise ValueError("Неверное имя файла профиля")
+    return os.path.join(settings.PROFILES_DIR, filename)
+
+
+def profile_everything() -> bool:
+    """Профилировать все запросы и задачи: PROFILING_ENABLED без токена"""
+    return settings.PROFILING_ENABLED and not settings.PROFILING_ADMIN_TOKEN
+
+
+def request_profiling_requested(profile_header: str) -> bool:
+    if not settings.PROFILING_ENABLED:
+        return False
+    if not settings.PROFILING_ADMIN_TOKEN:
+        return True
+    return hmac.compare_digest(profile_header, settings.PROFILING_ADMIN_TOKEN)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware профилирования запросов (подключается при PROFILING_ENABLED)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or ())
+        if not request_profiling_requested(headers.get(b"x-profile", b"").decode("latin-1")):
+            return await self.app(scope, receive, send)
+
+        with profiled("request", f"{scope['method']}-{scope['path']}"):
+            await self.app(scope, receive, send)
+
+
+class ProfiledTask(Task):
+    """
+    Базовый класс задач: profile=True в kwargs включает профилирование запуска
+
+    Аргумент переносится в заголовок сообщения, поэтому сигнатуры задач
+    не меняются.
+    """
+
+    def apply_async(self, args=None, kwargs=None, **options):
+        if kwargs and "profile" in kwargs:
+            kwargs = dict(kwargs)
+            if kwargs.pop("profile"):
+                options["headers"] = {**(options.get("headers") or {}), "profile": True}
+        return super().apply_async(args, kwargs, **options)
+
+    def __call__(self, *args, **kwargs):
+        profile = self.request.get("profile") or (self.request.headers or {}).get("profile")
+        if not (profile or profile_everything()):
+            return super().__call__(*args, **kwargs)
+
+        with profiled("task", self.name.rsplit(".", 1)[-1]):
+            return super().__call__(*args, **kwargs)
@@ -0,0 +1,27 @@
+import redis
+import redis.asyncio as aioredis
+from typing import Optional
+from app.config import settings
+
+_redis: Optional[redis.Redis] = None
+
+
+def get_redis() -> redis.Redis:
+    """Синхронный клиент Redis (общий на процесс)"""
+    global _redis
+
+    if _redis is None:
+        _redis = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+
+    return _redis
+
+
+def create_async_redis() -> aioredis.Redis:
+    """
+    Новый асинхронный клиент Redis
+
+    Асинхронный клиент привязан к event loop, а Celery задачи создают
+    новый loop на каждый вызов asyncio.run, поэтому клиент создается
+    владельцем (например SBISClient) и закрывается вместе с ним.
+    """
+    return aioredis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
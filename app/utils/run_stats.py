@@ -0,0 +1,134 @@
+"""
+Показатели одного запуска загрузки для ProcessingLog
+
+Сборщик задается через ContextVar на время задачи, его пополняют
+stage_timer (длительность этапов), SBISClient (байты ответов) и
+save_documents (строки). Корутины asyncio.gather наследуют контекст,
+поэтому учетные записи, загружаемые параллельно, пишут в один сборщик:
+длительность этапа - суммарная по всем учетным записям.
+
+peak_rss_kb - наибольший текущий RSS процесса, замеренный во время
+запуска (при создании сборщика и при каждом пополнении), а не ru_maxrss:
+тот хранит пик за всю жизнь процесса, и долгоживущий воркер показывал
+бы у всех запусков пик самого тяжелого из прошлых.
+"""
+import os
+import resource
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Optional
+
+_PAGE_KB = os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def current_rss_kb() -> Optional[int]:
+    """Текущий RSS процесса в КБ (None - нет /proc, не Linux)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_KB
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _max_rss_kb() -> int:
+    # ru_maxrss - пик процесса в КБ (Linux) за все время его работы
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class RunStats:
+    def __init__(self):
+        self.stage_durations: Dict[str, float] = defaultdict(float)
+        self.sbis_bytes_received = 0
+        self.rows_inserted = 0
+        self.rows_updated = 0
+        self.rows_skipped = 0
+        self.peak_rss_kb = current_rss_kb()
+        self._max_rss_baseline_kb = _max_rss_kb()
+
+    def sample_rss(self) -> None:
+        rss = current_rss_kb()
+        if rss is not None and rss > (self.peak_rss_kb or 0):
+            self.peak_rss_kb = rss
+
+    def run_peak_rss_kb(self) -> Optional[int]:
+        """
+        Пик RSS за запуск
+
+        Без /proc пик известен, только если запуск поднял ru_maxrss
+        процесса выше значения на старте сборщика.
+        """
+        self.sample_rss()
+        if self.peak_rss_kb is not None:
+            return self.peak_rss_kb
+        max_rss = _max_rss_kb()
+        return max_rss if max_rss > self._max_rss_baseline_kb else None
+
+    def apply_to(self, log_entry, retries: int = 0, finished: bool = True) -> None:
+        """
+        Добавление показателей к строке ProcessingLog
+
+        Задача, продолжаемая частями, пишет в ту же строку: показатели
+        частей складываются, finished_at ставится после последней.
+        """
+        stages = dict(log_entry.stage_durations or {})
+        for stage, seconds in self.stage_durations.items():
+            stages[stage] = round(stages.get(stage, 0.0) + seconds, 4)
+        log_entry.stage_durations = stages
+
+        log_entry.sbis_bytes_received = (log_entry.sbis_bytes_received or 0) + self.sbis_bytes_received
+        log_entry.rows_inserted = (log_entry.rows_inserted or 0) + self.rows_inserted
+        log_entry.rows_updated = (log_entry.rows_updated or 0) + self.rows_updated
+        log_entry.rows_skipped = (log_entry.rows_skipped or 0) + self.rows_skipped
+        peak_rss_kb = self.run_peak_rss_kb()
+        if peak_rss_kb is not None:
+            log_entry.peak_rss_kb = max(log_entry.peak_rss_kb or 0, peak_rss_kb)
+        log_entry.retry_count = retries
+
+        if finished:
+            log_entry.finished_at = datetime.now()
+            if log_entry.started_at:
+                log_entry.duration_seconds = (log_entry.finished_at - log_entry.started_at).total_seconds()
+
+
+_current: ContextVar[Optional[RunStats]] = ContextVar("run_stats", default=None)
+
+
+@contextmanager
+def collect_run_stats(stats: Optional[RunStats] = None):
+    """
+    `with collect_run_stats() as stats: ...` - показатели кода внутри блока
+
+    Переданный stats продолжает начатый сборщик, например в потоке
+    записи, куда контекст event loop не переходит.
+    """
+    stats = stats or RunStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    stats = _current.get()
+    if stats is not None:
+        stats.stage_durations[stage] += seconds
+        stats.sample_rss()
+
+
+def record_sbis_bytes(size: int) -> None:
+    stats = _current.get()
+    if stats is not None:
+        stats.sbis_bytes_received += size
+        stats.sample_rss()
+
+
+def record_rows(inserted: int = 0, updated: int = 0, skipped: int = 0) -> None:
+    stats = _current.get()
+    if stats is not None:
+        stats.rows_inserted += inserted
+        stats.rows_updated += updated
+        stats.rows_skipped += skipped
+        stats.sample_rss()
@@ -0,0 +1,289 @@
+"""
+Нагрузочный тест HTTP API
+
+    python -m benchmarks.load_test --url http://localhost:8000 --concurrency 1,4,16,64
+    python -m benchmarks.load_test --seed-documents 100000 --duration 30
+    python -m benchmarks.load_test --baseline benchmarks/results/load_baseline.json
+
+Каждый из concurrency клиентов в цикле отправляет запрос из сценария
+SCENARIO (выбор по весам, seed фиксирован) и сразу следующий после ответа.
+На каждом уровне конкурентности замеряются пропускная способность и
+p50/p95/p99 по маршрутам, первые --warmup секунд в замер не входят.
+"Колено" - уровень, после которого пропускная способность растет меньше
+чем на KNEE_GAIN, а задержки продолжают расти.
+
+С --seed-documents в DATABASE_URL (та же база, что у API) записываются
+синтетические документы под временной учетной записью, сценарий
+фильтрует по ней, после теста данные удаляются.
+
+Результат - JSON в формате benchmarks.run: name - load:<маршрут>,
+size - число клиентов, median - p50 в секундах.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from benchmarks.run import RESULTS_DIR, BenchmarkRunner, compare, git_revision
+
+# (маршрут, вес, метод, путь); {account} - фильтр учетной записи, {page} - смещение
+SCENARIO: List[Tuple[str, int, str, str]] = [
+    ("documents", 30, "GET", "/api/v1/documents/?skip={page}&limit=100{account}"),
+    ("documents_fns", 15, "GET", "/api/v1/documents/?fns_only=true&limit=100{account}"),
+    ("documents_recent", 10, "GET", "/api/v1/documents/?days_back=7&limit=50{account}"),
+    ("status", 15, "GET", "/api/v1/status"),
+    ("dashboard", 15, "GET", "/api/v1/dashboard?{account_only}"),
+    ("logs", 10, "GET", "/api/v1/logs/?limit=50{account}"),
+    ("generate_report", 5, "POST", "/api/v1/generate-report?fns_only=true&filename=loadtest.json{account}"),
+]
+MAX_PAGE = 50
+KNEE_GAIN = 0.1
+
+
+def percentile(sorted_samples: List[float], q: float) -> float:
+    """Перцентиль по ближайшему рангу, q от 0 до 1"""
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, math.ceil(q * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+class LoadTest:
+    def __init__(self, base_url: str, duration: float, warmup: float, seed: int, account_id: Optional[int] = None):
+        self.base_url = base_url.rstrip("/")
+        self.duration = duration
+        self.warmup = warmup
+        self.rng = random.Random(seed)
+        self.account_id = account_id
+        self.routes = [route for route, _, _, _ in SCENARIO]
+        self.weights = [weight for _, weight, _, _ in SCENARIO]
+        self.requests = {route: (method, path) for route, _, method, path in SCENARIO}
+
+    def url(self, route: str) -> str:
+        _, path = self.requests[route]
+        account = f"&account_id={self.account_id}" if self.account_id else ""
+        return self.base_url + path.format(
+            page=self.rng.randint(0, MAX_PAGE) * 100,
+            account=account,
+            account_only=account.lstrip("&")
+        )
+
+    async def client(
+            self,
+            session: aiohttp.ClientSession,
+            measure_from: float,
+            stop_at: float,
+            latencies: Dict[str, List[float]],
+            errors: Dict[str, int]
+    ) -> None:
+        while time.perf_counter() < stop_at:
+            route = self.rng.choices(self.routes, self.weights)[0]
+            method = self.requests[route][0]
+            started = time.perf_counter()
+            try:
+                async with session.request(method, self.url(route)) as response:
+                    await response.read()
+                    failed = response.status >= 400
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                failed = True
+            finished = time.perf_counter()
+
+            if started < measure_from:
+                continue
+            latencies[route].append(finished - started)
+            if failed:
+                errors[route] += 1
+
+    async def run_level(self, concurrency: int) -> Dict[str, Any]:
+        latencies: Dict[str, List[float]] = defaultdict(list)
+        errors: Dict[str, int] = defaultdict(int)
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        timeout = aiohttp.ClientTimeout(total=60)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            started = time.perf_counter()
+            measure_from = started + self.warmup
+            stop_at = measure_from + self.duration
+            await asyncio.gather(*[
+                self.client(session, measure_from, stop_at, latencies, errors) for _ in range(concurrency)
+            ])
+            # Запросы, начатые до stop_at, досчитываются - окно чуть длиннее duration
+            elapsed = time.perf_counter() - measure_from
+
+        routes = {}
+        for route in self.routes:
+            samples = sorted(latencies.get(route, []))
+            if samples:
+                routes[route] = self.summary(samples, errors.get(route, 0), elapsed)
+        everything = sorted(sample for samples in latencies.values() for sample in samples)
+        return {
+            "concurrency": concurrency,
+            "elapsed": round(elapsed, 3),
+            "total": self.summary(everything, sum(errors.values()), elapsed) if everything else None,
+            "routes": routes,
+        }
+
+    @staticmethod
+    def summary(samples: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+        return {
+            "requests": len(samples),
+            "errors": errors,
+            "throughput": round(len(samples) / elapsed, 2),
+            "p50": round(percentile(samples, 0.5), 6),
+            "p95": round(percentile(samples, 0.95), 6),
+            "p99": round(percentile(samples, 0.99), 6),
+            "min": round(samples[0], 6),
+            "max": round(samples[-1], 6),
+        }
+
+
+def find_knee(levels: List[Dict[str, Any]]) -> Optional[int]:
+    """Уровень конкурентности, после которого пропускная способность почти не растет"""
+    for previous, current in zip(levels, levels[1:]):
+        if not previous["total"] or not current["total"]:
+            continue
+        gain = current["total"]["throughput"] / previous["total"]["throughput"] - 1
+        if gain < KNEE_GAIN and current["total"]["p99"] > previous["total"]["p99"]:
+            return previous["concurrency"]
+    return None
+
+
+def to_results(levels: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Уровни нагрузки в записи формата benchmarks.run"""
+    results = []
+    for level in levels:
+        entries = dict(level["routes"])
+        if level["total"]:
+            entries["all"] = level["total"]
+        for route, summary in entries.items():
+            results.append({
+                "name": f"load:{route}",
+                "size": level["concurrency"],
+                "per": "request",
+                "median": summary["p50"],
+                **summary,
+            })
+    return results
+
+
+def seed_documents(count: int, seed: int) -> int:
+    """Временная учетная запись с count синтетическими документами"""
+    from app.database import Base, SessionLocal, engine
+    from app.models.models import SBISAccount
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        account = SBISAccount(name="load-test", login=f"load-{uuid.uuid4().hex}", password="-", is_active=False)
+        db.add(account)
+        db.commit()
+        elapsed = BenchmarkRunner(seed, 200, 1, 0).bench_ingest(db, account.id, count)
+        print(f"Записано {count} документов за {elapsed:.1f} с (учетная запись {account.id})")
+        return account.id
+    finally:
+        db.close()
+
+
+def drop_documents(account_id: int) -> None:
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        BenchmarkRunner.cleanup(db, account_id)
+    finally:
+        db.close()
+
+
+def print_level(level: Dict[str, Any]) -> None:
+    print(f"Клиентов: {level['concurrency']}")
+    entries = dict(level["routes"])
+    if level["total"]:
+        entries["all"] = level["total"]
+    for route, s in entries.items():
+        print(
+            f"  {route:<18} {s['throughput']:8.1f} rps  p50 {s['p50'] * 1000:8.1f}  "
+            f"p95 {s['p95'] * 1000:8.1f}  p99 {s['p99'] * 1000:8.1f} мс  ошибок {s['errors']}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест HTTP API")
+    parser.add_argument("--url", default="http://localhost:8000", help="адрес API")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="уровни конкурентности через запятую")
+    parser.add_argument("--duration", type=float, default=20.0, help="секунд замера на уровень")
+    parser.add_argument("--warmup", type=float, default=3.0, help="секунд прогрева на уровень")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--seed-documents", type=int, default=0, help="записать N синтетических документов")
+    parser.add_argument("--account-id", type=int, help="фильтр учетной записи без --seed-documents")
+    parser.add_argument("--output", help="файл результата (по умолчанию benchmarks/results/load_<время>.json)")
+    parser.add_argument("--baseline", help="результат для сравнения")
+    parser.add_argument("--threshold", type=float, default=1.2, help="допустимое замедление p50, раз")
+    args = parser.parse_args(argv)
+
+    levels_config = [int(level) for level in args.concurrency.split(",")]
+    account_id = seed_documents(args.seed_documents, args.seed) if args.seed_documents else args.account_id
+
+    try:
+        test = LoadTest(args.url, args.duration, args.warmup, args.seed, account_id)
+        levels = []
+        for concurrency in levels_config:
+            level = asyncio.run(test.run_level(concurrency))
+            print_level(level)
+            levels.append(level)
+    finally:
+        if args.seed_documents and account_id:
+            drop_documents(account_id)
+
+    knee = find_knee(levels)
+    print(f"Колено: {knee} клиентов" if knee else "Колено не найдено, увеличьте --concurrency")
+
+    results = to_results(levels)
+    regressions = compare(results, args.baseline, args.threshold) if args.baseline else []
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "meta": {
+                "created_at": datetime.now().isoformat(),
+                "git_revision": git_revision(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "url": args.url,
+                "seed": args.seed,
+                "concurrency": levels_config,
+                "duration": args.duration,
+                "warmup": args.warmup,
+                "seed_documents": args.seed_documents,
+                "scenario": [{"route": r, "weight": w, "method": m, "path": p} for r, w, m, p in SCENARIO],
+                "knee": knee,
+                "baseline": args.baseline,
+                "threshold": args.threshold,
+            },
+            "results": results,
+            "regressions": [f"{r['name']}@{r['size']}" for r in regressions],
+        }, f, ensure_ascii=False, indent=2)
+    print(f"Результат: {output}")
+
+    for result in regressions:
+        print(
+            f"РЕГРЕССИЯ {result['name']}@{result['size']}: p50 {result['median']:.4f} с "
+            f"против {result['baseline_median']:.4f} с (x{result['ratio']})",
+            file=sys.stderr
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
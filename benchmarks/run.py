@@ -0,0 +1,361 @@
+"""
+Бенчмарки загрузки на синтетических ответах СБИС
+
+    python -m benchmarks.run                                  # 10k и 100k документов, без БД
+    python -m benchmarks.run --sizes 10000,100000,1000000
+    python -m benchmarks.run --db                             # + запись в БД, отчет, API
+    python -m benchmarks.run --page-size 2000 --parse-workers 4    # + пул разбора
+    python -m benchmarks.run --baseline benchmarks/results/baseline.json --threshold 1.2
+
+Ответы генерирует SBISPayloadGenerator (seed фиксирован), время генерации
+в замеры не входит. С --db данные пишутся в DATABASE_URL под отдельной
+учетной записью и удаляются после замера - используйте отдельную базу.
+
+Результат сохраняется в JSON (benchmarks/results/), с --baseline медиана
+каждого замера сравнивается с базовой: замедление больше --threshold
+раз - код выхода 1. Логи приложения на время замеров - только WARNING.
+memory_documents - память разобранных документов (tracemalloc, байт),
+сравнивается с базовой так же.
+"""
+import argparse
+import asyncio
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from app.utils.logger import logger
+
+logger.remove()
+logger.add(sys.stderr, level="WARNING")
+
+from app.services.common import DocumentProcessor  # noqa: E402
+from app.services.parse_pool import ParsePool  # noqa: E402
+from app.services.sbis_client import SBISClient  # noqa: E402
+from app.services.sbis_stream import RegistryDecoder  # noqa: E402
+from app.testing.sbis_payloads import SBISPayloadGenerator  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+class _BytesStream:
+    """Тело ответа как поток aiohttp (async read)"""
+
+    def __init__(self, body: bytes):
+        self.buffer = io.BytesIO(body)
+
+    async def read(self, size: int = -1) -> bytes:
+        return self.buffer.read(size)
+
+
+class BenchmarkRunner:
+    def __init__(self, seed: int, page_size: int, repeats: int, requests: int):
+        self.seed = seed
+        self.page_size = page_size
+        self.repeats = repeats
+        self.requests = requests
+        self.results: List[Dict[str, Any]] = []
+
+    def pages(self, size: int):
+        return SBISPayloadGenerator(seed=self.seed).pages(size, self.page_size)
+
+    def record(self, name: str, size: int, samples: List[float], per: str = "run") -> None:
+        median = statistics.median(samples)
+        result = {
+            "name": name,
+            "size": size,
+            "per": per,
+            "samples": [round(sample, 6) for sample in samples],
+            "median": round(median, 6),
+            "min": round(min(samples), 6),
+        }
+        if per == "run" and median > 0:
+            result["docs_per_second"] = round(size / median)
+        self.results.append(result)
+        rate = f", {result['docs_per_second']} док/с" if "docs_per_second" in result else ""
+        print(f"  {name:<28} {size:>9}  {median * 1000:10.1f} мс{rate}")
+
+    def repeat(self, name: str, size: int, run: Callable[[], float]) -> None:
+        self.record(name, size, [run() for _ in range(self.repeats)])
+
+    # --- без БД ---
+
+    def bench_json_decode(self, size: int) -> float:
+        elapsed = 0.0
+        for page in self.pages(size):
+            body = json.dumps(page, ensure_ascii=False).encode("utf-8")
+            started = time.perf_counter()
+            json.loads(body)
+            elapsed += time.perf_counter() - started
+        return elapsed
+
+    def bench_stream_decode(self, size: int) -> float:
+        """Потоковый разбор (RegistryDecoder) тех же ответов, тело отдается частями"""
+        elapsed = 0.0
+        for page in self.pages(size):
+            stream = _BytesStream(json.dumps(page, ensure_ascii=False).encode("utf-8"))
+            started = time.perf_counter()
+            asyncio.run(RegistryDecoder(stream).decode())
+            elapsed += time.perf_counter() - started
+        return elapsed
+
+    def bench_parse(self, size: int) -> float:
+        client = SBISClient()
+        elapsed = 0.0
+        for page in self.pages(size):
+            started = time.perf_counter()
+            client.parse_documents(page)
+            elapsed += time.perf_counter() - started
+        return elapsed
+
+    def bench_parse_pool(self, size: int, pool) -> float:
+        """Разбор и классификация в пуле процессов (ParsePool)"""
+        client = SBISClient()
+        elapsed = 0.0
+        for page in self.pages(size):
+            started = time.perf_counter()
+            asyncio.run(pool.parse_documents(client, page))
+            elapsed += time.perf_counter() - started
+        return elapsed
+
+    def bench_classify(self, size: int) -> float:
+        client = SBISClient()
+        elapsed = 0.0
+        for page in self.pages(size):
+            documents = client.parse_documents(page)
+            started = time.perf_counter()
+            DocumentProcessor.filter_fns_documents(documents)
+            elapsed += time.perf_counter() - started
+        return elapsed
+
+    def bench_memory(self, size: int) -> None:
+        """
+        Память, которую занимают size разобранных документов
+
+        Ответы генерируются и разбираются под tracemalloc по странице,
+        в замер входит то, что осталось после разбора: записи документов
+        и строки, на которые они ссылаются.
+        """
+        client = SBISClient()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            documents = [document for page in self.pages(size) for document in client.parse_documents(page)]
+            gc.collect()
+            retained, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del documents
+
+        self.results.append({
+            "name": "memory_documents",
+            "size": size,
+            "per": "bytes",
+            "median": retained,
+            "min": retained,
+            "bytes_per_document": round(retained / size),
+        })
+        print(f"  {'memory_documents':<28} {size:>9}  {retained / 2 ** 20:10.1f} МБ, {retained // size} байт/док")
+
+    def run_cpu(self, size: int, parse_workers: int = 0) -> None:
+        self.repeat("json_decode", size, lambda: self.bench_json_decode(size))
+        self.repeat("json_decode_stream", size, lambda: self.bench_stream_decode(size))
+        self.repeat("parse_documents", size, lambda: self.bench_parse(size))
+        self.repeat("filter_fns_documents", size, lambda: self.bench_classify(size))
+        self.bench_memory(size)
+        if parse_workers:
+            pool = ParsePool(workers=parse_workers, chunk_size=max(1, self.page_size // parse_workers))
+            try:
+                # Первый вызов запускает процессы пула - в замер не входит
+                asyncio.run(pool.parse_documents(SBISClient(), next(self.pages(self.page_size))))
+                self.repeat(f"parse_pool_{parse_workers}", size, lambda: self.bench_parse_pool(size, pool))
+            finally:
+                pool.shutdown()
+
+    # --- с БД ---
+
+    def run_db(self, size: int) -> None:
+        from app.database import Base, SessionLocal, engine
+        from app.models.models import SBISAccount
+
+        Base.metadata.create_all(bind=engine)
+
+        ingest_samples = []
+        for attempt in range(self.repeats):
+            db = SessionLocal()
+            account = SBISAccount(name="benchmark", login=f"bench-{uuid.uuid4().hex}", password="-", is_active=False)
+            db.add(account)
+            db.commit()
+            try:
+                ingest_samples.append(self.bench_ingest(db, account.id, size))
+                # Чтение - на данных последнего прогона записи
+                if attempt == self.repeats - 1:
+                    self.record("ingest_db", size, ingest_samples)
+                    self.bench_reads(db, account.id, size)
+            finally:
+                self.cleanup(db, account.id)
+                db.close()
+
+    def bench_ingest(self, db, account_id: int, size: int) -> float:
+        from app.services.fns_filter import FNSFilterService
+
+        client = SBISClient()
+        elapsed = 0.0
+        for page in self.pages(size):
+            documents = client.parse_documents(page)
+            started = time.perf_counter()
+            FNSFilterService.save_documents(db, documents, source="benchmark", account_id=account_id)
+            db.commit()
+            elapsed += time.perf_counter() - started
+        return elapsed
+
+    def bench_reads(self, db, account_id: int, size: int) -> None:
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from app.api.routes import router
+        from app.models.models import MailDocument
+        from app.services.json_report_service import JSONReportService
+
+        with tempfile.TemporaryDirectory() as reports_dir:
+            reports = JSONReportService(reports_dir=reports_dir)
+
+            def report() -> float:
+                started = time.perf_counter()
+                documents = db.query(MailDocument).filter(MailDocument.account_id == account_id).all()
+                reports.generate_report(documents, "benchmark", filename="benchmark.json")
+                elapsed = time.perf_counter() - started
+                db.expunge_all()
+                return elapsed
+
+            self.repeat("generate_report", size, report)
+
+        app = FastAPI()
+        app.include_router(router, prefix="/api/v1")
+        client = TestClient(app, raise_server_exceptions=False)
+        endpoints = {
+            "api:documents": f"/api/v1/documents/?account_id={account_id}&limit=100",
+            "api:documents_fns": f"/api/v1/documents/?account_id={account_id}&fns_only=true&limit=100",
+            "api:search": f"/api/v1/documents/search?q=требование&account_id={account_id}&limit=50",
+            "api:dashboard": f"/api/v1/dashboard?account_id={account_id}",
+        }
+        for name, url in endpoints.items():
+            samples = []
+            for _ in range(self.requests):
+                started = time.perf_counter()
+                response = client.get(url)
+                samples.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    print(f"  {name}: HTTP {response.status_code}, замер пропущен", file=sys.stderr)
+                    samples = []
+                    break
+            if samples:
+                self.record(name, size, samples, per="request")
+
+    @staticmethod
+    def cleanup(db, account_id: int) -> None:
+        from app.models.models import MailAttachment, MailDocument, SBISAccount
+
+        db.rollback()
+        documents = db.query(MailDocument.id).filter(MailDocument.account_id == account_id)
+        db.query(MailAttachment).filter(MailAttachment.document_id.in_(documents.scalar_subquery())).delete(
+            synchronize_session=False
+        )
+        db.query(MailDocument).filter(MailDocument.account_id == account_id).delete(synchronize_session=False)
+        db.query(SBISAccount).filter(SBISAccount.id == account_id).delete(synchronize_session=False)
+        db.commit()
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, threshold: float) -> List[Dict[str, Any]]:
+    """Замеры, медиана которых выросла больше чем в threshold раз"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["name"], r["size"]): r for r in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        base = baseline.get((result["name"], result["size"]))
+        if not base or not base["median"]:
+            continue
+        ratio = result["median"] / base["median"]
+        result["baseline_median"] = base["median"]
+        result["ratio"] = round(ratio, 3)
+        if ratio > threshold:
+            regressions.append(result)
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарки загрузки документов СБИС")
+    parser.add_argument("--sizes", default="10000,100000", help="число документов через запятую")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--page-size", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=20, help="запросов к каждому эндпоинту")
+    parser.add_argument("--parse-workers", type=int, default=0, help="замер пула разбора с N процессами")
+    parser.add_argument("--db", action="store_true", help="замеры записи в БД, отчета и API (DATABASE_URL)")
+    parser.add_argument("--output", help="файл результата (по умолчанию benchmarks/results/<время>.json)")
+    parser.add_argument("--baseline", help="результат для сравнения")
+    parser.add_argument("--threshold", type=float, default=1.2, help="допустимое замедление, раз")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    runner = BenchmarkRunner(args.seed, args.page_size, args.repeats, args.requests)
+
+    for size in sizes:
+        print(f"Документов: {size}")
+        runner.run_cpu(size, args.parse_workers)
+        if args.db:
+            runner.run_db(size)
+
+    regressions = compare(runner.results, args.baseline, args.threshold) if args.baseline else []
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "meta": {
+                "created_at": datetime.now().isoformat(),
+                "git_revision": git_revision(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "seed": args.seed,
+                "page_size": args.page_size,
+                "repeats": args.repeats,
+                "sizes": sizes,
+                "parse_workers": args.parse_workers,
+                "db": args.db,
+                "baseline": args.baseline,
+                "threshold": args.threshold,
+            },
+            "results": runner.results,
+            "regressions": [f"{r['name']}@{r['size']}" for r in regressions],
+        }, f, ensure_ascii=False, indent=2)
+    print(f"Результат: {output}")
+
+    for result in regressions:
+        print(
+            f"РЕГРЕССИЯ {result['name']}@{result['size']}: {result['median']:.4f} с "
+            f"против {result['baseline_median']:.4f} с (x{result['ratio']})",
+            file=sys.stderr
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Скрипт для обновления схемы существующей базы данных
+
+create_all() создает только отсутствующие таблицы, поэтому новые колонки
+и индексы в уже существующих таблицах добавляются здесь. Все команды
+идемпотентны, скрипт можно запускать повторно.
+"""
+
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models import models
+from app.services.accounts import account_service
+from app.utils.logger import logger
+
+
+MIGRATIONS = [
+    # Полнотекстовый поиск по теме и отправителю
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    ALTER TABLE mail_documents ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian', coalesce(subject, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(sender_name, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_mail_documents_search_vector ON mail_documents USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_mail_documents_sender_name_trgm ON mail_documents USING gin (sender_name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_mail_documents_sender_inn_trgm ON mail_documents USING gin (sender_inn gin_trgm_ops)",
+
+    # Вложения: переносим сохраненное ранее имя первого файла
+    """
+    INSERT INTO mail_attachments (document_id, name)
+    SELECT d.id, d.filename
+    FROM mail_documents d
+    WHERE coalesce(d.filename, '') <> ''
+    AND NOT EXISTS (SELECT 1 FROM mail_attachments a WHERE a.document_id = d.id)
+    """,
+
+    # Локальное хранилище файлов вложений
+    "ALTER TABLE mail_attachments ADD COLUMN IF NOT EXISTS sha256 VARCHAR(64)",
+    "ALTER TABLE mail_attachments ADD COLUMN IF NOT EXISTS stored_size BIGINT",
+    "ALTER TABLE mail_attachments ADD COLUMN IF NOT EXISTS downloaded_at TIMESTAMP",
+    "CREATE INDEX IF NOT EXISTS ix_mail_attachments_sha256 ON mail_attachments (sha256)",
+
+    # Метаданные из XML вложений ФНС
+    "ALTER TABLE mail_documents ADD COLUMN IF NOT EXISTS knd_code VARCHAR(10)",
+    "ALTER TABLE mail_documents ADD COLUMN IF NOT EXISTS tax_office_code VARCHAR(4)",
+    "ALTER TABLE mail_documents ADD COLUMN IF NOT EXISTS response_deadline DATE",
+    "ALTER TABLE mail_documents ADD COLUMN IF NOT EXISTS metadata_extracted_at TIMESTAMP",
+    "CREATE INDEX IF NOT EXISTS ix_mail_documents_knd_code ON mail_documents (knd_code)",
+    "CREATE INDEX IF NOT EXISTS ix_mail_documents_tax_office_code ON mail_documents (tax_office_code)",
+    "CREATE INDEX IF NOT EXISTS ix_mail_documents_response_deadline ON mail_documents (response_deadline)",
+
+    # Несколько учетных записей СБИС: документы принадлежат учетной записи,
+    # external_id уникален в ее пределах. Учетная запись по умолчанию
+    # создается из SBIS_LOGIN/SBIS_PASSWORD перед миграциями.
+    "ALTER TABLE mail_documents ADD COLUMN IF NOT EXISTS account_id INTEGER REFERENCES sbis_accounts (id)",
+    "CREATE INDEX IF NOT EXISTS ix_mail_documents_account_id ON mail_documents (account_id)",
+    """
+    UPDATE mail_documents SET account_id = (SELECT id FROM sbis_accounts WHERE is_default ORDER BY id LIMIT 1)
+    WHERE account_id IS NULL
+    """,
+    "DROP INDEX IF EXISTS ix_mail_documents_external_id",
+    "CREATE INDEX IF NOT EXISTS ix_mail_documents_external_id ON mail_documents (external_id)",
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_mail_documents_account_external_id
+    ON mail_documents (account_id, external_id)
+    """,
+    "ALTER TABLE processing_logs ADD COLUMN IF NOT EXISTS account_id INTEGER REFERENCES sbis_accounts (id)",
+    "CREATE INDEX IF NOT EXISTS ix_processing_logs_account_id ON processing_logs (account_id)",
+    "ALTER TABLE quarantined_documents ADD COLUMN IF NOT EXISTS account_id INTEGER REFERENCES sbis_accounts (id)",
+    "CREATE INDEX IF NOT EXISTS ix_quarantined_documents_account_id ON quarantined_documents (account_id)",
+    """
+    UPDATE quarantined_documents SET account_id = (payload->>'account_id')::integer
+    WHERE account_id IS NULL AND payload->>'account_id' IS NOT NULL
+    """,
+    "ALTER TABLE ingestion_checkpoints ADD COLUMN IF NOT EXISTS account_id INTEGER REFERENCES sbis_accounts (id)",
+    "DROP INDEX IF EXISTS ix_ingestion_checkpoints_task_id",
+    "CREATE INDEX IF NOT EXISTS ix_ingestion_checkpoints_task_id ON ingestion_checkpoints (task_id)",
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_ingestion_checkpoints_task_account
+    ON ingestion_checkpoints (task_id, account_id)
+    """,
+    # Показатели запусков для /logs/performance
+    "ALTER TABLE processing_logs ADD COLUMN IF NOT EXISTS task_name VARCHAR(100)",
+    "ALTER TABLE processing_logs ADD COLUMN IF NOT EXISTS started_at TIMESTAMP",
+    "ALTER TABLE processing_logs ADD COLUMN IF NOT EXISTS finished_at TIMESTAMP",
+    "ALTER TABLE processing_logs ADD COLUMN IF NOT EXISTS duration_seconds DOUBLE PRECISION",
+    "ALTER TABLE processing_logs ADD COLUMN IF NOT EXISTS stage_durations JSON",
+    "ALTER TABLE processing_logs ADD COLUMN IF NOT EXISTS sbis_bytes_received BIGINT DEFAULT 0",
+    "ALTER TABLE processing_logs ADD COLUMN IF NOT EXISTS rows_inserted INTEGER DEFAULT 0",
+    "ALTER TABLE processing_logs ADD COLUMN IF NOT EXISTS rows_updated INTEGER DEFAULT 0",
+    "ALTER TABLE processing_logs ADD COLUMN IF NOT EXISTS rows_skipped INTEGER DEFAULT 0",
+    "ALTER TABLE processing_logs ADD COLUMN IF NOT EXISTS peak_rss_kb INTEGER",
+    "ALTER TABLE processing_logs ADD COLUMN IF NOT EXISTS retry_count INTEGER DEFAULT 0",
+    "CREATE INDEX IF NOT EXISTS ix_processing_logs_task_name ON processing_logs (task_name)",
+    "CREATE INDEX IF NOT EXISTS ix_processing_logs_started_at ON processing_logs (started_at)",
+
+    # Пароли учетных записей хранятся зашифрованными (Fernet, длиннее 255)
+    "ALTER TABLE sbis_accounts ALTER COLUMN password TYPE TEXT",
+]
+
+
+def migrate():
+    """Применяет все миграции по порядку"""
+
+    engine = create_engine(settings.DATABASE_URL)
+
+    try:
+        # Новые таблицы создаются как обычно
+        models.Base.metadata.create_all(bind=engine)
+
+        # Учетная запись по умолчанию нужна для переноса существующих документов
+        with Session(engine) as db:
+            account_service.ensure_default_account(db)
+
+        with engine.connect() as conn:
+            for statement in MIGRATIONS:
+                logger.info(f"Миграция: {' '.join(statement.split())[:100]}")
+                conn.execute(text(statement))
+
+            conn.commit()
+            logger.info("Схема базы данных обновлена")
+
+        # Пароли, записанные открытым текстом, шифруются (нужен ACCOUNT_SECRET_KEY)
+        with Session(engine) as db:
+            if settings.ACCOUNT_SECRET_KEY:
+                encrypted = account_service.encrypt_stored_passwords(db)
+                logger.info(f"Зашифровано паролей учетных записей: {encrypted}")
+            else:
+                logger.warning("ACCOUNT_SECRET_KEY не задан, пароли учетных записей не зашифрованы")
+
+    except Exception as e:
+        logger.error(f"Ошибка миграции базы данных: {e}")
+        raise
+
+
+if __name__ == "__main__":
+    logger.info("Запуск миграции базы данных")
+    migrate()
+    logger.info("Скрипт завершен")
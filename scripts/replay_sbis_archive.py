@@ -0,0 +1,36 @@
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app.services.sbis_archive import sbis_archive
+
+
+def replay_archive():
+    """Повторная обработка архива ответов СБИС без обращения к сети"""
+    parser = argparse.ArgumentParser(description="Повторная обработка архива ответов СБИС")
+    parser.add_argument("--account-id", type=int, help="учетная запись (без нее - SBIS_LOGIN)")
+    parser.add_argument("--date-from", type=date.fromisoformat, default=date.today() - timedelta(days=30))
+    parser.add_argument("--date-to", type=date.fromisoformat, default=date.today())
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        result = sbis_archive.replay(db, args.account_id, args.date_from, args.date_to)
+        elapsed = time.perf_counter() - started
+        rate = result["total_documents"] / elapsed if elapsed > 0 else 0
+        print(
+            f"Разделов: {result['partitions']}, страниц: {result['pages']}, "
+            f"документов: {result['total_documents']} (новых {result['new_documents']}, "
+            f"от ФНС {result['fns_documents']}) за {elapsed:.1f} с, {rate:.0f} док/с"
+        )
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    replay_archive()
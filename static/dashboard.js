@@ -2,12 +2,19 @@
 const API_BASE = '/api/v1';
 
 // Утилиты
+const HTML_ESCAPES = { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' };
+
+// Данные с сервера (темы писем, имена файлов, отправители) - только через escapeHtml
+function escapeHtml(value) {
+    return String(value ?? '').replace(/[&<>"']/g, ch => HTML_ESCAPES[ch]);
+}
+
 function showError(element, message) {
     if (!element) {
         console.error("Элемент для отображения ошибки не найден");
         return;
     }
-    element.innerHTML = `<div class="error">Ошибка: ${message}</div>`;
+    element.innerHTML = `<div class="error">Ошибка: ${escapeHtml(message)}</div>`;
 }
 
 function showLoading(element, message = 'Загрузка...') {
@@ -81,7 +88,7 @@ async function testSbis() {
     showLoading(sbisContent, 'Проверка подключения...');
 
     try {
-        const response = await fetch(`${API_BASE}/test-sbis`);
+        const response = await fetch(`${API_BASE}/test-sbis?refresh=true`);
         if (!response.ok) {
             throw new Error(`HTTP ${response.status}`);
         }
@@ -95,12 +102,12 @@ async function testSbis() {
                     <span class="status-active">Подключение работает</span>
                 </div>
                 <div class="status-item">
-                    <span>Найдено документов:</span>
-                    <span>${data.documents_found || 0}</span>
+                    <span>Время ответа:</span>
+                    <span>${data.probe.latency_ms} мс</span>
                 </div>
                 <div class="status-item">
                     <span>Время проверки:</span>
-                    <span>${new Date().toLocaleString()}</span>
+                    <span>${new Date(data.probe.at * 1000).toLocaleString()}</span>
                 </div>
             `;
         } else {
@@ -109,7 +116,7 @@ async function testSbis() {
                     <span>Статус:</span>
                     <span class="status-inactive">Ошибка подключения</span>
                 </div>
-                <div class="error">${data.message || 'Неизвестная ошибка'}</div>
+                <div class="error">${escapeHtml(data.message || 'Неизвестная ошибка')}</div>
             `;
         }
     } catch (error) {
@@ -160,6 +167,13 @@ async function checkNow() {
                     <span>${data.result?.total_processed || 0}</span>
                 </div>
             `;
+        } else if (data.status === 'scheduled') {
+            checkContent.innerHTML = `
+                <div class="status-item">
+                    <span>Проверка продолжается в фоне:</span>
+                    <span>${escapeHtml(data.task_id)}</span>
+                </div>
+            `;
         } else {
             showError(checkContent, data.detail || data.message || 'Неизвестная ошибка');
         }
@@ -171,6 +185,21 @@ async function checkNow() {
     }
 }
 
+// Карточка документа
+function renderDocument(doc) {
+    return `
+            <div class="document-item ${doc.is_from_fns ? 'document-fns' : 'document-regular'}">
+                <div class="document-header">${escapeHtml(doc.subject || 'Без темы')}</div>
+                <div class="document-meta">
+                    Дата: ${doc.date ? new Date(doc.date).toLocaleDateString() : 'Не указана'} |
+                    ИНН: ${escapeHtml(doc.sender_inn || 'Не указан')} |
+                    ${doc.is_from_fns ? 'ФНС' : 'Обычный'}
+                </div>
+                <div class="document-meta">Файл: ${escapeHtml(doc.filename || 'Не указан')}</div>
+            </div>
+        `;
+}
+
 // Получение документов
 async function getDocuments() {
     const daysBackInput = document.getElementById('days-back');
@@ -213,17 +242,7 @@ async function getDocuments() {
             return;
         }
 
-        docsList.innerHTML = documents.map(doc => `
-            <div class="document-item ${doc.is_from_fns ? 'document-fns' : 'document-regular'}">
-                <div class="document-header">${doc.subject || 'Без темы'}</div>
-                <div class="document-meta">
-                    Дата: ${doc.date ? new Date(doc.date).toLocaleDateString() : 'Не указана'} |
-                    ИНН: ${doc.sender_inn || 'Не указан'} |
-                    ${doc.is_from_fns ? 'ФНС' : 'Обычный'}
-                </div>
-                <div class="document-meta">Файл: ${doc.filename || 'Не указан'}</div>
-            </div>
-        `).join('');
+        docsList.innerHTML = documents.map(renderDocument).join('');
 
     } catch (error) {
         showError(docsList, error.message);
@@ -275,4 +294,72 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Автоматически загружаем статус при открытии
     setTimeout(checkStatus, 100);
-});
\ No newline at end of file
+
+    subscribeEvents();
+});
+
+// Поток событий: новые документы и прогресс загрузки без опроса сервера
+const EVENTS_MAX_ERRORS = 5;
+const FALLBACK_POLL_MS = 60000;
+
+function subscribeEvents() {
+    if (!window.EventSource) {
+        setInterval(checkStatus, FALLBACK_POLL_MS);
+        return;
+    }
+
+    const source = new EventSource(`${API_BASE}/events/stream`);
+    let errors = 0;
+
+    source.onopen = () => { errors = 0; };
+    source.onerror = () => {
+        // EventSource переподключается сам; при постоянных ошибках - опрос статуса
+        errors += 1;
+        if (errors >= EVENTS_MAX_ERRORS) {
+            console.warn('Поток событий недоступен, переходим на опрос статуса');
+            source.close();
+            setInterval(checkStatus, FALLBACK_POLL_MS);
+        }
+    };
+
+    source.addEventListener('documents', (event) => {
+        const { documents } = JSON.parse(event.data).data;
+        const docsList = document.getElementById('documents-list');
+        const docsCount = document.getElementById('docs-count');
+        const fnsOnly = document.getElementById('fns-only').checked;
+
+        const shown = documents.filter(doc => !fnsOnly || doc.is_from_fns);
+        if (shown.length === 0) return;
+
+        if (!docsList.querySelector('.document-item')) {
+            docsList.innerHTML = '';
+        }
+        docsList.insertAdjacentHTML('afterbegin', shown.map(renderDocument).join(''));
+        docsCount.textContent = docsList.querySelectorAll('.document-item').length;
+    });
+
+    source.addEventListener('task_progress', (event) => {
+        const { data } = JSON.parse(event.data);
+        document.getElementById('check-content').innerHTML = `
+            <div class="status-item">
+                <span>${escapeHtml(data.status)}</span>
+                <span>${escapeHtml(data.progress)}%</span>
+            </div>
+            <div class="status-item">
+                <span>Новых документов:</span>
+                <span>${data.new_documents}</span>
+            </div>
+        `;
+    });
+
+    source.addEventListener('task_finished', (event) => {
+        const { data } = JSON.parse(event.data);
+        document.getElementById('check-content').innerHTML = `
+            <div class="success">
+                Загрузка завершена: ${data.total_documents} документов,
+                ${data.fns_documents} от ФНС, новых: ${data.new_documents}
+            </div>
+        `;
+        checkStatus();
+    });
+}
\ No newline at end of file